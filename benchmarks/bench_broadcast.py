@@ -0,0 +1,66 @@
+"""Рассылка событий стены тысячам подписчиков SSE.
+
+    python -m benchmarks.bench_broadcast --clients 1000 5000 10000
+
+Для каждого числа клиентов подписывает столько же читателей на
+webapp.events.Broadcaster, публикует события и меряет время самого
+publish() и время, пока событие дойдёт до последнего подписчика.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from webapp.events import LIKES_CHANGED, Broadcaster
+
+
+async def _reader(queue: asyncio.Queue, expected: int, counter: dict, done: asyncio.Event):
+    for _ in range(expected):
+        await queue.get()
+        counter["received"] += 1
+        if counter["received"] == counter["target"]:
+            done.set()
+
+
+async def run_once(clients: int, events: int, queue_size: int):
+    broadcaster = Broadcaster(queue_size)
+    counter = {"received": 0, "target": 0}
+    readers = []
+    done = asyncio.Event()
+    for _ in range(clients):
+        readers.append(asyncio.create_task(_reader(broadcaster.subscribe(), events, counter, done)))
+    await asyncio.sleep(0)
+
+    publish_ms, fanout_ms = [], []
+    for i in range(events):
+        done.clear()
+        counter["target"] = clients * (i + 1)
+        started = time.perf_counter()
+        broadcaster.publish({"type": LIKES_CHANGED, "photo_id": f"{i:024x}", "likes": i})
+        published = time.perf_counter()
+        await done.wait()
+        finished = time.perf_counter()
+        publish_ms.append((published - started) * 1000)
+        fanout_ms.append((finished - started) * 1000)
+
+    await asyncio.gather(*readers)
+    dropped = clients - len(broadcaster)
+    print(
+        f"{clients:>6} клиентов: publish p50={statistics.median(publish_ms):7.2f}ms "
+        f"max={max(publish_ms):7.2f}ms | доставка всем p50={statistics.median(fanout_ms):7.2f}ms "
+        f"max={max(fanout_ms):7.2f}ms | отключено медленных: {dropped}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--queue-size", type=int, default=100)
+    args = parser.parse_args()
+    for clients in args.clients:
+        asyncio.run(run_once(clients, args.events, args.queue_size))
+
+
+if __name__ == "__main__":
+    main()
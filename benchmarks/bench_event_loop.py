@@ -0,0 +1,110 @@
+"""Задержка /health, пока в соседнем запросе идёт медленный запрос к базе.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_event_loop
+    python -m benchmarks.bench_event_loop --inline   # старое поведение, pymongo прямо в event loop
+
+Вместо MongoDB подставляется заглушка, у которой ``find`` спит ``--slow`` секунд,
+поэтому реальная база не нужна.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+import database
+import database.aio
+import webapp.cache
+import webapp.main as webapp_main
+
+
+class _SlowCollection:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def find(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return []
+
+
+class _EmptyCollection:
+    def find_one(self, *args, **kwargs):
+        return None
+
+
+class _SlowDB:
+    def __init__(self, delay):
+        self.photos = _SlowCollection(delay)
+        # Версию стены читает кэш ответов (webapp.cache)
+        self.wall_stats = _EmptyCollection()
+
+
+async def _inline_run_db(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def _probe_health(client, count, interval):
+    # Задержка считается от запланированного момента отправки, а не от
+    # фактического: иначе заблокированный event loop просто сдвигает пробы
+    latencies = []
+    start = time.perf_counter()
+    for i in range(count):
+        scheduled = start + i * interval
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        response = await client.get("/health")
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+    return latencies
+
+
+async def _slow_scans(client, count):
+    # Разные адреса - разные ключи кэша ответов: иначе он склеит запросы
+    # в одно чтение базы
+    await asyncio.gather(*(client.get(f"/api/photos?scan={i}") for i in range(count)))
+
+
+async def run(args):
+    database.db = _SlowDB(args.slow)
+    if args.inline:
+        # run_db импортирован по имени в каждый модуль - подменяем везде,
+        # откуда его зовёт путь /api/photos
+        for module in (database.aio, webapp_main, webapp.cache):
+            module.run_db = _inline_run_db
+
+    transport = httpx.ASGITransport(app=webapp_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle = await _probe_health(client, args.probes, args.interval)
+
+        scans = asyncio.create_task(_slow_scans(client, args.scans))
+        await asyncio.sleep(0)
+        loaded = await _probe_health(client, args.probes, args.interval)
+        await scans
+
+    for name, latencies in (("idle", idle), ("slow query running", loaded)):
+        print(
+            f"{name:>20}: p50={statistics.median(latencies):7.2f}ms "
+            f"p99={_percentile(latencies, 99):7.2f}ms max={max(latencies):7.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slow", type=float, default=0.5, help="длительность медленного запроса, сек")
+    parser.add_argument("--scans", type=int, default=4, help="сколько медленных /api/photos запустить")
+    parser.add_argument("--probes", type=int, default=200, help="сколько запросов /health измерить")
+    parser.add_argument("--interval", type=float, default=0.005, help="пауза между пробами, сек")
+    parser.add_argument("--inline", action="store_true", help="вызывать pymongo прямо в event loop")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
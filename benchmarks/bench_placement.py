@@ -0,0 +1,109 @@
+"""Размещение 100k фото на стене.
+
+    python -m benchmarks.bench_placement
+    python -m benchmarks.bench_placement --photos 100000 --naive 5000
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.bench_placement --mongo 20000 --threads 16
+
+В памяти сравнивает database.placement.SlotAllocator (куча + счётчик) с
+наивным поиском: перебрать все занятые позиции и взять первую свободную
+точку сетки. Затем удаляет случайные 10% фото и размещает столько же
+заново - освободившиеся слоты должны уйти в первую очередь.
+
+С --mongo ещё и гоняет атомарный allocate() по настоящей MongoDB из
+нескольких потоков (во временной базе graffiti_wall_placement) и
+проверяет, что ни один слот не выдан дважды.
+"""
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import MongoClient
+
+from config import config
+from database import placement
+
+
+def bench_allocator(count: int):
+    allocator = placement.SlotAllocator()
+    started = time.perf_counter()
+    slots = [allocator.allocate() for _ in range(count)]
+    elapsed = time.perf_counter() - started
+    print(f"SlotAllocator: {count} фото за {elapsed * 1000:.0f}мс ({elapsed / count * 1e6:.2f}мкс на фото)")
+
+    removed = random.sample(slots, count // 10)
+    for slot in removed:
+        allocator.release(slot)
+    started = time.perf_counter()
+    refilled = [allocator.allocate() for _ in removed]
+    elapsed = time.perf_counter() - started
+    reused = sorted(refilled) == sorted(removed)
+    print(
+        f"  удалено и заново размещено {len(removed)}: {elapsed / len(removed) * 1e6:.2f}мкс на фото, "
+        f"{'все дырки заняты' if reused else 'дырки остались!'}, стена {placement.wall_size(allocator.next)}px"
+    )
+    return reused
+
+
+def bench_naive(count: int):
+    # Старый подход без индекса: для каждого фото пройти все занятые точки
+    taken = []
+    started = time.perf_counter()
+    for _ in range(count):
+        occupied = set(taken)
+        slot = 0
+        while placement.slot_position(slot) in occupied:
+            slot += 1
+        taken.append(placement.slot_position(slot))
+    elapsed = time.perf_counter() - started
+    print(f"Перебор занятых: {count} фото за {elapsed * 1000:.0f}мс ({elapsed / count * 1e6:.2f}мкс на фото)")
+
+
+def bench_mongo(url: str, count: int, threads: int):
+    client = MongoClient(url, maxPoolSize=threads)
+    db = client.graffiti_wall_placement
+    client.drop_database(db.name)
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            slots = list(pool.map(lambda _: placement.allocate(db), range(count)))
+        elapsed = time.perf_counter() - started
+        unique = len(set(slots)) == count and set(slots) == set(range(count))
+        print(
+            f"MongoDB allocate(): {count} слотов в {threads} потоков за {elapsed:.2f}с "
+            f"({count / elapsed:.0f}/с) - {'без повторов' if unique else 'ЕСТЬ ПОВТОРЫ!'}"
+        )
+
+        removed = random.sample(slots, count // 10)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda slot: placement.release(db, slot), removed))
+            refilled = list(pool.map(lambda _: placement.allocate(db), removed))
+        reused = sorted(refilled) == sorted(removed)
+        print(f"  освобождено и занято заново {len(removed)}: {'все дырки заняты' if reused else 'дырки остались!'}")
+        return unique and reused
+    finally:
+        client.drop_database(db.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photos", type=int, default=100000)
+    parser.add_argument("--naive", type=int, default=5000, help="сколько фото разместить перебором (0 - пропустить)")
+    parser.add_argument("--mongo", type=int, default=0, help="сколько слотов выдать в MongoDB (0 - пропустить)")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--url", default=config.MONGODB_URL)
+    args = parser.parse_args()
+
+    ok = bench_allocator(args.photos)
+    if args.naive:
+        bench_naive(args.naive)
+    if args.mongo:
+        if not args.url:
+            sys.exit("❌ Для --mongo нужен MONGODB_URL или --url")
+        ok = bench_mongo(args.url, args.mongo, args.threads) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Сериализация и сжатие ответа /api/photos на 1k, 10k и 100k фото.
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --photos 1000 10000 --repeat 3
+
+Сравнивает путь FastAPI по умолчанию (jsonable_encoder + json.dumps),
+stdlib json с default для BSON и webapp.serialization.dumps (orjson, если
+установлен). Для сжатия печатает размер на проводе и время gzip/brotli
+с уровнями из config. Документы похожи на то, что отдаёт prepare_photo.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from config import config
+from webapp import compression, serialization
+
+
+def make_photos(count: int) -> list:
+    started = datetime(2024, 1, 1)
+    photos = []
+    for i in range(count):
+        oid = ObjectId()
+        photos.append({
+            "_id": oid,
+            "user_id": random.randrange(10 ** 9),
+            "username": f"user{i % 5000}",
+            "position": {"x": random.randrange(20000), "y": random.randrange(20000)},
+            "cell": f"{random.randrange(40)}:{random.randrange(40)}",
+            "likes": random.randrange(200),
+            "created_at": started + timedelta(seconds=i * 37),
+            "blob_key": f"{random.getrandbits(256):064x}",
+            "thumbs": {str(size): f"{random.getrandbits(256):064x}" for size in (64, 150, 400)},
+            "image_url": f"/api/photo/{oid}",
+        })
+    return photos
+
+
+def _fastapi_default(photos):
+    return json.dumps(jsonable_encoder(photos, custom_encoder={ObjectId: str})).encode()
+
+
+def _stdlib(photos):
+    return json.dumps(photos, default=serialization._default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _best_ms(func, arg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run_once(count: int, repeat: int):
+    photos = make_photos(count)
+    serializer = "orjson" if serialization.orjson is not None else "json"
+    print(f"--- {count} фото ---")
+    for name, func in (
+        ("jsonable_encoder+json", _fastapi_default),
+        ("json + default", _stdlib),
+        (f"serialization.dumps ({serializer})", serialization.dumps),
+    ):
+        print(f"  {name:<32} {_best_ms(func, photos, repeat):9.1f}ms")
+
+    body = serialization.dumps(photos)
+    print(f"  {'без сжатия':<32} {len(body) / 1024:9.0f}KiB")
+    for encoding in compression.ENCODINGS:
+        level = config.BROTLI_QUALITY if encoding == compression.BROTLI else config.GZIP_LEVEL
+        elapsed = _best_ms(lambda data: compression.compress(data, encoding), body, repeat)
+        size = len(compression.compress(body, encoding))
+        print(
+            f"  {encoding + ' (уровень ' + str(level) + ')':<32} {size / 1024:9.0f}KiB "
+            f"({size / len(body):.0%}) за {elapsed:.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for count in args.photos:
+        run_once(count, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
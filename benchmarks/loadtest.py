@@ -0,0 +1,415 @@
+"""Нагрузочный прогон API стены на синтетических данных.
+
+    python -m benchmarks.loadtest                                # 1k/10k/100k, mongod из PATH
+    python -m benchmarks.loadtest --sizes 1000 10000 --concurrency 64 --requests 5000
+    python -m benchmarks.loadtest --url mongodb://localhost:27017
+    python -m benchmarks.loadtest --fake --sizes 1000            # mongomock, без mongod
+    python -m benchmarks.loadtest --compare benchmarks/results/loadtest-1a2b3c4.json
+
+База: отдельная graffiti_wall_loadtest на --url, временный mongod
+(--mongod, по умолчанию из PATH) с пустой папкой данных или --fake -
+mongomock в памяти (pip install mongomock; он медленный и не
+потокобезопасный, годится проверить сам прогон, но не для цифр). Для
+каждого размера стены база заполняется заново: фото по слотам
+placement, счётчики, лидерборд, несколько настоящих картинок с превью
+в блобах (локальная папка или --gridfs).
+
+Эндпоинты по очереди обстреливаются через ASGI (без сети и uvicorn) с
+--concurrency параллельными клиентами; ограничения частоты отключены
+(все запросы идут с одного адреса), если не указан --keep-limits, а
+сброс нагрузки остаётся - его 503 видны в статусах. Результат - JSON
+с пропускной способностью и p50/p95/p99 по каждому эндпоинту, по
+умолчанию benchmarks/results/loadtest-<коммит>.json. С --compare
+печатает разницу с прошлым прогоном и завершается с кодом 1, если p95
+или пропускная способность ухудшились больше --threshold.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+from PIL import Image
+from pymongo import MongoClient
+
+from config import config
+
+DB_NAME = "graffiti_wall_loadtest"
+ENDPOINTS = ("photos", "photos_viewport", "photos_page", "stats", "top_users", "like", "photo")
+VIEWPORT = (1280, 800)  # Экран, который смотрит клиент
+WALL_COLLECTIONS = ("photos", "likes", "user_stats", "wall_stats", "placement", "free_slots", "wall_changes")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def random_jpeg(rng: random.Random) -> bytes:
+    noise = Image.frombytes("RGB", (16, 12), rng.randbytes(16 * 12 * 3)).resize((800, 600))
+    out = io.BytesIO()
+    noise.save(out, "JPEG", quality=80)
+    return out.getvalue()
+
+
+@contextlib.contextmanager
+def local_mongod(binary: str):
+    """Временный mongod на свободном порту, после прогона папка данных удаляется."""
+    dbpath = tempfile.mkdtemp(prefix="loadtest-mongod-")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL,
+    )
+    client = MongoClient("127.0.0.1", port, serverSelectionTimeoutMS=30000)
+    try:
+        client.admin.command("ping")
+        yield client
+    finally:
+        client.close()
+        process.terminate()
+        process.wait(timeout=30)
+        shutil.rmtree(dbpath, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def open_client(args):
+    """(клиент, название стенда)."""
+    if args.fake:
+        import mongomock
+        yield mongomock.MongoClient(), "mongomock"
+    elif args.url:
+        client = MongoClient(args.url, serverSelectionTimeoutMS=5000)
+        try:
+            yield client, "url"
+        finally:
+            client.close()
+    else:
+        binary = args.mongod or shutil.which("mongod")
+        if not binary:
+            sys.exit("❌ mongod не найден: укажите --mongod, --url или --fake")
+        with local_mongod(binary) as client:
+            yield client, "mongod"
+
+
+def seed_images(store, count: int, rng: random.Random) -> list:
+    """Кладёт count картинок с превью в хранилище, возвращает поля blob_key/thumbs."""
+    from database import thumbnails
+
+    images = []
+    for _ in range(count):
+        normalized, thumbs, _ = thumbnails.prepare_upload(random_jpeg(rng), config.INGEST_MAX_SIDE)
+        images.append({"blob_key": store.put(normalized), "thumbs": thumbnails.store_thumbnails(store, thumbs)})
+    return images
+
+
+def seed_wall(db, size: int, images: list, rng: random.Random) -> list:
+    """Стена из size готовых фото; возвращает их _id строками."""
+    from database import bootstrap, changelog, counters, placement, status
+
+    # Версия продолжает прошлую стену: кэш ответов не отдаст её страницы
+    version = counters.read_version(db) + 1
+    for name in WALL_COLLECTIONS:
+        db.drop_collection(name)
+
+    users = max(10, size // 20)
+    created = datetime.utcnow() - timedelta(days=30)
+    per_user = {}
+    batch = []
+    for slot in range(size):
+        user_id = 1_000_000 + min(int(rng.paretovariate(1.2)) - 1, users - 1)
+        photo_likes = int(rng.expovariate(0.2))
+        doc = {
+            "user_id": user_id,
+            "username": f"user{user_id}",
+            "likes": photo_likes,
+            "created_at": created + timedelta(seconds=slot),
+            "status": status.READY,
+            **rng.choice(images),
+            **placement.placement_fields(slot),
+        }
+        batch.append(doc)
+        row = per_user.setdefault(user_id, {"username": doc["username"], "total_photos": 0, "total_likes": 0})
+        row["total_photos"] += 1
+        row["total_likes"] += photo_likes
+        if len(batch) == 10_000:
+            db.photos.insert_many(batch)
+            batch = []
+    if batch:
+        db.photos.insert_many(batch)
+
+    # Счётчики в том виде, в каком их держит database.counters
+    db.user_stats.insert_many([
+        {"_id": user_id, **row, "avg_likes": row["total_likes"] / row["total_photos"]}
+        for user_id, row in per_user.items()
+    ])
+    db.wall_stats.insert_one({
+        "_id": counters.STATS_ID,
+        "total_photos": size,
+        "total_users": len(per_user),
+        "total_likes": sum(row["total_likes"] for row in per_user.values()),
+        "version": version,
+    })
+    db.placement.insert_one({"_id": placement.STATE_ID, "next": size})
+
+    try:
+        changelog.ensure_collection(db)
+    except NotImplementedError:
+        # mongomock не умеет capped-коллекции, журнал этим прогоном не читается
+        db.create_collection("wall_changes")
+    # Индексы и отметка «можно писать» - как после старта webapp
+    bootstrap.prepare(db)
+
+    return [str(doc["_id"]) for doc in db.photos.find({}, {"_id": 1})]
+
+
+class Wall:
+    """Что нужно генераторам запросов: id фото, размер стены, токены сессий."""
+
+    def __init__(self, photo_ids: list, tokens: list, rng: random.Random):
+        from database import placement
+
+        self.photo_ids = photo_ids
+        self.tokens = tokens
+        self.side = placement.wall_size(len(photo_ids))
+        self.rng = rng
+
+    def viewport(self) -> str:
+        x0 = self.rng.randrange(max(1, self.side - VIEWPORT[0]))
+        y0 = self.rng.randrange(max(1, self.side - VIEWPORT[1]))
+        return f"x0={x0}&y0={y0}&x1={x0 + VIEWPORT[0]}&y1={y0 + VIEWPORT[1]}"
+
+    def request(self, endpoint: str) -> dict:
+        """Аргументы httpx.AsyncClient.request для одного запроса к эндпоинту."""
+        if endpoint == "photos":
+            return {"method": "GET", "url": "/api/photos"}
+        if endpoint == "photos_viewport":
+            return {"method": "GET", "url": f"/api/photos?{self.viewport()}"}
+        if endpoint == "photos_page":
+            return {"method": "GET", "url": f"/api/photos?{self.viewport()}&limit=100"}
+        if endpoint == "stats":
+            return {"method": "GET", "url": "/api/stats"}
+        if endpoint == "top_users":
+            return {"method": "GET", "url": "/api/top_users?limit=10"}
+        if endpoint == "like":
+            return {
+                "method": "POST",
+                "url": "/api/like",
+                "json": {"photo_id": self.rng.choice(self.photo_ids)},
+                "headers": {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"},
+            }
+        if endpoint == "photo":
+            return {"method": "GET", "url": f"/api/photo/{self.rng.choice(self.photo_ids)}?size=150"}
+        raise ValueError(endpoint)
+
+
+def failed(endpoint: str, response: httpx.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    # Ошибки базы эти эндпоинты отдают с кодом 200. Пустой список фото на
+    # заполненной стене тоже ошибка: область внутри неё всегда занята фото
+    if endpoint in ("photos", "photos_viewport"):
+        return not response.json()
+    if endpoint == "photos_page":
+        return not isinstance(response.json(), dict)
+    if endpoint == "like":
+        return not response.json().get("success")
+    if endpoint == "photo":
+        return not response.content
+    return False
+
+
+def percentile(ordered: list, q: float) -> float:
+    """Ближайший ранг: значение, не меньше которого q доля выборки."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, min(len(ordered) - 1, int(round(q * len(ordered))) - 1))]
+
+
+async def run_endpoint(client, wall: Wall, endpoint: str, requests: int, concurrency: int, warmup: int) -> dict:
+    async def send():
+        started = time.perf_counter()
+        response = await client.request(**wall.request(endpoint))
+        return time.perf_counter() - started, response
+
+    for _ in range(warmup):
+        await send()
+
+    latencies = []
+    statuses = Counter()
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            elapsed, response = await send()
+            latencies.append(elapsed)
+            statuses[str(response.status_code)] += 1
+            errors += failed(endpoint, response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": dict(statuses),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(requests / duration, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run_walls(db, images: list, tokens: list, rng: random.Random, args) -> dict:
+    """Все размеры стены в одном цикле событий, как в одном процессе uvicorn."""
+    from webapp.main import app, response_cache
+
+    walls = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        for size in args.sizes:
+            started = time.perf_counter()
+            photo_ids = seed_wall(db, size, images, rng)
+            seeded = time.perf_counter() - started
+            response_cache.invalidate()
+            wall = Wall(photo_ids, tokens, rng)
+            print(f"🧱 Стена {size} фото (заполнена за {seeded:.1f}с), {args.concurrency} клиентов:")
+
+            results = {}
+            for endpoint in args.endpoints:
+                row = await run_endpoint(client, wall, endpoint, args.requests, args.concurrency, args.warmup)
+                results[endpoint] = row
+                print(
+                    f"  {endpoint:<16} {row['throughput_rps']:>8.1f} rps  p50={row['p50_ms']:.1f}мс "
+                    f"p95={row['p95_ms']:.1f}мс p99={row['p99_ms']:.1f}мс  ошибок {row['errors']} {row['statuses']}"
+                )
+            walls[str(size)] = {"seed_s": round(seeded, 2), "wall_side": wall.side, "endpoints": results}
+    return walls
+
+
+def compare(previous: dict, current: dict, threshold: float) -> int:
+    """Печатает разницу прогонов, возвращает число ухудшений."""
+    regressions = 0
+    print(f"Сравнение с {previous['meta']['commit']} ({previous['meta']['date']}):")
+    for size, wall in current["walls"].items():
+        old_wall = previous["walls"].get(size)
+        if old_wall is None:
+            continue
+        for endpoint, row in wall["endpoints"].items():
+            old = old_wall["endpoints"].get(endpoint)
+            if old is None or not old["p95_ms"] or not old["throughput_rps"]:
+                continue
+            p95 = row["p95_ms"] / old["p95_ms"] - 1
+            rps = row["throughput_rps"] / old["throughput_rps"] - 1
+            worse = p95 > threshold or rps < -threshold
+            regressions += worse
+            print(f"  {size:>7} {endpoint:<16} p95 {p95:+.0%}  rps {rps:+.0%}{'  ❌' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="размеры стены")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на эндпоинт")
+    parser.add_argument("--warmup", type=int, default=20, help="запросов перед замером")
+    parser.add_argument("--images", type=int, default=20, help="разных картинок на стене")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора данных")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--url", help="MongoDB, в которой создать база " + DB_NAME)
+    source.add_argument("--mongod", help="путь к mongod для временного сервера")
+    source.add_argument("--fake", action="store_true", help="mongomock в памяти")
+    parser.add_argument("--gridfs", action="store_true", help="картинки в GridFS, а не во временной папке")
+    parser.add_argument("--keep-limits", action="store_true", help="не отключать ограничения частоты")
+    parser.add_argument("--out", help="файл результата (JSON)")
+    parser.add_argument("--compare", help="прошлый результат для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    # Лимиты читаются при импорте webapp.limits, поэтому до импорта приложения
+    if not args.keep_limits:
+        config.RATE_WRITES_PER_IP = config.RATE_LIKES_PER_USER = config.RATE_IMAGES_PER_IP = 1e9
+        config.RATE_WRITES_BURST = config.RATE_LIKES_BURST = config.RATE_IMAGES_BURST = 10**9
+    blob_dir = None
+    if not args.gridfs:
+        blob_dir = tempfile.mkdtemp(prefix="loadtest-blobs-")
+        config.BLOB_BACKEND, config.BLOB_DIR = "local", blob_dir
+
+    import database
+    from database import aio, blobs
+    from webapp import auth
+
+    rng = random.Random(args.seed)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "db_workers": config.DB_MAX_WORKERS,
+            "rate_limits": args.keep_limits,
+            "blobs": "gridfs" if args.gridfs else "local",
+        },
+        "walls": {},
+    }
+
+    try:
+        with open_client(args) as (client, backend):
+            report["meta"]["backend"] = backend
+            client.drop_database(DB_NAME)
+            db = client[DB_NAME]
+            database.db = db
+            try:
+                print(f"🧱 Картинки: {args.images} шт.")
+                images = seed_images(blobs.get_store(), args.images, rng)
+                tokens = [auth.issue_token({"id": 2_000_000 + i, "username": f"liker{i}"})[0] for i in range(200)]
+                report["walls"] = asyncio.run(run_walls(db, images, tokens, rng, args))
+            finally:
+                client.drop_database(DB_NAME)
+    finally:
+        aio.shutdown()
+        if blob_dir:
+            shutil.rmtree(blob_dir, ignore_errors=True)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"loadtest-{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"💾 {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Прогон потока апдейтов Telegram через webhook без сети.
+
+    python -m benchmarks.replay_updates --count 5000 --concurrency 64
+    python -m benchmarks.replay_updates --count 2000 --record updates.jsonl
+    python -m benchmarks.replay_updates --updates updates.jsonl
+
+Апдейты (записанные - по одному JSON Update на строку, или синтетические
+/start и фото) отправляются POST в bot.webhook через ASGI, а бот ходит
+в поддельный Telegram: FakeTelegramSession отвечает на методы API из
+памяти и отдаёт случайные картинки вместо файлов. С MONGODB_URL фото
+проходят весь путь bot.ingest (записи в базу настоящие!), без него
+хендлер отвечает, что база не подключена.
+
+Печатает пропускную способность, задержку ответа webhook и число
+вызовов API по методам.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+from aiogram import Bot, methods, types
+from aiogram.client.session.base import BaseSession
+from fastapi import FastAPI
+from PIL import Image
+
+from bot.main import create_bot
+from bot.webhook import setup_webhook
+from config import config
+from database import bootstrap
+from database.aio import wait_for_db
+
+FAKE_TOKEN = "42:FAKE-TOKEN-FOR-REPLAY"
+BOT_USER = types.User(id=42, is_bot=True, first_name="Graffiti Wall")
+
+
+def random_jpeg() -> bytes:
+    noise = Image.frombytes("L", (32, 24), os.urandom(32 * 24)).resize((640, 480)).convert("RGB")
+    out = io.BytesIO()
+    noise.save(out, "JPEG", quality=80)
+    return out.getvalue()
+
+
+class FakeTelegramSession(BaseSession):
+    """Сессия aiogram, которая отвечает на вызовы API сама."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, methods.GetMe):
+            return BOT_USER
+        if isinstance(method, methods.GetFile):
+            return types.File(file_id=method.file_id, file_unique_id=method.file_id, file_path=f"photos/{method.file_id}.jpg")
+        if isinstance(method, (methods.SendMessage, methods.EditMessageText)):
+            self._message_id += 1
+            return types.Message(
+                message_id=self._message_id,
+                date=datetime.utcnow(),
+                chat=types.Chat(id=method.chat_id, type="private"),
+                from_user=BOT_USER,
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        self.calls["download"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        yield random_jpeg()
+
+    async def close(self):
+        pass
+
+
+def synthetic_updates(count: int, users: int, photo_ratio: float) -> list:
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = 1_000_000 + random.randrange(users)
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+        }
+        if random.random() < photo_ratio:
+            file_id = f"file{update_id}"
+            message["photo"] = [
+                {"file_id": f"{file_id}s", "file_unique_id": f"{file_id}s", "width": 90, "height": 67},
+                {"file_id": file_id, "file_unique_id": file_id, "width": 640, "height": 480},
+            ]
+        else:
+            message["text"] = "/start"
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": 6}]
+        updates.append({"update_id": update_id, "message": message})
+    return updates
+
+
+async def replay(updates: list, concurrency: int, latency: float):
+    session = FakeTelegramSession(latency)
+    app = FastAPI()
+    handler = setup_webhook(app, bot=create_bot(session=session) if config.BOT_TOKEN else Bot(FAKE_TOKEN, session=session), register=False)
+    ingest = handler.dispatcher["ingest"]
+    db = await wait_for_db()
+    if db is not None:
+        # Стартовых хуков у ASGITransport нет - готовим базу сами, как webapp
+        await bootstrap.prepare_until_ready(db)
+        await ingest.start()
+
+    latencies = []
+    pending = iter(updates)
+    transport = httpx.ASGITransport(app=app)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": config.WEBHOOK_SECRET} if config.WEBHOOK_SECRET else {}
+
+    async def sender(client):
+        for update in pending:
+            started = time.perf_counter()
+            response = await client.post(config.WEBHOOK_PATH, json=update, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+        await asyncio.gather(*(sender(client) for _ in range(concurrency)))
+    accepted = time.perf_counter() - started
+    await handler.drain(timeout=600)
+    handled = time.perf_counter() - started
+    if db is not None:
+        await ingest.stop(timeout=600)
+    finished = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{len(updates)} апдейтов, {concurrency} параллельных отправителей, задержка API {latency * 1000:.0f}мс")
+    print(f"  приняты за {accepted:.2f}с, обработаны за {handled:.2f}с ({len(updates) / handled:.0f} апдейтов/с)")
+    if db is not None:
+        print(f"  фото загружены за {finished:.2f}с: {ingest.stats()}")
+    print(
+        f"  ответ webhook p50={statistics.median(latencies) * 1000:.1f}мс "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}мс"
+    )
+    print(f"  обработано {handler.processed}, ошибок {handler.failed}; вызовы API: {dict(session.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", help="файл с записанными апдейтами (JSON Lines)")
+    parser.add_argument("--record", help="сохранить синтетические апдейты в файл")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--photo-ratio", type=float, default=0.3)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка поддельного Telegram, секунды")
+    args = parser.parse_args()
+
+    if args.updates:
+        with open(args.updates) as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = synthetic_updates(args.count, args.users, args.photo_ratio)
+        if args.record:
+            with open(args.record, "w") as f:
+                for update in updates:
+                    f.write(json.dumps(update) + "\n")
+    asyncio.run(replay(updates, args.concurrency, args.latency))
+
+
+if __name__ == "__main__":
+    main()
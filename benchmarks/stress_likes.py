@@ -0,0 +1,71 @@
+"""Стресс-тест переключателя лайков: тысячи параллельных toggle_like.
+
+Нужна настоящая MongoDB (атомарность обеспечивает сервер):
+
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.stress_likes
+
+Работает во временной базе graffiti_wall_stress и удаляет её в конце.
+Проверяет, что likes совпадает с числом документов в db.likes и что лайк
+стоит ровно у тех пользователей, которые переключали его нечётное число раз.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from config import config
+from database.indexes import ensure_indexes
+from database.likes import toggle_like
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=config.MONGODB_URL)
+    parser.add_argument("--toggles", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--photos", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=64)
+    args = parser.parse_args()
+
+    if not args.url:
+        sys.exit("❌ Нужен MONGODB_URL или --url")
+
+    client = MongoClient(args.url, maxPoolSize=args.threads)
+    db = client.graffiti_wall_stress
+    client.drop_database(db.name)
+    try:
+        ensure_indexes(db)
+        photo_ids = [
+            str(db.photos.insert_one({"user_id": 1, "likes": 0}).inserted_id)
+            for _ in range(args.photos)
+        ]
+        plan = [(random.choice(photo_ids), random.randrange(args.users)) for _ in range(args.toggles)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(lambda job: toggle_like(db, *job), plan))
+        elapsed = time.perf_counter() - started
+
+        toggles = Counter(plan)
+        failed = False
+        for photo_id in photo_ids:
+            photo = db.photos.find_one({"_id": ObjectId(photo_id)})
+            liked_by = {like["user_id"] for like in db.likes.find({"photo_id": ObjectId(photo_id)})}
+            expected = {user for (pid, user), n in toggles.items() if pid == photo_id and n % 2}
+            ok = photo["likes"] == len(liked_by) and liked_by == expected
+            failed |= not ok
+            print(f"{'✅' if ok else '❌'} {photo_id}: likes={photo['likes']} в db.likes={len(liked_by)} ожидалось={len(expected)}")
+
+        print(f"{args.toggles} переключений за {elapsed:.2f}с ({args.toggles / elapsed:.0f}/с, {args.threads} потоков)")
+        sys.exit(1 if failed else 0)
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
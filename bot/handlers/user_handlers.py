@@ -1,10 +1,14 @@
-from aiogram import Router, F
+
+from aiogram import Bot, Router, F
 from aiogram.types import Message, WebAppInfo
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from bot.ingest import IngestQueue
+import database
 from config import config
-from database import db
+from database import counters, status
+from database.aio import run_db
 
 router = Router()
 
@@ -27,8 +31,10 @@ def get_main_menu():
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     # Сохраняем пользователя в базу
-    if db:
-        db.users.update_one(
+    db = database.get_db()
+    if db is not None:
+        await run_db(
+            db.users.update_one,
             {'user_id': message.from_user.id},
             {'$set': {
                 'username': message.from_user.username,
@@ -50,30 +56,46 @@ async def cmd_start(message: Message):
 
 
 @router.message(F.photo)
-async def handle_photo(message: Message):
-    if not db:
+async def handle_photo(message: Message, ingest: IngestQueue):
+    db = database.get_db()
+    if db is None:
         await message.answer("❌ База данных не подключена")
         return
 
-    # Сохраняем информацию о фото
+    # Сохраняем информацию о фото; саму картинку скачает bot.ingest,
+    # он же выдаст фото место на стене
     photo_data = {
         'user_id': message.from_user.id,
         'username': message.from_user.username or message.from_user.first_name,
         'telegram_file_id': message.photo[-1].file_id,
-        'position_x': 100,  # Пока фиксированная позиция
-        'position_y': 100,
         'likes': 0,
-        'liked_by': [],
-        'created_at': message.date
+        'status': status.PENDING,
+        'created_at': message.date,
+        # Фото загружает этот процесс, пока продлевает аренду (bot.ingest)
+        **ingest.claim()
     }
 
-    db.photos.insert_one(photo_data)
+    await run_db(db.photos.insert_one, photo_data)
+    if not await ingest.submit(photo_data['_id'], photo_data['telegram_file_id'], message.chat.id):
+        await run_db(db.photos.delete_one, {'_id': photo_data['_id']})
+        await message.answer("⏳ Сейчас загружается слишком много фото. Попробуй отправить ещё раз через минуту")
+        return
+
+    await message.answer("⏳ Фото получено, добавляем на стену...")
 
-    await message.answer(
+
+async def photo_ready(bot: Bot, chat_id: int, photo: dict):
+    stats = await run_db(counters.read_stats, database.get_db())
+    await bot.send_message(
+        chat_id,
         f"✅ <b>Фото добавлено на стену!</b>\n\n"
-        f"👤 Автор: {photo_data['username']}\n"
-        f"📍 Позиция: {photo_data['position_x']}, {photo_data['position_y']}\n"
-        f"📸 Всего фото на стене: {db.photos.count_documents({})}\n\n"
+        f"👤 Автор: {photo.get('username')}\n"
+        f"📍 Позиция: {photo.get('position_x')}, {photo.get('position_y')}\n"
+        f"📸 Всего фото на стене: {stats['total_photos']}\n\n"
         f"<i>Открой галерею чтобы увидеть свою работу!</i>",
         reply_markup=get_main_menu()
-    )
\ No newline at end of file
+    )
+
+
+async def photo_failed(bot: Bot, chat_id: int, reason: str):
+    await bot.send_message(chat_id, f"❌ Не удалось добавить фото: {reason}")
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from pymongo import ReturnDocument
+
+import database
+import metrics
+from config import config
+from database import blobs, changelog, counters, phash, placement, status, thumbnails
+from database.aio import run_db
+
+# Фоновая загрузка фото из бота. Хендлер только кладёт документ pending и
+# задание в очередь, а воркеры скачивают файл из Telegram, проверяют и
+# пережимают его в пуле процессов, пишут в хранилище блобов вместе с
+# превью и переводят фото в ready - только тогда оно попадает в счётчики,
+# журнал изменений и на стену. Очередь ограничена: когда она полна,
+# хендлер ждёт INGEST_ENQUEUE_TIMEOUT и отказывает пользователю.
+#
+# Процессов с очередью может быть несколько (воркеры webapp, экземпляры
+# за балансировщиком). Фото pending арендует процесс, который его принял
+# (claimed_by, claimed_at ставятся при вставке), и продлевает аренду, пока
+# фото у него в очереди или в работе. Раз в INGEST_CLAIM_TTL / 3 каждый
+# процесс забирает фото с истёкшей арендой - упавшего или перезапущенного
+# владельца; забирает ровно один, чей find_one_and_update успел первым.
+# При остановке аренда недоделанных фото снимается сразу
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 1000
+
+# В /metrics - значения IngestMetrics очереди этого процесса
+ingest_queue = metrics.Gauge("bot_ingest_queue", "Фото в очереди загрузки (queued) и в работе (in_progress)", ("state",))
+ingest_photos = metrics.Counter("bot_ingest_photos_total", "Фото по итогу постановки в очередь и загрузки", ("result",))
+ingest_latency = metrics.Gauge("bot_ingest_latency_seconds", "Время от очереди до ready по последним фото", ("quantile",))
+
+
+@dataclass
+class IngestJob:
+    photo_id: object
+    file_id: str
+    chat_id: int = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    # Старое фото из бота без картинки: уже на стене и в счётчиках
+    legacy: bool = False
+
+
+class IngestMetrics:
+    def __init__(self):
+        self.enqueued = 0
+        self.rejected = 0
+        self.ready = 0
+        self.failed = 0
+        self.retries = 0
+        self.in_progress = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # секунды от очереди до ready
+
+    def snapshot(self, queue_depth: int) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3) if latencies else None
+
+        return {
+            "queue_depth": queue_depth,
+            "in_progress": self.in_progress,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "ready": self.ready,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+        }
+
+
+class IngestQueue:
+    def __init__(self, bot: Bot, db=None, on_ready=None, on_failed=None):
+        """``on_ready(bot, chat_id, photo)`` и ``on_failed(bot, chat_id, причина)`` -
+        корутины для ответа пользователю, необязательны. Без ``db`` база
+        берётся из database.get_db() при обращении."""
+        self.bot = bot
+        self._db = db
+        self.on_ready = on_ready
+        self.on_failed = on_failed
+        self.queue = asyncio.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+        self.metrics = IngestMetrics()
+        self._workers = []
+        self._leases = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._owned = set()  # id фото в очереди и в работе, их аренду продлеваем
+        ingest_queue.bind(lambda: {("queued",): self.queue.qsize(), ("in_progress",): self.metrics.in_progress})
+        ingest_photos.bind(lambda: {
+            (result,): getattr(self.metrics, result) for result in ("enqueued", "rejected", "ready", "failed", "retries")
+        })
+        ingest_latency.bind(self._latency_quantiles)
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else database.get_db()
+
+    def stats(self) -> dict:
+        return self.metrics.snapshot(self.queue.qsize())
+
+    def _latency_quantiles(self) -> dict:
+        stats = self.stats()
+        return {("0.5",): stats["latency_p50"], ("0.95",): stats["latency_p95"]}
+
+    def claim(self) -> dict:
+        """Поля аренды для нового фото pending, которое загрузит этот процесс."""
+        return {"claimed_by": self.owner, "claimed_at": datetime.utcnow()}
+
+    async def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(config.INGEST_WORKERS)]
+        await self._recover()
+        self._leases = asyncio.create_task(self._keep_leases())
+
+    async def _recover(self):
+        # Задания живут только в памяти - подбираем фото pending без живого
+        # владельца и старые фото из бота, у которых был только telegram_file_id
+        room = self.queue.maxsize - self.queue.qsize()
+        stale = await run_db(self._claim, {"status": status.PENDING}, room)
+        legacy = await run_db(self._claim, {
+            "telegram_file_id": {"$exists": True}, "blob_key": {"$exists": False}, "status": {"$exists": False},
+        }, room - len(stale))
+        for photos, is_legacy in ((stale, False), (legacy, True)):
+            for photo in photos:
+                self._owned.add(photo["_id"])
+                await self.queue.put(IngestJob(photo["_id"], photo["telegram_file_id"], legacy=is_legacy))
+                self.metrics.enqueued += 1
+        if stale or legacy:
+            logger.info("Ingest: в очередь возвращено %d фото, старых без картинки %d", len(stale), len(legacy))
+
+    def _claim(self, query: dict, limit: int) -> list:
+        """До ``limit`` фото по ``query``, которые этот процесс забрал себе на загрузку."""
+        now = datetime.utcnow()
+        unclaimed = {"$or": [
+            {"claimed_at": {"$exists": False}},
+            {"claimed_at": {"$lt": now - timedelta(seconds=config.INGEST_CLAIM_TTL)}},
+        ]}
+        claimed = []
+        while len(claimed) < limit:
+            photo = self.db.photos.find_one_and_update(
+                {"$and": [query, unclaimed]},
+                {"$set": {"claimed_by": self.owner, "claimed_at": now}},
+                projection={"telegram_file_id": 1},
+            )
+            if photo is None:
+                break
+            claimed.append(photo)
+        return claimed
+
+    def _renew(self, photo_ids: list):
+        self.db.photos.update_many(
+            {"_id": {"$in": photo_ids}, "claimed_by": self.owner},
+            {"$set": {"claimed_at": datetime.utcnow()}},
+        )
+
+    async def _keep_leases(self):
+        while True:
+            await asyncio.sleep(config.INGEST_CLAIM_TTL / 3)
+            try:
+                if self._owned:
+                    await run_db(self._renew, list(self._owned))
+                await self._recover()
+            except Exception:
+                logger.exception("Ingest: аренда фото не продлена")
+
+    async def stop(self, timeout: float = 10):
+        """Даёт воркерам дообработать очередь и останавливает их.
+
+        С недоделанных фото аренда снимается: их сразу заберёт другой процесс.
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Ingest: остановка с %d заданиями в очереди", self.queue.qsize())
+        if self._leases is not None:
+            self._leases.cancel()
+        # Отменённые воркеры убирают свои фото из _owned - запоминаем до отмены
+        unfinished = list(self._owned)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if unfinished:
+            try:
+                await run_db(
+                    self.db.photos.update_many,
+                    {"_id": {"$in": unfinished}, "claimed_by": self.owner},
+                    {"$unset": {"claimed_by": "", "claimed_at": ""}},
+                )
+            except Exception:
+                logger.exception("Ingest: аренда %d фото не снята", len(unfinished))
+
+    async def submit(self, photo_id, file_id: str, chat_id: int = None) -> bool:
+        """Ставит фото в очередь. False - очередь так и не освободилась."""
+        try:
+            await asyncio.wait_for(
+                self.queue.put(IngestJob(photo_id, file_id, chat_id)),
+                config.INGEST_ENQUEUE_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            self.metrics.rejected += 1
+            return False
+        self._owned.add(photo_id)
+        self.metrics.enqueued += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            self.metrics.in_progress += 1
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.exception("Ingest: непредвиденная ошибка для %s", job.photo_id)
+                await self._fail(job, f"внутренняя ошибка: {e}")
+            finally:
+                self._owned.discard(job.photo_id)
+                self.metrics.in_progress -= 1
+                self.queue.task_done()
+
+    async def _process(self, job: IngestJob):
+        loop = asyncio.get_running_loop()
+        while True:
+            job.attempts += 1
+            try:
+                data = (await self.bot.download(job.file_id)).read()
+                normalized, thumbs, value_hash = await loop.run_in_executor(
+                    thumbnails.get_pool(), thumbnails.prepare_upload, data, config.INGEST_MAX_SIDE
+                )
+                photo = await run_db(self._store, job, normalized, thumbs, value_hash)
+                break
+            except ValueError as e:
+                # Битая картинка или отклонённый дубликат - повтор не поможет
+                await self._fail(job, str(e))
+                return
+            except TelegramBadRequest as e:
+                await self._fail(job, f"Telegram не отдал файл: {e.message}")
+                return
+            except Exception as e:
+                if job.attempts > config.INGEST_RETRIES:
+                    await self._fail(job, f"не удалось загрузить после {job.attempts} попыток: {e}")
+                    return
+                delay = config.INGEST_RETRY_DELAY * 2 ** (job.attempts - 1)
+                if isinstance(e, TelegramRetryAfter):
+                    delay = max(delay, e.retry_after)
+                elif not isinstance(e, TelegramNetworkError):
+                    logger.warning("Ingest: попытка %d для %s: %s", job.attempts, job.photo_id, e)
+                self.metrics.retries += 1
+                await asyncio.sleep(delay)
+
+        if photo is None:
+            # Фото удалили, пока оно было в очереди
+            return
+        self.metrics.ready += 1
+        self.metrics.latencies.append(time.monotonic() - job.enqueued_at)
+        await self._notify(self.on_ready, job, photo)
+
+    def _reserve_slot(self, query: dict):
+        """Слот фото: записанный в документ прошлой попыткой или новый.
+
+        None - фото по ``query`` больше нет. Слот в документе переживает
+        повторы загрузки, а удаление фото его освобождает (webapp).
+        """
+        photo = self.db.photos.find_one(query, {"slot": 1})
+        if photo is None:
+            return None
+        if "slot" in photo:
+            return photo["slot"]
+        slot = placement.allocate(self.db)
+        if self.db.photos.update_one({**query, "slot": {"$exists": False}}, {"$set": {"slot": slot}}).modified_count:
+            return slot
+        # Фото удалили или слот ему уже записал другой процесс
+        placement.release(self.db, slot)
+        return self._reserve_slot(query)
+
+    def _store(self, job: IngestJob, data: bytes, thumbs: dict, value_hash: int):
+        if job.legacy:
+            query = {"_id": job.photo_id, "blob_key": {"$exists": False}}
+        else:
+            query = {"_id": job.photo_id, "status": status.PENDING}
+        # Место на стене видно только у готового фото, но выделяется один
+        # раз: повтор после ошибки берёт тот же слот, а не ещё один
+        slot = self._reserve_slot(query)
+        if slot is None:
+            return None
+        update = phash.fields(value_hash)
+        blob_key = blobs.blob_key(data)
+        duplicate, shared = phash.check_duplicate(self.db, value_hash, blob_key)
+        if duplicate is not None:
+            update["duplicate_of"] = duplicate["_id"]
+        if shared:
+            # Почти та же картинка уже на стене - её блоб и превью
+            blob_key = duplicate["blob_key"]
+            thumb_keys = duplicate.get("thumbs") or {}
+        else:
+            store = blobs.get_store()
+            store.put(data)
+            thumb_keys = thumbnails.store_thumbnails(store, thumbs)
+        photo = self.db.photos.find_one_and_update(
+            query,
+            {"$set": {
+                **update,
+                **placement.placement_fields(slot),
+                "status": status.READY,
+                "blob_key": blob_key,
+                "thumbs": thumb_keys,
+                "ready_at": datetime.utcnow(),
+            }},
+            projection={"user_id": 1, "username": 1, "position_x": 1, "position_y": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if photo is None:
+            # Слот освободил тот, кто удалил фото вместе с ним
+            blobs.release(self.db, blob_key, thumb_keys.values())
+            return None
+        phash.duplicates.add(value_hash, job.photo_id)
+        # Старое фото уже посчитано - не добавляем его второй раз
+        if not job.legacy:
+            seq = counters.photo_added(self.db, photo["user_id"], photo.get("username"))
+            changelog.record(self.db, seq, changelog.ADD, job.photo_id)
+        return photo
+
+    async def _fail(self, job: IngestJob, reason: str):
+        self.metrics.failed += 1
+        logger.warning("Ingest: фото %s не загружено: %s", job.photo_id, reason)
+        # Слот, выделенный попыткам загрузки, возвращается в free_slots
+        if job.legacy:
+            query, update = {"_id": job.photo_id, "blob_key": {"$exists": False}}, {}
+        else:
+            query, update = {"_id": job.photo_id, "status": status.PENDING}, {"$set": {"status": status.FAILED, "error": reason}}
+        photo = await run_db(
+            self.db.photos.find_one_and_update,
+            query,
+            {**update, "$unset": {"slot": ""}},
+            projection={"slot": 1},
+        )
+        if photo is not None:
+            await run_db(placement.release, self.db, photo.get("slot"))
+        if job.legacy:
+            return
+        await self._notify(self.on_failed, job, reason)
+
+    async def _notify(self, callback, job: IngestJob, payload):
+        if callback is None or job.chat_id is None:
+            return
+        try:
+            await callback(self.bot, job.chat_id, payload)
+        except Exception as e:
+            logger.warning("Ingest: не удалось ответить в чат %s: %s", job.chat_id, e)
@@ -1,27 +1,73 @@
 import asyncio
 import logging
+
+# Журнал настраиваем до импорта database - он пишет о подключении сразу
+logging.basicConfig(level=logging.INFO)
+
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
+import metrics
 from config import config
-from bot.handlers.user_handlers import router
+from bot.handlers.user_handlers import photo_failed, photo_ready, router
+from bot.ingest import IngestQueue
+from bot.middlewares import HandlerMetrics
+from bot.storage import create_storage
+from database import bootstrap, connect
+from database.aio import run_db, wait_for_db
 
-logging.basicConfig(level=logging.INFO)
+metrics.count_log_errors()
 
 
-async def main():
-    bot = Bot(
+def create_bot(**kwargs) -> Bot:
+    return Bot(
         token=config.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        **kwargs
     )
 
-    dp = Dispatcher(storage=MemoryStorage())
+
+def create_dispatcher(bot: Bot) -> Dispatcher:
+    """Dispatcher с хендлерами и очередью загрузки фото в dp["ingest"].
+
+    Общий для polling и webhook (см. bot.webhook).
+    """
+    dp = Dispatcher(storage=create_storage())
     dp.include_router(router)
+    # Внутренние middleware корневого роутера действуют и на вложенные
+    dp.message.middleware(HandlerMetrics())
+    dp.callback_query.middleware(HandlerMetrics())
+
+    # Очередь загрузки фото; хендлеры получают её аргументом ingest
+    dp["ingest"] = IngestQueue(bot, on_ready=photo_ready, on_failed=photo_failed)
+    return dp
+
+
+async def main():
+    await run_db(connect)
+    bot = create_bot()
+    dp = create_dispatcher(bot)
+    ingest = dp["ingest"]
+    # Клиент базы мог не создаться с первого раза - ждём его, а не
+    # работаем без загрузки фото до перезапуска. Апдейты - только после
+    # подготовки базы: хендлеры пишут в неё (database.bootstrap)
+    db = await wait_for_db()
+    if db is not None:
+        await bootstrap.prepare_until_ready(db)
+        await ingest.start()
+    # Без webapp метрики бота отдаёт свой маленький сервер
+    metrics_server = await metrics.serve(config.METRICS_PORT) if config.METRICS_PORT else None
 
-    await dp.start_polling(bot)
+    try:
+        # Если раньше работал webhook, Telegram не отдаст апдейты в polling
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+    finally:
+        await ingest.stop()
+        if metrics_server is not None:
+            metrics_server.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+import time
+
+from aiogram import BaseMiddleware
+
+import metrics
+
+# Те же метрики, что у HTTP-маршрутов webapp, для хендлеров бота: число
+# вызовов по итогу, время и сколько хендлеров работает сейчас
+handler_calls = metrics.Counter("bot_handler_calls_total", "Вызовы хендлеров бота", ("handler", "status"))
+handler_latency = metrics.Histogram("bot_handler_duration_seconds", "Время работы хендлера бота", ("handler",))
+handler_in_flight = metrics.Gauge("bot_handlers_in_flight", "Хендлеры бота в работе")
+
+
+class HandlerMetrics(BaseMiddleware):
+    """Внутренняя middleware: к этому моменту хендлер уже выбран фильтрами."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        status = "error"
+        handler_in_flight.inc()
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            handler_in_flight.dec()
+            handler_latency.observe(time.perf_counter() - started, handler=name)
+            handler_calls.inc(handler=name, status=status)
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import database
+from config import config
+from database.aio import run_db
+
+# Состояния FSM в MongoDB: один документ на ключ (бот, чат, пользователь)
+# в коллекции db.fsm_states. В отличие от MemoryStorage переживает
+# перезапуск и общий для всех процессов бота за одним балансировщиком
+
+
+class MongoStorage(BaseStorage):
+    def __init__(self, db=None, collection: str = "fsm_states"):
+        """Без ``db`` база берётся из database.get_db() при обращении."""
+        self._db = db
+        self._collection = collection
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    @property
+    def collection(self):
+        db = self._db if self._db is not None else database.get_db()
+        if db is None:
+            raise RuntimeError("DB не подключена")
+        return db[self._collection]
+
+    def _id(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    async def _set(self, key: StorageKey, field: str, value):
+        if value is None:
+            update = {"$unset": {field: ""}, "$set": {"updated_at": datetime.utcnow()}}
+        else:
+            update = {"$set": {field: value, "updated_at": datetime.utcnow()}}
+        await run_db(self.collection.update_one, {"_id": self._id(key)}, update, upsert=True)
+
+    async def _get(self, key: StorageKey, field: str):
+        doc = await run_db(self.collection.find_one, {"_id": self._id(key)}, {field: 1})
+        return (doc or {}).get(field)
+
+    async def set_state(self, key: StorageKey, state=None):
+        await self._set(key, "state", state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey):
+        return await self._get(key, "state")
+
+    async def set_data(self, key: StorageKey, data):
+        await self._set(key, "data", dict(data) or None)
+
+    async def get_data(self, key: StorageKey) -> dict:
+        return dict(await self._get(key, "data") or {})
+
+    async def close(self):
+        pass
+
+
+def create_storage(db=None) -> BaseStorage:
+    """Хранилище FSM по config.FSM_STORAGE; без базы - в памяти."""
+    if config.FSM_STORAGE == "mongo" and (db is not None or config.MONGODB_URL):
+        return MongoStorage(db)
+    return MemoryStorage()
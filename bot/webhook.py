@@ -0,0 +1,121 @@
+import asyncio
+import hmac
+import logging
+
+from aiogram import Bot
+from aiogram.types import Update
+from fastapi import FastAPI, Request, Response
+
+import metrics
+from config import config
+from database import bootstrap
+from database.aio import wait_for_db
+
+# Webhook-режим бота внутри приложения webapp: Telegram шлёт апдейты POST
+# на WEBHOOK_PATH, мы сразу отвечаем 200 и обрабатываем апдейт в фоне.
+# Одновременно обрабатывается не больше WEBHOOK_MAX_CONCURRENCY апдейтов;
+# когда все места заняты, ответ Telegram задерживается - он сам сбавит
+# темп. Состояния FSM лежат в MongoDB (bot.storage), поэтому процессов
+# за балансировщиком может быть несколько
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+webhook_updates = metrics.Counter("bot_webhook_updates_total", "Апдейты Telegram, принятые через webhook", ("result",))
+webhook_in_flight = metrics.Gauge("bot_webhook_updates_in_flight", "Апдейты webhook в обработке")
+
+
+class WebhookHandler:
+    def __init__(self, bot: Bot, dispatcher, max_concurrency: int, register: bool = True):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.register = register
+        self._ingest_start = None
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+        self.processed = 0
+        self.failed = 0
+        webhook_in_flight.bind(lambda: len(self._tasks))
+
+    async def handle(self, request: Request) -> Response:
+        if config.WEBHOOK_SECRET and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), config.WEBHOOK_SECRET
+        ):
+            return Response(status_code=401)
+        # Хендлеры пишут в базу, а её ещё готовит webapp (database.bootstrap):
+        # Telegram повторит апдейт позже
+        if config.MONGODB_URL and not bootstrap.is_ready():
+            return Response(status_code=503, headers={"Retry-After": "5"})
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return Response(status_code=400)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return Response(status_code=200)
+
+    async def _process(self, update: Update):
+        try:
+            await self.dispatcher.feed_update(self.bot, update)
+            self.processed += 1
+            webhook_updates.inc(result="ok")
+        except Exception:
+            self.failed += 1
+            webhook_updates.inc(result="error")
+            logger.exception("Webhook: апдейт %s не обработан", update.update_id)
+        finally:
+            self._slots.release()
+
+    async def drain(self, timeout: float = 10):
+        """Ждёт апдейты, которые ещё обрабатываются."""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    async def _start_ingest(self):
+        # Клиент базы может появиться позже старта - загрузка фото его
+        # дождётся, а потом и подготовки базы в webapp
+        if await wait_for_db() is not None:
+            await bootstrap.wait_ready()
+            await self.dispatcher["ingest"].start()
+
+    async def start(self):
+        """Старт вместе с приложением: хуки бота, setWebhook, загрузка фото."""
+        self._ingest_start = asyncio.create_task(self._start_ingest())
+        await self.dispatcher.emit_startup(bot=self.bot)
+        if self.register:
+            await self.bot.set_webhook(
+                f"{config.WEBHOOK_URL}{config.WEBHOOK_PATH}",
+                secret_token=config.WEBHOOK_SECRET or None,
+                max_connections=min(config.WEBHOOK_MAX_CONCURRENCY, 100),
+                allowed_updates=self.dispatcher.resolve_used_update_types(),
+            )
+
+    async def stop(self):
+        if self._ingest_start is not None:
+            self._ingest_start.cancel()
+        await self.drain()
+        await self.dispatcher["ingest"].stop()
+        await self.dispatcher.emit_shutdown(bot=self.bot)
+        await self.dispatcher.storage.close()
+        await self.bot.session.close()
+
+
+def setup_webhook(app: FastAPI, bot: Bot = None, register: bool = True) -> WebhookHandler:
+    """Подключает webhook к приложению.
+
+    ``bot`` можно подменить (например, сессией без сети для тестов);
+    ``register=False`` не вызывает setWebhook при старте. Запускает и
+    останавливает его lifespan приложения: handler.start() / handler.stop().
+    """
+    from bot.main import create_bot, create_dispatcher
+
+    bot = bot or create_bot()
+    dispatcher = create_dispatcher(bot)
+    handler = WebhookHandler(bot, dispatcher, config.WEBHOOK_MAX_CONCURRENCY, register)
+    app.state.webhook = handler
+
+    app.add_api_route(config.WEBHOOK_PATH, handler.handle, methods=["POST"], include_in_schema=False)
+    return handler
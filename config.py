@@ -6,5 +6,101 @@ class Config:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
     MONGODB_URL: str = os.getenv("MONGODB_URL", "")
     WEBAPP_URL: str = os.getenv("WEBAPP_URL", "")
+    # Бот через webhook в приложении webapp вместо polling (bot/main.py).
+    # Telegram принимает до 100 соединений на webhook
+    BOT_WEBHOOK: bool = os.getenv("BOT_WEBHOOK", "").lower() in ("1", "true", "yes")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", os.getenv("WEBAPP_URL", ""))
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_MAX_CONCURRENCY: int = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "32"))
+    # Вход в мини-приложение: админы через запятую, ключ подписи сессий
+    # (по умолчанию выводится из BOT_TOKEN), срок жизни сессии и initData
+    ADMIN_IDS: tuple = tuple(int(x) for x in os.getenv("ADMIN_IDS", "1790615566").split(",") if x.strip())
+    SESSION_SECRET: str = os.getenv("SESSION_SECRET", "")
+    SESSION_TTL: int = int(os.getenv("SESSION_TTL", str(24 * 3600)))
+    INIT_DATA_MAX_AGE: int = int(os.getenv("INIT_DATA_MAX_AGE", str(24 * 3600)))
+    # Где хранить состояния FSM бота: mongo или memory
+    FSM_STORAGE: str = os.getenv("FSM_STORAGE", "mongo")
+    # Метрики: /metrics в webapp (с METRICS_TOKEN - только с заголовком
+    # Authorization: Bearer <токен>), порт метрик бота в режиме polling
+    # (0 - не поднимать) и порог журнала медленных команд MongoDB, мс
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "100"))
+    # Размер пула потоков для запросов к MongoDB из webapp
+    DB_MAX_WORKERS: int = int(os.getenv("DB_MAX_WORKERS", "16"))
+    # Пул соединений MongoClient (с запасом на потоки пула выше) и таймауты;
+    # DB_SOCKET_TIMEOUT_MS=0 - ждать ответа без ограничения. После неудачного
+    # создания клиента новая попытка не раньше DB_RECONNECT_INTERVAL секунд,
+    # /health/ready ждёт ответа на ping не дольше DB_PING_TIMEOUT секунд
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", str(int(os.getenv("DB_MAX_WORKERS", "16")) + 4)))
+    DB_MIN_POOL_SIZE: int = int(os.getenv("DB_MIN_POOL_SIZE", "1"))
+    DB_CONNECT_TIMEOUT_MS: int = int(os.getenv("DB_CONNECT_TIMEOUT_MS", "5000"))
+    DB_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("DB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    DB_SOCKET_TIMEOUT_MS: int = int(os.getenv("DB_SOCKET_TIMEOUT_MS", "30000"))
+    DB_RECONNECT_INTERVAL: float = float(os.getenv("DB_RECONNECT_INTERVAL", "5"))
+    DB_PING_TIMEOUT: float = float(os.getenv("DB_PING_TIMEOUT", "2"))
+    # Сброс нагрузки: при такой очереди операций к базе запись и картинки
+    # (SHED_WRITES) или и чтения (SHED_READS) сразу получают 503
+    SHED_WRITES_INFLIGHT: int = int(os.getenv("SHED_WRITES_INFLIGHT", str(2 * int(os.getenv("DB_MAX_WORKERS", "16")))))
+    SHED_READS_INFLIGHT: int = int(os.getenv("SHED_READS_INFLIGHT", str(6 * int(os.getenv("DB_MAX_WORKERS", "16")))))
+    # Частота запросов: запросов в секунду и запас (burst) на ключ
+    RATE_WRITES_PER_IP: float = float(os.getenv("RATE_WRITES_PER_IP", "5"))
+    RATE_WRITES_BURST: int = int(os.getenv("RATE_WRITES_BURST", "20"))
+    RATE_LIKES_PER_USER: float = float(os.getenv("RATE_LIKES_PER_USER", "2"))
+    RATE_LIKES_BURST: int = int(os.getenv("RATE_LIKES_BURST", "10"))
+    RATE_IMAGES_PER_IP: float = float(os.getenv("RATE_IMAGES_PER_IP", "50"))
+    RATE_IMAGES_BURST: int = int(os.getenv("RATE_IMAGES_BURST", "200"))
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+    # Хранилище картинок: gridfs (в той же MongoDB) или local (папка BLOB_DIR)
+    BLOB_BACKEND: str = os.getenv("BLOB_BACKEND", "gridfs")
+    BLOB_DIR: str = os.getenv("BLOB_DIR", "blobs")
+    BLOB_CHUNK_SIZE: int = int(os.getenv("BLOB_CHUNK_SIZE", str(256 * 1024)))
+    # Блоб без ссылок удаляется не раньше чем через BLOB_GC_GRACE секунд:
+    # его может как раз загружать другой процесс (database.blobs)
+    BLOB_GC_GRACE: float = float(os.getenv("BLOB_GC_GRACE", "3600"))
+    BLOB_GC_INTERVAL: float = float(os.getenv("BLOB_GC_INTERVAL", "600"))
+    THUMBNAIL_WORKERS: int = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+    # Кэш готовых ответов API: сколько ответов держать и как часто
+    # перечитывать версию стены, чтобы увидеть загрузки через бота
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+    CACHE_VERSION_TTL: float = float(os.getenv("CACHE_VERSION_TTL", "2"))
+    # Общий кэш воркеров в памяти (webapp.shared_cache): по умолчанию
+    # включён, если uvicorn запущен с несколькими воркерами (WEB_CONCURRENCY).
+    # Файл (пусто - /dev/shm), объём на два снимка стены и как часто
+    # ведущий воркер сверяет версию стены
+    SHARED_CACHE: bool = os.getenv("SHARED_CACHE", "1" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "").lower() in ("1", "true", "yes")
+    SHARED_CACHE_PATH: str = os.getenv("SHARED_CACHE_PATH", "")
+    SHARED_CACHE_MB: int = int(os.getenv("SHARED_CACHE_MB", "128"))
+    SHARED_CACHE_POLL: float = float(os.getenv("SHARED_CACHE_POLL", "1"))
+    # Сжатие JSON-ответов: ответы меньше порога отдаём как есть
+    COMPRESS_MIN_SIZE: int = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", "5"))
+    # Живые обновления (SSE): очередь на клиента, опрос новых фото, пинг
+    EVENTS_QUEUE_SIZE: int = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+    EVENTS_POLL_INTERVAL: float = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+    EVENTS_HEARTBEAT: float = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+    # Журнал изменений стены (capped-коллекция) для /api/photos/changes
+    CHANGELOG_SIZE_BYTES: int = int(os.getenv("CHANGELOG_SIZE_BYTES", str(16 * 1024 * 1024)))
+    CHANGELOG_MAX_ENTRIES: int = int(os.getenv("CHANGELOG_MAX_ENTRIES", "100000"))
+    # Фоновая загрузка фото из бота: воркеры, длина очереди, сколько ждать
+    # места в очереди и сколько раз повторять скачивание/запись
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "4"))
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+    INGEST_ENQUEUE_TIMEOUT: float = float(os.getenv("INGEST_ENQUEUE_TIMEOUT", "5"))
+    INGEST_RETRIES: int = int(os.getenv("INGEST_RETRIES", "3"))
+    INGEST_RETRY_DELAY: float = float(os.getenv("INGEST_RETRY_DELAY", "1"))
+    INGEST_MAX_SIDE: int = int(os.getenv("INGEST_MAX_SIDE", "2560"))
+    # Аренда фото pending: владелец продлевает её, пока фото у него в
+    # очереди; фото с истёкшей арендой забирает другой процесс (bot.ingest)
+    INGEST_CLAIM_TTL: float = float(os.getenv("INGEST_CLAIM_TTL", "120"))
+    # Почти одинаковые фото (расстояние dHash не больше PHASH_DISTANCE):
+    # keep - добавить со своим блобом и пометкой duplicate_of, share - то же,
+    # но при тех же байтах или расстоянии не больше PHASH_SHARE_DISTANCE
+    # взять блоб и превью найденного, reject - не добавлять
+    PHASH_DISTANCE: int = int(os.getenv("PHASH_DISTANCE", "6"))
+    PHASH_SHARE_DISTANCE: int = int(os.getenv("PHASH_SHARE_DISTANCE", "2"))
+    DUPLICATE_POLICY: str = os.getenv("DUPLICATE_POLICY", "keep")
     
 config = Config()
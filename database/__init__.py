@@ -1,26 +1,121 @@
+import asyncio
+import logging
+import threading
+import time
+
+import pymongo
 from pymongo import MongoClient
 from config import config
-import os
+import metrics
+
+# Подключение ленивое: импорт ничего не ждёт от сети, MongoClient создаётся
+# при первом обращении к database.db (get_db), а приложение при старте
+# вызывает connect() в пуле потоков. Создание клиента блокирует (для
+# mongodb+srv это запросы DNS), поэтому в потоке с event loop get_db его не
+# создаёт и до connect() возвращает None - там база просто ещё не готова
+# (is_open). Дальше пулом соединений и переподключением после обрывов
+# занимается сам MongoClient; если клиент не удалось даже создать
+# (например, не резолвится mongodb+srv), следующая попытка будет не раньше
+# чем через DB_RECONNECT_INTERVAL, а не никогда.
+# Присвоение database.db = ... подменяет базу (бенчмарки, тесты)
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client = None
+_db = None
+_failed_at = None
+
+
+def _create_client() -> MongoClient:
+    return MongoClient(
+        config.MONGODB_URL,
+        appname="graffiti-wall",
+        maxPoolSize=config.DB_POOL_SIZE,
+        minPoolSize=config.DB_MIN_POOL_SIZE,
+        connectTimeoutMS=config.DB_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=config.DB_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=config.DB_SOCKET_TIMEOUT_MS or None,
+        # Время каждой команды уходит в метрики
+        event_listeners=[metrics.MongoCommandMetrics(config.SLOW_QUERY_MS)],
+    )
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def is_open() -> bool:
+    """Клиент базы создан (или база подменена) - get_db() её вернёт."""
+    return globals().get("db") is not None or _db is not None
+
 
-print("=== DATABASE INIT ===")
-print(f"MONGODB_URL configured: {bool(config.MONGODB_URL)}")
+def get_db():
+    """База graffiti_wall или None, если MONGODB_URL не задан или клиент не создаётся.
 
-try:
+    Вызывается там, где база нужна, а не при импорте: клиент, который не
+    создался сейчас, может создаться при следующем обращении. На event loop
+    клиент не создаётся - до connect() в пуле потоков там будет None.
+    """
+    global _client, _db, _failed_at
+    override = globals().get("db")
+    if override is not None:
+        return override
+    if _db is not None or not config.MONGODB_URL or _on_event_loop():
+        return _db
+    with _lock:
+        retry_at = None if _failed_at is None else _failed_at + config.DB_RECONNECT_INTERVAL
+        if _db is None and (retry_at is None or time.monotonic() >= retry_at):
+            try:
+                _client = _create_client()
+                _db = _client.graffiti_wall
+                _failed_at = None
+            except Exception:
+                _failed_at = time.monotonic()
+                logger.exception("❌ Ошибка подключения")
+    return _db
+
+
+def ping(database, timeout: float = None) -> float:
+    """Время ответа базы в секундах; исключение, если она недоступна."""
+    if database is None:
+        raise RuntimeError("База не подключена")
+    started = time.perf_counter()
+    with pymongo.timeout(timeout or config.DB_PING_TIMEOUT):
+        database.command("ping")
+    return time.perf_counter() - started
+
+
+def connect():
+    """Создаёт клиент и ждёт первого соединения - для старта приложения.
+
+    Ошибка только пишется в журнал: клиент продолжит попытки сам.
+    """
     if not config.MONGODB_URL:
-        print("❌ MONGODB_URL пустой")
-        db = None
-    else:
-        print("🔄 Пытаемся подключиться...")
-        # Добавляем таймаут
-        client = MongoClient(config.MONGODB_URL, serverSelectionTimeoutMS=5000)
-        
-        # Проверяем подключение
-        client.admin.command('ismaster')
-        db = client.graffiti_wall
-        
-        print(f"✅ MongoDB подключена! База: {db.name}")
-        print(f"📂 Коллекции: {db.list_collection_names()}")
-        
-except Exception as e:
-    print(f"❌ Ошибка подключения: {e}")
-    db = None
+        logger.error("❌ MONGODB_URL пустой")
+        return
+    database = get_db()
+    if database is None:
+        return
+    try:
+        latency = ping(database, config.DB_SERVER_SELECTION_TIMEOUT_MS / 1000)
+        logger.info("✅ MongoDB подключена! База: %s, ответ за %.0f мс", database.name, latency * 1000)
+    except Exception as e:
+        logger.error("❌ MongoDB пока недоступна, клиент переподключится сам: %s", e)
+
+
+def close():
+    global _client, _db
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = _db = None
+
+
+def __getattr__(name):
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,49 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import metrics
+from config import config
+
+# pymongo синхронный: все обращения к базе из async-кода идут через
+# ограниченный пул потоков, чтобы медленный запрос не блокировал event loop
+_executor = ThreadPoolExecutor(
+    max_workers=config.DB_MAX_WORKERS,
+    thread_name_prefix="mongo",
+)
+_inflight = 0
+
+
+def inflight() -> int:
+    """Сколько операций с базой сейчас выполняется или ждёт потока."""
+    return _inflight
+
+
+metrics.Gauge("db_operations_in_flight", "Операции с базой в пуле потоков и в очереди к нему", function=inflight)
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронный вызов pymongo в пуле и ждёт результат."""
+    global _inflight
+    loop = asyncio.get_running_loop()
+    _inflight += 1
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        _inflight -= 1
+
+
+async def wait_for_db():
+    """База из database.get_db() - клиент создаётся в пуле, не на event loop;
+    пока он не создаётся, пробует снова раз в DB_RECONNECT_INTERVAL.
+    None - MONGODB_URL не задан."""
+    while True:
+        db = await run_db(database.get_db)
+        if db is not None or not config.MONGODB_URL:
+            return db
+        await asyncio.sleep(config.DB_RECONNECT_INTERVAL)
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import gridfs
+from gridfs.errors import FileExists, NoFile
+
+from config import config
+from database.aio import run_db
+
+# Байты картинок хранятся отдельно от метаданных фото. Ключ блоба - sha256
+# содержимого, поэтому одинаковые файлы хранятся один раз, а ключ годится
+# как сильный ETag. В документе фото остаётся только blob_key.
+#
+# Блоб без ссылок не удаляется сразу: тот же файл в это время может
+# загружать другой процесс - put() видит, что блоб есть, и ничего не
+# пишет, а blob_key в фото появится чуть позже. release() только отмечает
+# блоб в db.blob_garbage, а удаляет его collect_garbage(), если за
+# BLOB_GC_GRACE на него так и не сослалось ни одно фото
+logger = logging.getLogger(__name__)
+
+
+def blob_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    def put(self, data: bytes) -> str:
+        raise NotImplementedError
+
+    def open(self, key: str):
+        """Файлоподобный объект с seek/read/close или None, если блоба нет."""
+        raise NotImplementedError
+
+    def size(self, fh) -> int:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, db, collection: str = "blobs"):
+        self.fs = gridfs.GridFS(db, collection=collection)
+
+    def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        if not self.fs.exists(key):
+            try:
+                self.fs.put(data, _id=key)
+            except FileExists:
+                pass  # Тот же файл только что записал кто-то другой
+        return key
+
+    def open(self, key: str):
+        try:
+            return self.fs.get(key)
+        except NoFile:
+            return None
+
+    def size(self, fh) -> int:
+        return fh.length
+
+    def delete(self, key: str):
+        self.fs.delete(key)
+
+
+class LocalBlobStore(BlobStore):
+    """Блобы в файлах ``root/ab/cdef...`` - для разработки и тестов."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Пишем во временный файл и переименовываем, чтобы читатель
+            # никогда не увидел недописанный блоб
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def open(self, key: str):
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            return None
+
+    def size(self, fh) -> int:
+        return os.fstat(fh.fileno()).st_size
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+_store = None
+
+
+def get_store() -> BlobStore:
+    global _store
+    if _store is None:
+        if config.BLOB_BACKEND == "local":
+            _store = LocalBlobStore(config.BLOB_DIR)
+        else:
+            from database import db
+            if db is None:
+                raise RuntimeError("GridFS недоступен: DB не подключена")
+            _store = GridFSBlobStore(db)
+    return _store
+
+
+def release(db, key: str, derived=()):
+    """Отмечает блоб к удалению: на него, возможно, больше не ссылается ни одно фото.
+
+    ``derived`` - блобы, построенные из него (превью): у одинаковых
+    оригиналов они одинаковые, поэтому удаляются вместе с оригиналом.
+    """
+    if key:
+        db.blob_garbage.update_one(
+            {"_id": key},
+            {"$set": {"derived": list(derived), "released_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+
+def collect_garbage(db, grace: float = None) -> int:
+    """Удаляет блобы, отмеченные release() раньше ``grace`` секунд назад,
+    если на них так и не сослалось ни одно фото. Возвращает, сколько удалено."""
+    grace = config.BLOB_GC_GRACE if grace is None else grace
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    store = None
+    removed = 0
+    for mark in db.blob_garbage.find({"released_at": {"$lt": cutoff}}):
+        key = mark["_id"]
+        if db.photos.count_documents({"blob_key": key}, limit=1) == 0:
+            store = store or get_store()
+            store.delete(key)
+            for derived_key in mark.get("derived", ()):
+                store.delete(derived_key)
+            removed += 1
+        # Повторный release() за это время поставил новую отметку - её не трогаем
+        db.blob_garbage.delete_one({"_id": key, "released_at": mark["released_at"]})
+    return removed
+
+
+async def collect_periodically(db):
+    """collect_garbage() в пуле потоков раз в BLOB_GC_INTERVAL."""
+    while True:
+        await asyncio.sleep(config.BLOB_GC_INTERVAL)
+        try:
+            removed = await run_db(collect_garbage, db)
+            if removed:
+                logger.info("Удалено блобов без ссылок: %d", removed)
+        except Exception:
+            logger.exception("Сборка неиспользуемых блобов не удалась")
+
+
+def migrate_inline_images(db) -> int:
+    """Переносит image_data из старых документов фото в хранилище блобов."""
+    store = get_store()
+    moved = 0
+    for photo in db.photos.find({"image_data": {"$exists": True}}, {"image_data": 1}):
+        key = store.put(bytes(photo["image_data"]))
+        db.photos.update_one(
+            {"_id": photo["_id"]},
+            {"$set": {"blob_key": key}, "$unset": {"image_data": ""}},
+        )
+        moved += 1
+    return moved
+
+
+if __name__ == "__main__":
+    from database import db, indexes
+
+    if db is None:
+        print("❌ DB не подключена!")
+    else:
+        indexes.ensure_indexes(db)
+        print(f"📦 Перенесено картинок: {migrate_inline_images(db)}")
+        print(f"🗑 Удалено блобов без ссылок: {collect_garbage(db)}")
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+from pymongo.errors import ConnectionFailure
+
+from config import config
+from database import counters, indexes, likes, spatial
+from database.aio import run_db
+
+logger = logging.getLogger(__name__)
+
+# Подготовка базы до первой записи. Запись раньше неё ломает базу так, что
+# подготовка этого уже не исправит: лайк до уникального индекса likes
+# может задвоиться - и индекс потом не строится никогда; первый лайк или
+# фото создаёт wall_changes обычной коллекцией вместо capped, а upsert
+# счётчиков - wall_stats без старых фото, и ensure_stats их уже не
+# посчитает. Поэтому запись (webapp, бот) ждёт is_ready(), а чтение - нет
+REQUIRED = ("wall_changes", "likes")
+
+_ready = False
+
+
+def is_ready() -> bool:
+    """Подготовка прошла, базе можно писать."""
+    return _ready
+
+
+def prepare(db):
+    """Индексы из database.indexes, миграции старых фото и счётчики.
+
+    Без журнала и индексов likes база к записи не готова - это ошибка,
+    остальные индексы только в журнал: без них запросы медленнее, но верны.
+    """
+    global _ready
+    errors = indexes.ensure_indexes(db)
+    for collection, error in errors.items():
+        if collection in REQUIRED or isinstance(error, ConnectionFailure):
+            raise RuntimeError(f"{collection}: {error}") from error
+        logger.error("Индексы %s не созданы: %s", collection, error)
+    spatial.backfill_cells(db)
+    likes.migrate_liked_by(db)
+    counters.ensure_stats(db)
+    _ready = True
+
+
+async def prepare_until_ready(db):
+    """prepare() в пуле потоков; пока не выходит, повторяет с растущей паузой."""
+    delay = config.DB_RECONNECT_INTERVAL
+    while True:
+        try:
+            await run_db(prepare, db)
+            logger.info("✅ База готова к записи")
+            return
+        except Exception:
+            logger.exception("Database setup error, повтор через %.0f с", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 300)
+
+
+async def wait_ready(poll: float = 1):
+    """Ждёт, пока подготовку закончит другая задача этого процесса."""
+    while not _ready:
+        await asyncio.sleep(poll)
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+from config import config
+
+# Журнал изменений стены - capped-коллекция db.wall_changes. Номер
+# изменения (seq) - это версия стены из db.wall_stats, которую атомарно
+# увеличивает database.counters вместе со счётчиками. По журналу клиент
+# догоняет стену с любого seq, а если журнал уже забыл этот seq - получает
+# полный снимок
+ADD = "add"
+LIKES = "likes"
+DELETE = "delete"
+STATS = "stats"  # Пересчёт счётчиков, к конкретному фото не относится
+
+# seq выделяется раньше, чем запись попадает в журнал. Если в журнале
+# дырка, а следующая запись свежее GAP_GRACE, значит параллельный писатель
+# ещё не успел записать свою - дальше дырки не отдаём
+GAP_GRACE = timedelta(seconds=5)
+MAX_DELTA = 5000
+
+
+def ensure_collection(db):
+    if "wall_changes" not in db.list_collection_names():
+        db.create_collection(
+            "wall_changes",
+            capped=True,
+            size=config.CHANGELOG_SIZE_BYTES,
+            max=config.CHANGELOG_MAX_ENTRIES,
+        )
+
+
+def record(db, seq: int, op: str, photo_id=None):
+    db.wall_changes.insert_one({"seq": seq, "op": op, "photo_id": photo_id, "at": datetime.utcnow()})
+
+
+def _oldest_seq(db):
+    # В capped-коллекции естественный порядок - порядок вставки
+    entry = db.wall_changes.find_one({}, {"seq": 1}, sort=[("$natural", ASCENDING)])
+    return entry["seq"] if entry else None
+
+
+def changes_since(db, since: int, current: int, projection: dict):
+    """Изменения фото после ``since``: (seq, [(op, photo_id, документ или None)]).
+
+    ``current`` - текущая версия стены. None означает, что журнал не
+    покрывает ``since`` и клиенту нужен полный снимок.
+    """
+    if since == current:
+        return since, []
+    oldest = _oldest_seq(db)
+    # since из будущего - у клиента стена от другой базы
+    if since > current or oldest is None or since < oldest - 1:
+        return None
+
+    entries = list(db.wall_changes.find({"seq": {"$gt": since}}).sort("seq", ASCENDING).limit(MAX_DELTA + 1))
+    if len(entries) > MAX_DELTA:
+        return None
+
+    seq = since
+    latest = {}  # photo_id -> op, порядок - по последнему изменению
+    now = datetime.utcnow()
+    for entry in entries:
+        if entry["seq"] != seq + 1 and now - entry["at"] < GAP_GRACE:
+            break
+        seq = entry["seq"]
+        photo_id = entry.get("photo_id")
+        if photo_id is None:
+            continue
+        op = entry["op"]
+        # Новое фото, которое потом лайкнули, для клиента всё ещё новое
+        if op == LIKES and latest.get(photo_id) == ADD:
+            op = ADD
+        latest.pop(photo_id, None)
+        latest[photo_id] = op
+
+    alive = [photo_id for photo_id, op in latest.items() if op != DELETE]
+    docs = {doc["_id"]: doc for doc in db.photos.find({"_id": {"$in": alive}}, projection)} if alive else {}
+
+    changes = []
+    for photo_id, op in latest.items():
+        doc = docs.get(photo_id)
+        # Фото удалили уже после выбранного диапазона - для клиента это удаление
+        changes.append((op if doc is not None else DELETE, photo_id, doc))
+    return seq, changes
@@ -0,0 +1,202 @@
+from pymongo import ReturnDocument, UpdateOne
+
+from database import changelog, status
+
+# Счётчики стены живут в одном документе db.wall_stats и меняются атомарными
+# $inc при добавлении/удалении фото и лайках, поэтому /api/stats - одно чтение
+# по _id. В db.user_stats по документу на пользователя: число фото, сумма и
+# среднее лайков (из него же строится лидерборд, см. database.leaderboard).
+# Появился/исчез документ пользователя - +-1 участник. Каждое изменение
+# заодно увеличивает version - это номер изменения для database.changelog
+# и ключ кэша ответов webapp
+STATS_ID = "wall"
+EMPTY_STATS = {"total_photos": 0, "total_users": 0, "total_likes": 0}
+
+# avg_likes пересчитывается тем же update-пайплайном, что меняет суммы,
+# поэтому среднее всегда согласовано с total_photos/total_likes
+_SET_AVG = {"$set": {"avg_likes": {"$cond": [
+    {"$gt": ["$total_photos", 0]},
+    {"$divide": ["$total_likes", "$total_photos"]},
+    0,
+]}}}
+
+
+def _add(field, delta):
+    return {"$add": [{"$ifNull": [f"${field}", 0]}, delta]}
+
+
+def _inc_stats(db, **deltas) -> int:
+    doc = db.wall_stats.find_one_and_update(
+        {"_id": STATS_ID},
+        {"$inc": {**deltas, "version": 1}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["version"]
+
+
+def photo_added(db, user_id: int, username: str = None) -> int:
+    """Возвращает новую версию стены (seq для журнала изменений)."""
+    fields = {"total_photos": _add("total_photos", 1), "total_likes": _add("total_likes", 0)}
+    if username is not None:
+        fields["username"] = username
+    result = db.user_stats.update_one(
+        {"_id": user_id},
+        [{"$set": fields}, _SET_AVG],
+        upsert=True,
+    )
+    new_user = result.upserted_id is not None
+    return _inc_stats(db, total_photos=1, total_users=int(new_user))
+
+
+def photo_removed(db, photo: dict) -> int:
+    """``photo`` - удалённый документ, нужны user_id и likes."""
+    user_id = photo.get("user_id")
+    likes = photo.get("likes", 0)
+    user = db.user_stats.find_one_and_update(
+        {"_id": user_id},
+        [{"$set": {"total_photos": _add("total_photos", -1), "total_likes": _add("total_likes", -likes)}}, _SET_AVG],
+        return_document=ReturnDocument.AFTER,
+    )
+    user_gone = False
+    if user is not None and user["total_photos"] <= 0:
+        # Если параллельно пришло новое фото этого пользователя, условие
+        # не совпадёт и участник останется
+        result = db.user_stats.delete_one({"_id": user_id, "total_photos": {"$lte": 0}})
+        user_gone = result.deleted_count > 0
+    return _inc_stats(db, total_photos=-1, total_users=-int(user_gone), total_likes=-likes)
+
+
+def like_changed(db, user_id: int, delta: int) -> int:
+    """``user_id`` - автор фото, которому поставили или сняли лайк."""
+    db.user_stats.update_one(
+        {"_id": user_id},
+        [{"$set": {"total_likes": _add("total_likes", delta)}}, _SET_AVG],
+    )
+    return _inc_stats(db, total_likes=delta)
+
+
+def read_stats(db) -> dict:
+    doc = db.wall_stats.find_one({"_id": STATS_ID}) or {}
+    return {key: doc.get(key, default) for key, default in EMPTY_STATS.items()}
+
+
+def read_version(db) -> int:
+    doc = db.wall_stats.find_one({"_id": STATS_ID}, {"version": 1}) or {}
+    return doc.get("version", 0)
+
+
+def _like_counts(db) -> dict:
+    """Число лайков каждого фото по db.likes."""
+    pipeline = [{"$group": {"_id": "$photo_id", "likes": {"$sum": 1}}}]
+    return {row["_id"]: row["likes"] for row in db.likes.aggregate(pipeline)}
+
+
+def _actual(db, like_counts: dict):
+    # Лайки - по db.likes, а не по photos.likes: счётчик фото тоже
+    # пересчитывается (reconcile)
+    users = {}
+    for photo in db.photos.find(status.VISIBLE, {"user_id": 1, "username": 1}):
+        row = users.setdefault(photo.get("user_id"), {
+            "username": photo.get("username"), "total_photos": 0, "total_likes": 0,
+        })
+        row["total_photos"] += 1
+        row["total_likes"] += like_counts.get(photo["_id"], 0)
+    stats = {
+        "total_photos": sum(row["total_photos"] for row in users.values()),
+        "total_users": len(users),
+        "total_likes": sum(row["total_likes"] for row in users.values()),
+    }
+    return stats, users
+
+
+def reconcile(db, fix: bool = True) -> dict:
+    """Пересчитывает счётчики по db.photos и db.likes с нуля.
+
+    Возвращает расхождения ``{поле: (было, стало)}``; при ``fix=True``
+    перезаписывает сохранённые счётчики пересчитанными, в том числе
+    photos.likes.
+    """
+    like_counts = _like_counts(db)
+    actual, users = _actual(db, like_counts)
+    stored = read_stats(db)
+    drift = {key: (stored[key], actual[key]) for key in actual if stored[key] != actual[key]}
+
+    # Лайк и $inc счётчика фото - две записи: между ними процесс мог упасть
+    photo_likes = {}
+    for photo in db.photos.find({}, {"likes": 1}):
+        have, want = photo.get("likes", 0), like_counts.get(photo["_id"], 0)
+        if have != want:
+            drift[f"photo:{photo['_id']}:likes"] = (have, want)
+            photo_likes[photo["_id"]] = want
+
+    stored_users = {doc["_id"]: doc for doc in db.user_stats.find()}
+    for user_id in stored_users.keys() | users.keys():
+        for key in ("total_photos", "total_likes"):
+            have = stored_users.get(user_id, {}).get(key, 0)
+            want = users.get(user_id, {}).get(key, 0)
+            if have != want:
+                drift[f"user:{user_id}:{key}"] = (have, want)
+
+    if fix:
+        updates = [
+            UpdateOne(
+                {"_id": user_id},
+                {"$set": {
+                    "username": row["username"],
+                    "total_photos": row["total_photos"],
+                    "total_likes": row["total_likes"],
+                    "avg_likes": row["total_likes"] / row["total_photos"],
+                }},
+                upsert=True,
+            )
+            for user_id, row in users.items()
+        ]
+        if updates:
+            db.user_stats.bulk_write(updates, ordered=False)
+        db.user_stats.delete_many({"_id": {"$nin": list(users)}})
+        if photo_likes:
+            db.photos.bulk_write(
+                [UpdateOne({"_id": photo_id}, {"$set": {"likes": likes}}) for photo_id, likes in photo_likes.items()],
+                ordered=False,
+            )
+        # По номеру изменения на каждое исправленное фото и на сами счётчики
+        doc = db.wall_stats.find_one_and_update(
+            {"_id": STATS_ID},
+            {"$set": actual, "$inc": {"version": len(photo_likes) + 1}},
+            projection={"version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        first = doc["version"] - len(photo_likes)
+        for seq, photo_id in enumerate(photo_likes, start=first):
+            changelog.record(db, seq, changelog.LIKES, photo_id)
+        changelog.record(db, doc["version"], changelog.STATS)
+
+    return drift
+
+
+def ensure_stats(db):
+    """Первый запуск: счётчиков ещё нет, строим их по существующим фото."""
+    if db.wall_stats.find_one({"_id": STATS_ID}) is None:
+        reconcile(db, fix=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import db
+
+    parser = argparse.ArgumentParser(description="Пересчёт счётчиков стены")
+    parser.add_argument("--dry-run", action="store_true", help="только показать расхождения")
+    args = parser.parse_args()
+
+    if db is None:
+        print("❌ DB не подключена!")
+    else:
+        drift = reconcile(db, fix=not args.dry_run)
+        if not drift:
+            print("✅ Счётчики совпадают")
+        for key, (was, now) in sorted(drift.items()):
+            print(f"⚠️ {key}: {was} -> {now}")
@@ -0,0 +1,174 @@
+import argparse
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from database import changelog, leaderboard, spatial, status
+
+# Все индексы базы в одном месте. Рядом с каждым - запрос, ради которого
+# он нужен; новый запрос к большой коллекции добавляется в QUERIES ниже, и
+# python -m database.indexes --check-plans проверяет, что ни один из них
+# не читает коллекцию целиком. Имена индексов - стандартные (поле_1), как
+# у созданных раньше через create_index, поэтому повторное создание на
+# старой базе ничего не меняет
+INDEXES = {
+    "photos": [
+        # Видимая область стены: ячейки viewport_filter (database.spatial)
+        IndexModel([("cell", ASCENDING)]),
+        # Освобождение блоба и общий блоб дубликата (database.blobs, phash)
+        IndexModel([("blob_key", ASCENDING)]),
+        # Незагруженные фото после перезапуска (bot.ingest)
+        IndexModel([("status", ASCENDING)]),
+        # Поиск свободных слотов и проверка занятости (database.placement)
+        IndexModel([("slot", ASCENDING)]),
+        # Новые фото первыми
+        IndexModel([("created_at", DESCENDING)]),
+        # Догрузка чужих phash в дерево дубликатов (database.phash)
+        IndexModel([("hashed_at", ASCENDING)]),
+        # Список дубликатов для модераторов: у остальных фото поля нет
+        IndexModel([("duplicate_of", ASCENDING)], sparse=True),
+        # Сортировки по likes индекс не получает намеренно: его пришлось бы
+        # обновлять на каждый лайк, а лидерборд читает user_stats
+    ],
+    "likes": [
+        # Переключение лайка: уникальность пары решает гонки (database.likes)
+        IndexModel([("photo_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        # «Мои лайки»
+        IndexModel([("user_id", ASCENDING), ("photo_id", ASCENDING)]),
+    ],
+    "user_stats": [
+        # Топ и место в лидерборде (database.leaderboard)
+        IndexModel(leaderboard.ORDER),
+    ],
+    "wall_changes": [
+        # Изменения после seq (database.changelog)
+        IndexModel([("seq", ASCENDING)]),
+    ],
+    "users": [
+        # /start в боте обновляет пользователя по user_id
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "blob_garbage": [
+        # Отмеченные блобы старше паузы (database.blobs.collect_garbage)
+        IndexModel([("released_at", ASCENDING)]),
+    ],
+}
+
+_OID = ObjectId("000000000000000000000000")
+_SINCE = datetime(2024, 1, 1)
+_USER = 1
+
+# Формы запросов, которые выполняются на каждый запрос пользователя:
+# (название, коллекция, фильтр, сортировка). Выборки всей стены и пересчёт
+# счётчиков читают коллекцию целиком по смыслу и здесь не проверяются
+QUERIES = [
+    ("photos: видимая область", "photos", status.visible(spatial.viewport_filter(0, 0, 1280, 800)), None),
+    ("photos: страница", "photos", {"$and": [status.VISIBLE, {"_id": {"$gt": _OID}}]}, [("_id", ASCENDING)]),
+    ("photos: по _id", "photos", {"_id": _OID}, None),
+    ("photos: по блобу", "photos", {"blob_key": "0" * 64}, None),
+    ("photos: ожидают загрузки", "photos", {"status": status.PENDING}, None),
+    ("photos: новые фото для phash", "photos", {"hashed_at": {"$gte": _SINCE}}, None),
+    ("likes: лайк пользователя", "likes", {"photo_id": _OID, "user_id": _USER}, None),
+    ("likes: мои лайки", "likes", {"user_id": _USER}, None),
+    ("likes: лайки фото", "likes", {"photo_id": _OID}, None),
+    ("user_stats: топ", "user_stats", {}, leaderboard.ORDER),
+    ("user_stats: место", "user_stats", {"$or": [
+        {"total_likes": {"$gt": 0}},
+        {"total_likes": 0, "_id": {"$lt": _USER}},
+    ]}, None),
+    ("wall_changes: после seq", "wall_changes", {"seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ("users: по user_id", "users", {"user_id": _USER}, None),
+]
+
+
+def ensure_indexes(db) -> dict:
+    """Создаёт недостающие индексы; {коллекция: ошибка} для тех, где не вышло.
+
+    Существующие индексы не пересобираются, сборка новых на MongoDB 4.2+
+    не блокирует коллекцию.
+    """
+    errors = {}
+    # Журнал должен появиться capped-коллекцией раньше, чем его создаст индекс
+    try:
+        changelog.ensure_collection(db)
+    except Exception as e:
+        errors["wall_changes"] = e
+    for collection, models in INDEXES.items():
+        if collection in errors:
+            continue
+        try:
+            db[collection].create_indexes(models)
+        except Exception as e:
+            errors[collection] = e
+    return errors
+
+
+def missing_indexes(db) -> list:
+    """(коллекция, ключ) индексов из INDEXES, которых нет в базе."""
+    missing = []
+    for collection, models in INDEXES.items():
+        existing = {tuple(info["key"]) for info in db[collection].index_information().values()}
+        for model in models:
+            key = tuple(model.document["key"].items())
+            if key not in existing:
+                missing.append((collection, key))
+    return missing
+
+
+def _stages(plan):
+    """Все стадии плана explain(), в том числе вложенные."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def check_plans(db) -> list:
+    """(название, стадии плана) для запросов из QUERIES, которые читают коллекцию целиком."""
+    failures = []
+    for name, collection, query, sort in QUERIES:
+        cursor = db[collection].find(query).limit(100)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = list(_stages(plan))
+        if "COLLSCAN" in stages:
+            failures.append((name, stages))
+    return failures
+
+
+if __name__ == "__main__":
+    from database import db
+
+    parser = argparse.ArgumentParser(description="Индексы базы")
+    parser.add_argument("--check-plans", action="store_true", help="только проверить планы запросов, ничего не создавать")
+    args = parser.parse_args()
+
+    if db is None:
+        print("❌ DB не подключена!")
+        sys.exit(1)
+    if not args.check_plans:
+        errors = ensure_indexes(db)
+        for collection, error in errors.items():
+            print(f"❌ {collection}: {error}")
+        if errors:
+            sys.exit(1)
+        print("✅ Индексы на месте")
+        sys.exit(0)
+
+    problems = 0
+    for collection, key in missing_indexes(db):
+        print(f"⚠️ Нет индекса {collection} {key}")
+        problems += 1
+    for name, stages in check_plans(db):
+        print(f"❌ {name}: полный просмотр коллекции ({' -> '.join(stages)})")
+        problems += 1
+    if problems:
+        sys.exit(1)
+    print(f"✅ Все {len(QUERIES)} запросов идут по индексам")
@@ -0,0 +1,39 @@
+from pymongo import ASCENDING, DESCENDING
+
+# Лидерборд читается из db.user_stats (его поддерживает database.counters).
+# Порядок: больше лайков выше, при равенстве - меньший user_id выше. Индекс
+# совпадает с этим порядком, поэтому и топ, и место пользователя - индексные
+# запросы без агрегации по всем фото
+ORDER = [("total_likes", DESCENDING), ("_id", ASCENDING)]
+MAX_LIMIT = 100
+
+_PROJECTION = {"username": 1, "total_photos": 1, "total_likes": 1, "avg_likes": 1}
+
+
+def _to_entry(doc: dict, rank: int) -> dict:
+    return {
+        "rank": rank,
+        "user_id": doc["_id"],
+        "username": doc.get("username"),
+        "total_photos": doc.get("total_photos", 0),
+        "total_likes": doc.get("total_likes", 0),
+        "avg_likes": doc.get("avg_likes", 0),
+    }
+
+
+def top(db, offset: int = 0, limit: int = 10) -> list:
+    cursor = db.user_stats.find({}, _PROJECTION).sort(ORDER).skip(offset).limit(limit)
+    return [_to_entry(doc, offset + i + 1) for i, doc in enumerate(cursor)]
+
+
+def rank_of(db, user_id: int):
+    """Место пользователя в лидерборде или None, если у него нет фото."""
+    doc = db.user_stats.find_one({"_id": user_id}, _PROJECTION)
+    if doc is None:
+        return None
+    likes = doc.get("total_likes", 0)
+    ahead = db.user_stats.count_documents({"$or": [
+        {"total_likes": {"$gt": likes}},
+        {"total_likes": likes, "_id": {"$lt": user_id}},
+    ]})
+    return _to_entry(doc, ahead + 1)
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import status
+
+# Лайки - отдельные документы {photo_id, user_id} с уникальным индексом,
+# а в документе фото остаётся только счётчик likes. Так /api/photos не
+# тащит растущие массивы liked_by, а «мои лайки» - индексный запрос
+
+
+def toggle_like(db, photo_id: str, user_id: int):
+    """Ставит или снимает лайк.
+
+    Возвращает (liked, likes, автор фото) после изменения или None, если
+    фото нет или оно ещё не готово (pending, failed).
+    """
+    oid = ObjectId(photo_id)
+    photo_query = status.visible({"_id": oid})
+    if db.photos.find_one(photo_query, {"_id": 1}) is None:
+        return None
+    key = {"photo_id": oid, "user_id": user_id}
+    # Уникальный индекс решает гонки: вставка прошла - лайк поставлен,
+    # дубликат - лайк уже был, снимаем. Если его успел снять параллельный
+    # запрос, пробуем вставить снова
+    while True:
+        try:
+            db.likes.insert_one({**key, "created_at": datetime.utcnow()})
+            delta = 1
+            break
+        except DuplicateKeyError:
+            if db.likes.delete_one(key).deleted_count:
+                delta = -1
+                break
+
+    # Падение между этими двумя записями исправляет counters.reconcile
+    photo = db.photos.find_one_and_update(
+        photo_query,
+        {"$inc": {"likes": delta}},
+        projection={"likes": 1, "user_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if photo is None:
+        db.likes.delete_one(key)
+        return None
+    return delta > 0, photo["likes"], photo.get("user_id")
+
+
+def liked_photo_ids(db, user_id: int) -> list:
+    return [str(like["photo_id"]) for like in db.likes.find({"user_id": user_id}, {"photo_id": 1, "_id": 0})]
+
+
+def photo_removed(db, photo_id: ObjectId):
+    db.likes.delete_many({"photo_id": photo_id})
+
+
+def migrate_liked_by(db) -> int:
+    """Переносит старые массивы liked_by из фото в коллекцию likes."""
+    moved = 0
+    for photo in db.photos.find({"liked_by": {"$exists": True}}, {"liked_by": 1}):
+        for user_id in set(photo.get("liked_by") or []):
+            try:
+                db.likes.insert_one({"photo_id": photo["_id"], "user_id": user_id, "created_at": datetime.utcnow()})
+            except DuplicateKeyError:
+                pass
+        db.photos.update_one(
+            {"_id": photo["_id"]},
+            {
+                "$set": {"likes": db.likes.count_documents({"photo_id": photo["_id"]})},
+                "$unset": {"liked_by": ""},
+            },
+        )
+        moved += 1
+    return moved
+
+
+if __name__ == "__main__":
+    from database import db, indexes
+
+    if db is None:
+        print("❌ DB не подключена!")
+    else:
+        indexes.ensure_indexes(db)
+        print(f"❤️ Перенесены лайки {migrate_liked_by(db)} фото")
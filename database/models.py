@@ -1,33 +1,69 @@
 from pymongo import MongoClient
 from datetime import datetime
 import uuid
-from database import db
+from database import blobs, changelog, counters, get_db, phash, placement, thumbnails
+from database.spatial import cell_key
+from database.status import READY
 
 class Photo:
-    def __init__(self, user_id: int, username: str, image_data: bytes, position_x: int, position_y: int):
+    def __init__(self, user_id: int, username: str, image_data: bytes, position_x: int = None, position_y: int = None):
         self.id = str(uuid.uuid4())
         self.user_id = user_id
         self.username = username
         self.image_data = image_data  # Бинарные данные фото
+        # Без позиции место выдаст database.placement при сохранении
         self.position_x = position_x
         self.position_y = position_y
         self.likes = 0
-        self.liked_by = []
+        self.status = READY
         self.created_at = datetime.utcnow()
 
     def save(self):
+        db = get_db()
         if db is None:
             print("❌ DB не подключена!")
             return False
         try:
-            db.photos.insert_one(self.__dict__)
+            # Картинка уходит в хранилище блобов, в документе только ключ
+            doc = {k: v for k, v in self.__dict__.items() if k != 'image_data'}
+            value_hash = thumbnails.get_pool().submit(phash.dhash_bytes, self.image_data).result()
+            doc.update(phash.fields(value_hash))
+            doc['blob_key'] = blobs.blob_key(self.image_data)
+            duplicate, shared = phash.check_duplicate(db, value_hash, doc['blob_key'])
+            if duplicate is not None:
+                doc['duplicate_of'] = duplicate['_id']
+            if shared:
+                # Почти та же картинка уже на стене - берём её блоб и превью
+                doc['blob_key'] = duplicate['blob_key']
+                doc['thumbs'] = duplicate.get('thumbs') or {}
+            else:
+                store = blobs.get_store()
+                store.put(self.image_data)
+                doc['thumbs'] = thumbnails.build_thumbnails(store, self.image_data)
+            if self.position_x is None or self.position_y is None:
+                doc.update(placement.placement_fields(placement.allocate(db)))
+            else:
+                # Явная позиция - мимо сетки слотов
+                doc.update(slot=None, cell=cell_key(self.position_x, self.position_y))
+            try:
+                photo_id = db.photos.insert_one(doc).inserted_id
+            except Exception:
+                placement.release(db, doc['slot'])
+                raise
+            phash.duplicates.add(value_hash, photo_id)
+            seq = counters.photo_added(db, self.user_id, self.username)
+            changelog.record(db, seq, changelog.ADD, photo_id)
             return True
+        except phash.DuplicatePhoto as e:
+            print(f"⚠️ Фото не сохранено: {e}")
+            return False
         except Exception as e:
             print(f"❌ Ошибка сохранения фото: {e}")
             return False
 
     @staticmethod
     def get_all():
+        db = get_db()
         if db is None:
             return []
         try:
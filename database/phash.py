@@ -0,0 +1,229 @@
+import io
+import threading
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageOps
+
+from config import config
+from database import status
+
+# Поиск почти одинаковых картинок. Одинаковые байты и так сводятся к
+# одному блобу (ключ - sha256), а пересжатый или уменьшенный мем даёт
+# другие байты, но почти тот же dHash: 64 бита «левый пиксель ярче
+# правого» по уменьшенной до 9x8 серой картинке. Похожесть - расстояние
+# Хэмминга, поиск соседей - по BK-дереву, без перебора всей стены
+HASH_SIZE = 8
+KEEP = "keep"  # фото добавляется со своим блобом, в duplicate_of - найденное
+SHARE = "share"  # как keep, но почти та же картинка берёт блоб и превью найденного
+REJECT = "reject"  # дубликат не добавляется на стену
+# Фото с duplicate_of модераторы видят списком (list_duplicates)
+
+# Однотонная картинка или плавный градиент дают хэш из одних нулей или
+# единиц: красный и синий квадраты для dHash одинаковы. У таких хэшей
+# похожесть ничего не значит - их не ищем и в дерево не кладём
+MIN_BITS = 8
+
+# hashed_at ставит процесс, посчитавший phash, по своим часам, и запись
+# видна другим не сразу. Догрузка перечитывает это окно до начала
+# прошлой: запоздавшие и записанные с отстающими часами фото не теряются
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+
+class DuplicatePhoto(ValueError):
+    pass
+
+
+def dhash(img: Image.Image) -> int:
+    small = ImageOps.exif_transpose(img).convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_bytes(data: bytes) -> int:
+    with Image.open(io.BytesIO(data)) as img:
+        return dhash(img)
+
+
+def to_hex(value: int) -> str:
+    # В MongoDB целые знаковые, поэтому 64 бита храним строкой
+    return f"{value:016x}"
+
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def is_degenerate(value: int) -> bool:
+    return not MIN_BITS <= value.bit_count() <= HASH_SIZE * HASH_SIZE - MIN_BITS
+
+
+def fields(value: int) -> dict:
+    """Поля фото для phash; hashed_at - по нему догружают другие процессы."""
+    return {"phash": to_hex(value), "hashed_at": datetime.utcnow()}
+
+
+class BKTree:
+    """BK-дерево по расстоянию Хэмминга: узел - хэш и всё, что с ним добавлено."""
+
+    def __init__(self):
+        self._root = None  # [хэш, [значения], {расстояние: узел}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value_hash: int, value):
+        self._size += 1
+        if self._root is None:
+            self._root = [value_hash, [value], {}]
+            return
+        node = self._root
+        while True:
+            d = distance(value_hash, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value_hash, [value], {}]
+                return
+            node = child
+
+    def search(self, value_hash: int, radius: int) -> list:
+        """[(расстояние, значение)] в пределах radius, ближние первыми."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = distance(value_hash, node[0])
+            if d <= radius:
+                found.extend((d, value) for value in node[1])
+            # Неравенство треугольника: дальше искать только в этих ветках
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class DuplicateIndex:
+    """BK-дерево по db.photos.phash, которое догружает новые фото по hashed_at.
+
+    Удалённые фото из дерева не вынимаются: кандидата проверяем по базе.
+    Свои загрузки процесс добавляет сразу через add(); чужие подтянутся
+    при следующем поиске. Догружать по _id нельзя: phash пишется, когда
+    загрузка закончилась, а не в порядке создания фото.
+    """
+
+    def __init__(self):
+        self._tree = BKTree()
+        self._ids = set()
+        self._since = None
+        self._lock = threading.Lock()
+
+    def _add(self, value_hash: int, photo_id):
+        if photo_id in self._ids or is_degenerate(value_hash):
+            return
+        self._ids.add(photo_id)
+        self._tree.add(value_hash, photo_id)
+
+    def _refresh(self, db):
+        started = datetime.utcnow()
+        if self._since is None:
+            # Первый раз - все, в том числе посчитанные до hashed_at
+            query = {"phash": {"$exists": True}}
+        else:
+            query = {"hashed_at": {"$gte": self._since - REFRESH_OVERLAP}}
+        for photo in db.photos.find(query, {"phash": 1}):
+            self._add(int(photo["phash"], 16), photo["_id"])
+        self._since = started
+
+    def add(self, value_hash: int, photo_id):
+        with self._lock:
+            self._add(value_hash, photo_id)
+
+    def find(self, db, value_hash: int, radius: int = None):
+        """Ближайшее готовое фото с похожей картинкой или None."""
+        if is_degenerate(value_hash):
+            return None
+        radius = config.PHASH_DISTANCE if radius is None else radius
+        with self._lock:
+            self._refresh(db)
+            candidates = self._tree.search(value_hash, radius)
+        for _, photo_id in candidates:
+            photo = db.photos.find_one(
+                status.visible({"_id": photo_id, "blob_key": {"$exists": True}}),
+                {"blob_key": 1, "thumbs": 1, "phash": 1, "user_id": 1},
+            )
+            if photo is not None:
+                return photo
+        return None
+
+
+duplicates = DuplicateIndex()
+
+
+def check_duplicate(db, value_hash: int, blob_key: str):
+    """(похожее фото или None, можно ли взять его блоб и превью).
+
+    Похожий в пределах PHASH_DISTANCE dHash - ещё не та же картинка, поэтому
+    при DUPLICATE_POLICY=share блоб общий только у тех же байтов или хэшей
+    не дальше PHASH_SHARE_DISTANCE (пересжатый или уменьшенный файл).
+    При DUPLICATE_POLICY=reject на найденный дубликат - DuplicatePhoto.
+    """
+    photo = duplicates.find(db, value_hash)
+    if photo is None:
+        return None, False
+    if config.DUPLICATE_POLICY == REJECT:
+        raise DuplicatePhoto("такое фото уже есть на стене")
+    same = photo["blob_key"] == blob_key or distance(value_hash, int(photo["phash"], 16)) <= config.PHASH_SHARE_DISTANCE
+    return photo, config.DUPLICATE_POLICY == SHARE and same
+
+
+def list_duplicates(db, projection: dict, limit: int) -> list:
+    """[(дубликат, id найденного фото)] для модерации, новые первыми.
+
+    Фото, чей оригинал уже удалён, дубликатом больше не считается.
+    """
+    photos = list(db.photos.find(
+        status.visible({"duplicate_of": {"$exists": True}}),
+        {**projection, "duplicate_of": 1},
+    ).sort("_id", -1).limit(limit))
+    alive = {
+        photo["_id"]
+        for photo in db.photos.find({"_id": {"$in": [p["duplicate_of"] for p in photos]}, **status.VISIBLE}, {"_id": 1})
+    }
+    return [(photo, photo.pop("duplicate_of")) for photo in photos if photo["duplicate_of"] in alive]
+
+
+def backfill(db, store) -> int:
+    """Считает phash для уже загруженных фото."""
+    done = 0
+    for photo in db.photos.find({"blob_key": {"$exists": True}, "phash": {"$exists": False}}, {"blob_key": 1}):
+        fh = store.open(photo["blob_key"])
+        if fh is None:
+            continue
+        with fh:
+            data = fh.read()
+        try:
+            value = dhash_bytes(data)
+        except Exception as e:
+            print(f"❌ phash для {photo['_id']} не посчитан: {e}")
+            continue
+        db.photos.update_one({"_id": photo["_id"]}, {"$set": fields(value)})
+        done += 1
+    return done
+
+
+if __name__ == "__main__":
+    from database import blobs, db
+
+    if db is None:
+        print("❌ DB не подключена!")
+    else:
+        print(f"🔎 phash посчитан для {backfill(db, blobs.get_store())} фото")
@@ -0,0 +1,127 @@
+import heapq
+import math
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database.spatial import TILE_SIZE, cell_key
+
+# Место для нового фото. Стена - сетка слотов с шагом SLOT_PITCH; слот n
+# раскладывается «квадратами»: первые k*k слотов заполняют квадрат k x k
+# от левого верхнего угла, следующие 2k+1 дописывают к нему столбец и
+# строку, так что стена растёт в обе стороны. Слот 0 - прежняя точка
+# (100, 100). Выдаём наименьший освободившийся слот, а если таких нет -
+# следующий после уже выданных: в памяти это куча + счётчик, в MongoDB -
+# коллекция free_slots с сортировкой по _id и документ-счётчик. Обе
+# операции атомарны, поэтому параллельные воркеры не получат один слот
+MARGIN = 100
+GAP = 10
+SLOT_PITCH = TILE_SIZE + GAP
+STATE_ID = "wall"
+
+
+def slot_cell(slot: int):
+    """(столбец, строка) слота."""
+    k = math.isqrt(slot)
+    r = slot - k * k
+    if r <= k:
+        return k, r
+    return 2 * k - r, k
+
+
+def slot_position(slot: int):
+    """(x, y) левого верхнего угла плитки в слоте."""
+    col, row = slot_cell(slot)
+    return MARGIN + col * SLOT_PITCH, MARGIN + row * SLOT_PITCH
+
+
+def placement_fields(slot: int) -> dict:
+    """Поля документа фото для слота."""
+    x, y = slot_position(slot)
+    return {"slot": slot, "position_x": x, "position_y": y, "cell": cell_key(x, y)}
+
+
+def wall_size(used: int) -> int:
+    """Сторона квадратной стены, в которую помещаются слоты 0..used-1."""
+    return 2 * MARGIN + max(1, math.isqrt(max(used - 1, 0)) + 1) * SLOT_PITCH
+
+
+class SlotAllocator:
+    """Тот же алгоритм в памяти: O(log n) на выдачу и освобождение."""
+
+    def __init__(self):
+        self.next = 0
+        self._free = []
+
+    def allocate(self) -> int:
+        if self._free:
+            return heapq.heappop(self._free)
+        self.next += 1
+        return self.next - 1
+
+    def release(self, slot: int):
+        heapq.heappush(self._free, slot)
+
+
+def allocate(db) -> int:
+    # Свободный слот с наименьшим номером - по индексу _id
+    free = db.free_slots.find_one_and_delete({}, sort=[("_id", 1)])
+    if free is not None:
+        return free["_id"]
+    state = db.placement.find_one_and_update(
+        {"_id": STATE_ID},
+        {"$inc": {"next": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return state["next"] - 1
+
+
+def release(db, slot):
+    if slot is None:
+        return
+    try:
+        db.free_slots.insert_one({"_id": slot})
+    except DuplicateKeyError:
+        pass
+
+
+def used_slots(db) -> int:
+    state = db.placement.find_one({"_id": STATE_ID}) or {}
+    return state.get("next", 0)
+
+
+def relayout(db) -> int:
+    """Раздаёт слоты фото без слота (старые, сложенные в одну точку)."""
+    moved = 0
+    for photo in db.photos.find({"slot": {"$exists": False}, "blob_key": {"$exists": True}}, {"_id": 1}).sort("_id", 1):
+        slot = allocate(db)
+        if db.photos.update_one({"_id": photo["_id"], "slot": {"$exists": False}}, {"$set": placement_fields(slot)}).modified_count:
+            moved += 1
+        else:
+            release(db, slot)
+    return moved
+
+
+def reclaim(db) -> int:
+    """Возвращает в free_slots слоты, выданные, но так и не занятые фото
+    (например, процесс упал между выдачей слота и записью фото).
+
+    Запускать, когда загрузки остановлены: слот, который воркер уже
+    получил, но ещё не записал в фото, тоже выглядит потерянным.
+    """
+    taken = set(db.photos.distinct("slot")) | set(db.free_slots.distinct("_id"))
+    lost = [slot for slot in range(used_slots(db)) if slot not in taken]
+    for slot in lost:
+        release(db, slot)
+    return len(lost)
+
+
+if __name__ == "__main__":
+    from database import db
+
+    if db is None:
+        print("❌ DB не подключена!")
+    else:
+        print(f"🧩 Разложено по слотам старых фото: {relayout(db)}")
+        print(f"♻️ Возвращено потерянных слотов: {reclaim(db)}")
@@ -0,0 +1,73 @@
+import math
+
+from pymongo import UpdateOne
+
+# Стена разбита на квадратные ячейки CELL_SIZE x CELL_SIZE. У каждого фото
+# хранится ключ ячейки его левого верхнего угла, и по этому полю есть индекс,
+# поэтому запрос видимой области читает только соседние ячейки, а не всю стену
+CELL_SIZE = 500
+TILE_SIZE = 150  # Размер плитки фото на стене, см. createPhotoElement
+MAX_QUERY_CELLS = 400  # Больше ячеек в $in не перечисляем, фильтруем только по координатам
+# Координаты видимой области, дальше которых стены нет: запрос за её
+# пределами обрезается (webapp). Слоты placement занимают сотни тысяч
+# фото раньше, чем дойдут до этой границы
+MAX_COORD = 10_000_000
+
+
+def cell_key(x: int, y: int) -> str:
+    return f"{math.floor(x / CELL_SIZE)}:{math.floor(y / CELL_SIZE)}"
+
+
+def clamp(value: int) -> int:
+    return max(-MAX_COORD, min(MAX_COORD, value))
+
+
+def cells_for_rect(x0: int, y0: int, x1: int, y1: int, limit: int = MAX_QUERY_CELLS):
+    """Ключи ячеек прямоугольника или None, если их больше ``limit``.
+
+    Число ячеек растёт как квадрат размера области, поэтому сначала оно
+    считается арифметикой и только потом строятся строки.
+    """
+    # Плитка с углом в (x, y) пересекает прямоугольник, если x0 - TILE_SIZE < x < x1,
+    # поэтому область расширяется влево и вверх на размер плитки
+    cx0 = (x0 - TILE_SIZE) // CELL_SIZE
+    cy0 = (y0 - TILE_SIZE) // CELL_SIZE
+    cx1 = x1 // CELL_SIZE
+    cy1 = y1 // CELL_SIZE
+    if cx1 < cx0 or cy1 < cy0:
+        return []
+    if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > limit:
+        return None
+    return [f"{cx}:{cy}" for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+
+
+def viewport_filter(x0: int, y0: int, x1: int, y1: int) -> dict:
+    """Фильтр для db.photos: фото, плитка которых пересекает прямоугольник."""
+    query = {
+        "position_x": {"$gt": x0 - TILE_SIZE, "$lt": x1},
+        "position_y": {"$gt": y0 - TILE_SIZE, "$lt": y1},
+    }
+    cells = cells_for_rect(x0, y0, x1, y1)
+    if cells is not None:
+        query["cell"] = {"$in": cells}
+    return query
+
+
+def backfill_cells(db) -> int:
+    """Проставляет ячейку старым фото (индекс по cell - в database.indexes)."""
+    updates = [
+        UpdateOne({"_id": photo["_id"]}, {"$set": {"cell": cell_key(photo.get("position_x", 0), photo.get("position_y", 0))}})
+        for photo in db.photos.find({"cell": {"$exists": False}}, {"position_x": 1, "position_y": 1})
+    ]
+    if updates:
+        db.photos.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+if __name__ == "__main__":
+    from database import db
+
+    if db is None:
+        print("❌ DB не подключена!")
+    else:
+        print(f"📍 Проставлено ячеек: {backfill_cells(db)}")
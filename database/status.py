@@ -0,0 +1,12 @@
+# Фото из бота сначала лежит в базе как pending, пока bot.ingest качает и
+# обрабатывает картинку. На стене и в счётчиках только готовые фото; у
+# старых документов поля status нет, они тоже готовые
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+VISIBLE = {"status": {"$nin": [PENDING, FAILED]}}
+
+
+def visible(query: dict) -> dict:
+    """Добавляет к запросу по db.photos условие «фото готово»."""
+    return {**query, **VISIBLE} if "status" not in query else {"$and": [query, VISIBLE]}
@@ -0,0 +1,152 @@
+import io
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from config import config
+from database import phash
+
+# Лестница превью: размер - длина короткой стороны, потому что на стене
+# фото обрезается в квадрат (object-fit: cover). Превью не больше оригинала
+SIZES = (64, 150, 400, 1024)
+JPEG_QUALITY = 82
+# Загрузки из бота: больше MAX_PIXELS не декодируем вовсе, а оригинал
+# приводим к JPEG не длиннее max_side
+UPLOAD_FORMATS = ("JPEG", "PNG", "WEBP")
+UPLOAD_QUALITY = 90
+MAX_PIXELS = 50_000_000
+
+_pool = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # Ресайз упирается в CPU, поэтому идёт в отдельных процессах, а не потоках
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=config.THUMBNAIL_WORKERS)
+    return _pool
+
+
+def make_thumbnails(data: bytes) -> dict:
+    """{размер: JPEG-байты} для всех размеров лестницы меньше оригинала."""
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        short_side = min(img.size)
+        result = {}
+        for size in SIZES:
+            if size >= short_side:
+                break
+            scale = size / short_side
+            thumb = img.resize(
+                (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                Image.LANCZOS,
+            )
+            out = io.BytesIO()
+            thumb.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            result[size] = out.getvalue()
+        return result
+
+
+def normalize(data: bytes, max_side: int) -> bytes:
+    """Проверяет картинку и пересохраняет её в JPEG со стороной не больше max_side.
+
+    Битые, слишком большие и неподдерживаемые файлы - ValueError.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format not in UPLOAD_FORMATS:
+                raise ValueError(f"формат {img.format} не поддерживается")
+            if img.width * img.height > MAX_PIXELS:
+                raise ValueError(f"слишком большое изображение {img.width}x{img.height}")
+            img.load()
+            img = ImageOps.exif_transpose(img).convert("RGB")
+    except UnidentifiedImageError:
+        raise ValueError("файл не похож на изображение")
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"не удалось прочитать изображение: {e}")
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=UPLOAD_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def prepare_upload(data: bytes, max_side: int):
+    """(нормализованный JPEG, {размер: превью}, dHash) - за один заход в пул процессов."""
+    normalized = normalize(data, max_side)
+    return normalized, make_thumbnails(normalized), phash.dhash_bytes(normalized)
+
+
+def store_thumbnails(store, thumbnails: dict) -> dict:
+    """Кладёт превью в хранилище блобов; ключи словаря - строки для MongoDB."""
+    return {str(size): store.put(data) for size, data in thumbnails.items()}
+
+
+def build_thumbnails(store, data: bytes) -> dict:
+    """Синхронный путь для загрузки: ресайз в пуле процессов, запись в store."""
+    return store_thumbnails(store, get_pool().submit(make_thumbnails, data).result())
+
+
+def pick_blob(photo: dict, size):
+    """(ключ блоба, окончательный ли он) для запроса ``?size=``: наименьшее
+    превью не меньше size, иначе оригинал.
+
+    Не окончательный - нужного превью у фото нет и отдаётся замена: превью
+    может появиться позже, и тот же URL должен отдать уже его.
+    """
+    if size:
+        thumbs = photo.get("thumbs") or {}
+        wanted = [candidate for candidate in SIZES if candidate >= size]
+        for candidate in wanted:
+            if str(candidate) in thumbs:
+                return thumbs[str(candidate)], candidate == wanted[0]
+        if wanted:
+            return photo.get("blob_key"), False
+    return photo.get("blob_key"), True
+
+
+def backfill(db, store, workers: int) -> int:
+    """Строит превью для фото без них, держа в работе не больше 2*workers картинок."""
+    pending = {}
+    done = 0
+
+    def collect(futures):
+        nonlocal done
+        for future in futures:
+            photo_id = pending.pop(future)
+            try:
+                thumbs = store_thumbnails(store, future.result())
+            except Exception as e:
+                print(f"❌ Превью для {photo_id} не собраны: {e}")
+                continue
+            db.photos.update_one({"_id": photo_id}, {"$set": {"thumbs": thumbs}})
+            done += 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        query = {"blob_key": {"$exists": True}, "thumbs": {"$exists": False}}
+        for photo in db.photos.find(query, {"blob_key": 1}):
+            fh = store.open(photo["blob_key"])
+            if fh is None:
+                continue
+            with fh:
+                data = fh.read()
+            pending[pool.submit(make_thumbnails, data)] = photo["_id"]
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        collect(list(pending))
+    return done
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import blobs, db
+
+    parser = argparse.ArgumentParser(description="Превью для уже загруженных фото")
+    parser.add_argument("--workers", type=int, default=config.THUMBNAIL_WORKERS)
+    args = parser.parse_args()
+
+    if db is None:
+        print("❌ DB не подключена!")
+    else:
+        print(f"🖼 Превью построены для {backfill(db, blobs.get_store(), args.workers)} фото")
@@ -0,0 +1,300 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+
+from bson import json_util
+from pymongo import monitoring
+
+# Метрики в текстовом формате Prometheus без сторонних библиотек: webapp
+# отдаёт их на /metrics, бот в режиме polling - на METRICS_PORT. Значения
+# меняют event loop, потоки пула базы (слушатель команд pymongo) и бот,
+# поэтому запись идёт под общей блокировкой. Метрики объявляются рядом с
+# кодом, который их считает; уже посчитанные где-то ещё значения (лимиты,
+# очередь загрузки) подключаются через bind() и читаются при выдаче
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_COMMAND_MAX_CHARS = 1000
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # значения меток -> значение
+        self._function = function
+        _registry.append(self)
+
+    def bind(self, function):
+        """Значение считает ``function()``: число или {значения меток: число}."""
+        self._function = function
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _samples(self):
+        if self._function is not None:
+            values = self._function()
+            return values if isinstance(values, dict) else {(): values}
+        with _lock:
+            return dict(self._values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(self._samples().items()):
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # По корзине на границу и одна сверх последней, затем сумма
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with _lock:
+            samples = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(samples.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {counts[-1]!r}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        try:
+            lines.extend(metric.render())
+        except Exception:
+            logger.exception("Метрика %s не посчитана", metric.name)
+    return "\n".join(lines) + "\n"
+
+
+# --- HTTP ---
+
+http_requests = Counter("http_requests_total", "HTTP-запросы по маршруту и коду ответа", ("route", "method", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Время до начала ответа", ("route", "method"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP-запросы в обработке")
+
+
+def _route_label(scope) -> str:
+    # Шаблон маршрута (/api/photo/{photo_id}), а не сам путь - иначе меток
+    # столько же, сколько фото. Новые Starlette кладут маршрут в scope,
+    # старые - только endpoint, его ищем среди маршрутов приложения
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "other")
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "other"
+    for route in app.routes:
+        if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+            return route.path
+    return "other"
+
+
+class HTTPMetricsMiddleware:
+    """ASGI-middleware: число, задержка и параллельность запросов по маршрутам."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        observed = False
+
+        async def send_wrapper(message):
+            nonlocal status, observed
+            if message["type"] == "http.response.start":
+                # Потоковые ответы (SSE, ndjson) длятся долго - меряем до заголовков
+                status = message["status"]
+                observed = True
+                http_latency.observe(time.perf_counter() - started, route=_route_label(scope), method=scope["method"])
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = _route_label(scope)
+            if not observed:
+                http_latency.observe(time.perf_counter() - started, route=route, method=scope["method"])
+            http_requests.inc(route=route, method=scope["method"], status=status)
+
+
+# --- MongoDB ---
+
+mongo_latency = Histogram("mongodb_command_duration_seconds", "Время команд MongoDB", ("command", "collection"))
+mongo_failures = Counter("mongodb_command_failures_total", "Команды MongoDB с ошибкой", ("command", "collection"))
+
+_NOISE = ("lsid", "$clusterTime", "$db", "$readPreference", "txnNumber")
+
+
+def _describe(command) -> str:
+    text = json_util.dumps({key: value for key, value in (command or {}).items() if key not in _NOISE})
+    return text if len(text) <= SLOW_COMMAND_MAX_CHARS else text[:SLOW_COMMAND_MAX_CHARS] + "..."
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Слушатель команд pymongo: гистограмма времени и журнал медленных команд.
+
+    ``slow_ms`` - порог журнала в миллисекундах, 0 - не писать.
+    """
+
+    def __init__(self, slow_ms: float = 0):
+        self.slow_ms = slow_ms
+        # Команда нужна при завершении (коллекция, текст для журнала), а в
+        # событиях succeeded/failed её нет. Вызовы идут из разных потоков,
+        # но ключи у них разные, а отдельные операции со словарём атомарны
+        self._started = {}
+
+    @staticmethod
+    def _event_key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        self._started[self._event_key(event)] = event.command
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        command = self._started.pop(self._event_key(event), None) or {}
+        target = command.get(event.command_name)
+        # У getMore первым полем идёт id курсора, коллекция - отдельно
+        collection = target if isinstance(target, str) else command.get("collection", "")
+        seconds = event.duration_micros / 1e6
+        mongo_latency.observe(seconds, command=event.command_name, collection=collection)
+        if failed:
+            mongo_failures.inc(command=event.command_name, collection=collection)
+        if self.slow_ms and seconds * 1000 >= self.slow_ms:
+            logger.warning(
+                "Медленная команда MongoDB %s (%s) %.0f мс: %s",
+                event.command_name, collection, seconds * 1000, _describe(command),
+            )
+
+
+# --- Журнал ---
+
+log_errors = Counter("log_errors_total", "Ошибки, записанные в журнал", ("logger",))
+
+
+class ErrorCounter(logging.Handler):
+    """Считает записи журнала уровня ERROR и выше - так в метриках видны
+    ошибки, которые код ловит и превращает в ответ 200."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record):
+        log_errors.inc(logger=record.name)
+
+
+def count_log_errors():
+    root = logging.getLogger()
+    if not any(isinstance(handler, ErrorCounter) for handler in root.handlers):
+        root.addHandler(ErrorCounter())
+
+
+async def serve(port: int, host: str = "0.0.0.0"):
+    """Минимальный HTTP-сервер с метриками для процессов без webapp (бот в
+    режиме polling). Отвечает метриками на любой GET."""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,122 @@
+import hashlib
+import mimetypes
+import os
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+from webapp import compression
+
+# Оболочка мини-приложения (index.html + css/js) собирается один раз при
+# старте: каждому файлу даём имя с хэшем содержимого, сразу сжимаем gzip и
+# brotli и отдаём из памяти. Хэшированные файлы кэшируются навсегда, а сам
+# index.html проверяется по ETag - после деплоя клиент получит новую
+# страницу со ссылками на новые хэши
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+SHELL = "index.html"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_SIZE = 512
+
+
+class Asset:
+    def __init__(self, data: bytes, media_type: str):
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+        self.bodies = {compression.IDENTITY: data}
+        if len(data) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE):
+            for encoding in compression.ENCODINGS:
+                packed = compression.compress(data, encoding, best=True)
+                if len(packed) < len(data):
+                    self.bodies[encoding] = packed
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        available = [encoding for encoding in compression.ENCODINGS if encoding in self.bodies]
+        encoding = compression.negotiate(request.headers.get("accept-encoding", ""), available)
+        if encoding != compression.IDENTITY:
+            headers["Content-Encoding"] = encoding
+        body = self.bodies[encoding]
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+def _media_type(path: str) -> str:
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def _hashed_name(path: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+class AssetBundle:
+    """ASGI-приложение для app.mount(): отдаёт собранные файлы из памяти."""
+
+    def __init__(self, directory: str = STATIC_DIR, prefix: str = "/static"):
+        self.directory = directory
+        self.prefix = prefix
+        self.assets = {}  # имя с хэшем -> Asset
+        self.names = {}  # исходное имя -> имя с хэшем
+        self.shell = None
+
+    def build(self):
+        assets, names = {}, {}
+        for root, _, files in os.walk(self.directory):
+            for filename in sorted(files):
+                path = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, "/")
+                if path == SHELL:
+                    continue
+                with open(os.path.join(root, filename), "rb") as f:
+                    data = f.read()
+                hashed = _hashed_name(path, data)
+                names[path] = hashed
+                assets[hashed] = Asset(data, _media_type(path))
+
+        with open(os.path.join(self.directory, SHELL), encoding="utf-8") as f:
+            html = f.read()
+        for path, hashed in names.items():
+            html = html.replace(f'"{self.prefix}/{path}"', f'"{self.prefix}/{hashed}"')
+        self.assets, self.names = assets, names
+        self.shell = Asset(html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def url(self, path: str) -> str:
+        return f"{self.prefix}/{self.names.get(path, path)}"
+
+    def shell_response(self, request: Request) -> Response:
+        if self.shell is None:
+            self.build()
+        return self.shell.response(request, REVALIDATE_CACHE)
+
+    async def __call__(self, scope, receive, send):
+        if self.shell is None:
+            self.build()
+        request = Request(scope, receive)
+        path = scope["path"]
+        # Новые версии Starlette оставляют в path префикс монтирования
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        path = path.lstrip("/")
+
+        if request.method not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        elif path in self.assets:
+            response = self.assets[path].response(request, IMMUTABLE_CACHE)
+        elif path in self.names:
+            # Старое имя без хэша - для закэшированных страниц и ручных ссылок
+            response = self.assets[self.names[path]].response(request, REVALIDATE_CACHE)
+        else:
+            response = PlainTextResponse("Not Found", status_code=404)
+        await response(scope, receive, send)
+
+
+bundle = AssetBundle()
@@ -0,0 +1,117 @@
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from fastapi import Header, HTTPException
+
+from config import config
+
+# Вход в мини-приложение. Клиент один раз присылает Telegram initData в
+# /api/session: проверяем подпись Telegram (HMAC-SHA256 с ключом из токена
+# бота) и выдаём свой токен сессии - JSON с user_id и ролями, подписанный
+# HMAC. Лайк и удаление проверяют только эту подпись: ни базы, ни
+# повторной проверки initData на каждый клик
+
+
+@dataclass
+class Session:
+    user_id: int
+    username: str
+    is_admin: bool
+    expires_at: int
+
+
+@functools.lru_cache(maxsize=4)
+def _init_data_key(bot_token: str) -> bytes:
+    # Ключ проверки initData по документации Telegram Web Apps
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+@functools.lru_cache(maxsize=4)
+def _session_key(secret: str, bot_token: str) -> bytes:
+    if secret:
+        return secret.encode()
+    if bot_token:
+        # Без SESSION_SECRET ключ выводится из токена бота - одинаковый во
+        # всех процессах, но не совпадает с ключом initData
+        return hmac.new(b"GraffitiWallSession", bot_token.encode(), hashlib.sha256).digest()
+    return os.urandom(32)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def verify_init_data(init_data: str, now: float = None) -> dict:
+    """Пользователь Telegram из проверенного initData; ValueError, если подпись
+    не сходится или данные устарели."""
+    if not config.BOT_TOKEN:
+        raise ValueError("BOT_TOKEN не задан - проверить initData нечем")
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop("hash", "")
+    check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    expected = hmac.new(_init_data_key(config.BOT_TOKEN), check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise ValueError("подпись initData не сходится")
+    now = time.time() if now is None else now
+    if now - int(fields.get("auth_date", 0)) > config.INIT_DATA_MAX_AGE:
+        raise ValueError("initData устарели")
+    try:
+        return json.loads(fields["user"])
+    except (KeyError, ValueError):
+        raise ValueError("в initData нет пользователя")
+
+
+def issue_token(user: dict, now: float = None) -> tuple:
+    """(токен, Session) для проверенного пользователя Telegram."""
+    now = time.time() if now is None else now
+    session = Session(
+        user_id=int(user["id"]),
+        username=user.get("username") or user.get("first_name") or f"user_{user['id']}",
+        is_admin=int(user["id"]) in config.ADMIN_IDS,
+        expires_at=int(now + config.SESSION_TTL),
+    )
+    payload = _b64encode(json.dumps(
+        {"uid": session.user_id, "name": session.username, "admin": session.is_admin, "exp": session.expires_at},
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode())
+    signature = hmac.new(_session_key(config.SESSION_SECRET, config.BOT_TOKEN), payload.encode(), hashlib.sha256).digest()
+    return f"{payload}.{_b64encode(signature)}", session
+
+
+def verify_token(token: str, now: float = None) -> Session:
+    """Session из токена; ValueError, если он подделан или истёк."""
+    payload, _, signature = token.partition(".")
+    expected = hmac.new(_session_key(config.SESSION_SECRET, config.BOT_TOKEN), payload.encode(), hashlib.sha256).digest()
+    try:
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            raise ValueError("подпись токена не сходится")
+        data = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        raise ValueError("неверный токен сессии")
+    now = time.time() if now is None else now
+    if data["exp"] < now:
+        raise ValueError("сессия истекла")
+    return Session(user_id=data["uid"], username=data["name"], is_admin=data["admin"], expires_at=data["exp"])
+
+
+def require_session(authorization: Optional[str] = Header(None)) -> Session:
+    """Зависимость FastAPI: сессия из заголовка ``Authorization: Bearer <токен>``."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Нужен токен сессии")
+    try:
+        return verify_token(token)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
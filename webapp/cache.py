@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+from config import config
+from database import counters
+from database.aio import run_db
+from webapp import compression, serialization
+from webapp.shared_cache import shared_cache
+
+# Готовые JSON-ответы хранятся байтами и помечены версией стены из
+# db.wall_stats. Любая запись (фото, удаление, лайк) увеличивает версию,
+# и старые ответы перестают совпадать. ETag ответа - та же версия, поэтому
+# опрашивающий клиент получает 304, а мы не трогаем ни базу, ни JSON.
+# Сжатые варианты ответа считаются при первом запросе с нужным
+# Accept-Encoding и живут в той же записи до смены версии. С несколькими
+# воркерами горячие ответы лежат в общем кэше (webapp.shared_cache), а
+# версию стены публикует его ведущий процесс
+
+
+class WallVersion:
+    """Версия стены с локальным кэшем на CACHE_VERSION_TTL секунд.
+
+    Свои записи webapp сбрасывает сразу через invalidate(), записи бота
+    видны не позже чем через TTL. Пока общий кэш обновляется, версия
+    берётся из его заголовка без запроса к базе.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._value = None
+        self._checked_at = 0.0
+
+    async def current(self, db) -> int:
+        shared = shared_cache.version()
+        if shared is not None and self._value is not None:
+            # Своя запись после invalidate() может быть новее снимка:
+            # версия не уменьшается, пока снимок её не догонит
+            self._value = max(self._value, shared)
+            return self._value
+        now = time.monotonic()
+        if self._value is None or now - self._checked_at > self.ttl:
+            self._value = await run_db(counters.read_version, db)
+            self._checked_at = now
+        return self._value
+
+    def invalidate(self):
+        self._value = None
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, version_ttl: float):
+        self.max_entries = max_entries
+        self.version = WallVersion(version_ttl)
+        self._entries = OrderedDict()  # ключ -> (версия, {кодировка: байты})
+
+    def invalidate(self):
+        self.version.invalidate()
+
+    def _get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key, version, bodies: dict):
+        self._entries[key] = (version, bodies)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def respond(self, request: Request, db, key: str, build, shared=None) -> Response:
+        """Ответ из кэша, 304 или свежий ``await build()``, сохранённый в кэш.
+
+        ``shared`` - выборка из общего кэша (shared_cache.entry, viewport):
+        если в нём снимок той же версии, ответ берётся оттуда готовым.
+        """
+        # Версию читаем до данных: если запись случится во время сборки,
+        # ответ уйдёт в кэш со старой версией и просто не будет использован
+        version = await self.version.current(db)
+        etag = f'"w{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        accept_encoding = request.headers.get("accept-encoding", "")
+        bodies = self._get(key, version)
+        if bodies is None and shared is not None:
+            hit = shared_cache.read(version, shared, accept_encoding)
+            if hit is not None:
+                body, encoding = hit
+                if (encoding != compression.IDENTITY or len(body) < config.COMPRESS_MIN_SIZE
+                        or compression.negotiate(accept_encoding) == compression.IDENTITY):
+                    return self._response(body, encoding, headers)
+                # Несжатая выборка (видимая область): сжатый вариант
+                # сохраняем у себя, как и собранный ответ
+                bodies = {compression.IDENTITY: body}
+                self._put(key, version, bodies)
+        if bodies is None:
+            bodies = {compression.IDENTITY: serialization.dumps(await build())}
+            self._put(key, version, bodies)
+
+        body = bodies[compression.IDENTITY]
+        encoding = compression.IDENTITY
+        if len(body) >= config.COMPRESS_MIN_SIZE:
+            encoding = compression.negotiate(accept_encoding)
+        if encoding != compression.IDENTITY:
+            if encoding not in bodies:
+                # Сотни килобайт JSON сжимаются миллисекунды - не держим цикл событий
+                loop = asyncio.get_running_loop()
+                bodies[encoding] = await loop.run_in_executor(None, compression.compress, body, encoding)
+            body = bodies[encoding]
+        return self._response(body, encoding, headers)
+
+    @staticmethod
+    def _response(body: bytes, encoding: str, headers: dict) -> Response:
+        if encoding != compression.IDENTITY:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+response_cache = ResponseCache(config.RESPONSE_CACHE_SIZE, config.CACHE_VERSION_TTL)
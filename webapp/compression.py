@@ -0,0 +1,62 @@
+import gzip
+import zlib
+
+from config import config
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Сжатие ответов по Accept-Encoding. brotli необязателен: без него
+# остаётся gzip. Статика сжимается один раз на максимальном уровне,
+# ответы API - быстрее, зато на каждую новую версию стены
+GZIP = "gzip"
+BROTLI = "br"
+IDENTITY = "identity"
+ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def accepted(accept_encoding: str) -> set:
+    result = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        result.add(name.strip())
+    return result
+
+
+def negotiate(accept_encoding: str, available=ENCODINGS) -> str:
+    """Лучшая кодировка из ``available``, которую принимает клиент."""
+    client = accepted(accept_encoding)
+    for encoding in available:
+        if encoding in client:
+            return encoding
+    return IDENTITY
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=11 if best else config.BROTLI_QUALITY)
+    if encoding == GZIP:
+        return gzip.compress(data, compresslevel=9 if best else config.GZIP_LEVEL, mtime=0)
+    return data
+
+
+async def gzip_stream(chunks):
+    """gzip для потокового ответа: каждая пачка сразу уходит клиенту."""
+    compressor = zlib.compressobj(config.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+import metrics
+from config import config
+from database import changelog, counters
+from database.aio import run_db
+from webapp import serialization
+
+# Живые обновления стены через Server-Sent Events. Событие сериализуется
+# один раз и раскладывается по очередям подписчиков без ожидания; клиента,
+# который не успевает читать, отключаем - EventSource переподключится сам
+# и перезагрузит видимую область
+PHOTO_ADDED = "photo_added"
+PHOTO_REMOVED = "photo_removed"
+LIKES_CHANGED = "likes_changed"
+RESYNC = "resync"
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: dict):
+        message = b"data: " + serialization.dumps(event) + b"\n\n"
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Освобождаем место под None - сигнал потоку закрыться
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def stream(self, request: Request, heartbeat: float):
+        queue = self.subscribe()
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    message = b": ping\n\n"
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(queue)
+
+    def response(self, request: Request) -> StreamingResponse:
+        return StreamingResponse(
+            self.stream(request, config.EVENTS_HEARTBEAT),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+
+broadcaster = Broadcaster(config.EVENTS_QUEUE_SIZE)
+metrics.Gauge("sse_subscribers", "Открытые потоки /api/events", function=lambda: len(broadcaster))
+
+
+async def watch_changes(db, projection: dict, prepare):
+    """Фоновая задача: рассылает подписчикам изменения из журнала стены.
+
+    Журнал общий для всех процессов, поэтому подписчики видят и загрузки
+    через бота, и лайки/удаления, прошедшие через другой процесс webapp.
+    Пока подписчиков нет, база не опрашивается.
+    """
+    last_seq = await run_db(counters.read_version, db)
+    while True:
+        await asyncio.sleep(config.EVENTS_POLL_INTERVAL)
+        if not broadcaster:
+            continue
+        try:
+            current = await run_db(counters.read_version, db)
+            if current == last_seq:
+                continue
+            delta = await run_db(changelog.changes_since, db, last_seq, current, projection)
+            if delta is None:
+                # Журнал уже не покрывает пропущенное - пусть клиенты перечитают стену
+                last_seq = current
+                broadcaster.publish({"type": RESYNC, "seq": current})
+                continue
+            last_seq, changes = delta
+            for op, photo_id, doc in changes:
+                if op == changelog.ADD:
+                    broadcaster.publish({"type": PHOTO_ADDED, "seq": last_seq, "photo": prepare(doc)})
+                elif op == changelog.LIKES:
+                    broadcaster.publish({"type": LIKES_CHANGED, "seq": last_seq, "photo_id": str(photo_id), "likes": doc.get("likes", 0)})
+                else:
+                    broadcaster.publish({"type": PHOTO_REMOVED, "seq": last_seq, "photo_id": str(photo_id)})
+        except Exception:
+            logger.exception("Events poll error")
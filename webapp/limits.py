@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException, Request
+
+import metrics
+from config import config
+import database
+from database import aio, bootstrap
+from webapp import auth
+
+# Защита от скриптов, которые долбят лайки и картинки. Два уровня:
+# - ограничение частоты: корзина токенов на ключ (пользователь или IP),
+#   корзины лежат в LRU ограниченного размера - память не растёт от
+#   перебора IP, а вытесненная корзина просто начинается заново полной;
+# - сброс нагрузки: если в очереди к базе (database.aio.inflight) уже
+#   слишком много операций, запись и картинки сразу получают 503, а
+#   чтения - только при ещё более глубокой очереди. /health не ограничен
+
+
+class RateLimiter:
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int):
+        self.name = name
+        self.rate = rate  # токенов в секунду
+        self.burst = burst
+        self.max_keys = max_keys
+        self.rejected = 0
+        self._buckets = OrderedDict()  # ключ -> (токены, время обновления)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def hit(self, key, cost: float = 1, now: float = None) -> float:
+        """0, если запрос разрешён, иначе сколько секунд подождать."""
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= cost:
+            tokens -= cost
+            wait = 0.0
+        else:
+            wait = (cost - tokens) / self.rate
+            self.rejected += 1
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def check(self, key):
+        wait = self.hit(key)
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Слишком много запросов, попробуйте позже",
+                headers={"Retry-After": str(max(1, round(wait)))},
+            )
+
+
+def client_ip(request: Request) -> str:
+    # За прокси Render адрес клиента подставляет uvicorn --proxy-headers
+    return request.client.host if request.client else "unknown"
+
+
+writes_by_ip = RateLimiter("writes_ip", config.RATE_WRITES_PER_IP, config.RATE_WRITES_BURST, config.RATE_LIMIT_MAX_KEYS)
+likes_by_user = RateLimiter("likes_user", config.RATE_LIKES_PER_USER, config.RATE_LIKES_BURST, config.RATE_LIMIT_MAX_KEYS)
+images_by_ip = RateLimiter("images_ip", config.RATE_IMAGES_PER_IP, config.RATE_IMAGES_BURST, config.RATE_LIMIT_MAX_KEYS)
+limiters = (writes_by_ip, likes_by_user, images_by_ip)
+
+shed = {"writes": 0, "reads": 0}
+
+metrics.Counter(
+    "rate_limited_total", "Запросы, отклонённые ограничением частоты", ("limiter",),
+    function=lambda: {(limiter.name,): limiter.rejected for limiter in limiters},
+)
+metrics.Counter(
+    "load_shed_total", "Запросы, сброшенные при глубокой очереди к базе", ("kind",),
+    function=lambda: {(kind,): count for kind, count in shed.items()},
+)
+
+
+def _shed(kind: str, threshold: int):
+    if aio.inflight() >= threshold:
+        shed[kind] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Сервер перегружен, попробуйте позже",
+            headers={"Retry-After": "1"},
+        )
+
+
+def shed_writes():
+    _shed("writes", config.SHED_WRITES_INFLIGHT)
+
+
+def shed_reads():
+    _shed("reads", config.SHED_READS_INFLIGHT)
+
+
+def require_ready():
+    # До конца database.bootstrap запись может испортить базу (дубли лайков,
+    # журнал не capped); клиент повторит через несколько секунд
+    if not bootstrap.is_ready():
+        raise HTTPException(
+            status_code=503,
+            detail="База ещё готовится, попробуйте позже",
+            headers={"Retry-After": "5"},
+        )
+
+
+def require_db():
+    # Клиент базы создаётся в пуле потоков (database.connect); на event loop
+    # его не создаём, а отвечаем, что база ещё не готова
+    if config.MONGODB_URL and not database.is_open():
+        raise HTTPException(
+            status_code=503,
+            detail="База ещё не подключена, попробуйте позже",
+            headers={"Retry-After": "5"},
+        )
+
+
+def limit_writes(request: Request, _=Depends(shed_writes)):
+    writes_by_ip.check(client_ip(request))
+
+
+def limit_images(request: Request, _=Depends(shed_writes)):
+    images_by_ip.check(client_ip(request))
+
+
+def limit_likes(_=Depends(limit_writes), session: auth.Session = Depends(auth.require_session)) -> auth.Session:
+    """Сессия пользователя, если он не превысил частоту лайков."""
+    likes_by_user.check(session.user_id)
+    return session
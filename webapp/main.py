@@ -1,10 +1,55 @@
-from fastapi import FastAPI, Response
-from fastapi.responses import HTMLResponse, RedirectResponse
+import asyncio
+import hmac
+import io
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+# Журнал настраиваем до импорта database - он пишет о подключении сразу
+logging.basicConfig(level=logging.INFO)
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from bson import ObjectId, Binary
+from bson import ObjectId
+
+import database
+import metrics
+from config import config
+from database import blobs, bootstrap, changelog, counters, leaderboard, likes, phash, placement, spatial, status, thumbnails
+from database.aio import run_db, wait_for_db
+from webapp import auth, compression, events, limits, media, pagination, serialization
+from webapp.assets import bundle
+from webapp.cache import response_cache
+from webapp.events import broadcaster
+from webapp.shared_cache import CELLS, shared_cache
+
+logger = logging.getLogger(__name__)
+metrics.count_log_errors()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Старт и остановка приложения; сами шаги - ниже, рядом с тем, что
+    # они запускают
+    await connect_db()
+    await build_static_bundle()
+    start_database_setup()
+    start_events_watcher()
+    start_blob_collector()
+    start_shared_cache()
+    webhook = getattr(app.state, "webhook", None)
+    if webhook is not None:
+        await webhook.start()
+    yield
+    # Бот первым: загрузке фото при остановке ещё нужна база
+    if webhook is not None:
+        await webhook.stop()
+    stop_background_tasks()
+    shutdown_db_pool()
 
 # СНАЧАЛА создаем app
-app = FastAPI(title="Graffiti Wall")
+app = FastAPI(title="Graffiti Wall", lifespan=lifespan)
 
 # ПОТОМ middleware
 app.add_middleware(
@@ -14,821 +59,463 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Снаружи CORS, чтобы в задержку попадал весь путь запроса
+app.add_middleware(metrics.HTTPMetricsMiddleware)
 
-# И только ПОТОМ остальные импорты (если нужны)
-try:
-    from database import db
-    print("✅ MongoDB подключена!")
-except ImportError as e:
-    print(f"❌ MongoDB не подключена: {e}")
-    db = None
-
-@app.get("/webapp")
-async def webapp_page():
-    html_content = '''
-    <!DOCTYPE html>
-    <html lang="ru">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>🎨 Graffiti Wall</title>
-        <script src="https://telegram.org/js/telegram-web-app.js"></script>
-        <style>
-    * {
-        margin: 0;
-        padding: 0;
-        box-sizing: border-box;
-    }
-    body {
-        background: #1a1a1a;
-        font-family: "Segoe UI", sans-serif;
-        color: white;
-        overflow: hidden;
-        touch-action: none;
-    }
-    .header {
-        background: rgba(0,0,0,0.95);
-        padding: 8px 15px;
-        position: fixed;
-        top: 0;
-        width: 100%;
-        z-index: 1000;
-        backdrop-filter: blur(15px);
-        border-bottom: 1px solid rgba(255,255,255,0.1);
-        height: auto;
-        min-height: 70px;
-    }
-
-    .stats {
-        display: flex;
-        justify-content: center;
-        gap: 15px;
-        margin: 5px 0;
-        flex-wrap: wrap;
-    }
-
-    .stat {
-        background: rgba(255,255,255,0.15);
-        padding: 6px 12px;
-        border-radius: 12px;
-        font-size: 0.85rem;
-        backdrop-filter: blur(5px);
-        border: 1px solid rgba(255,255,255,0.1);
-    }
-
-    .wall-container {
-        margin-top: 80px;
-        height: calc(100vh - 80px);
-        overflow: scroll;
-        cursor: grab;
-        -webkit-overflow-scrolling: touch;
-    }
-    .wall {
-        position: relative;
-        width: 2000px;
-        height: 2000px;
-        background: #2d2d2d;
-        transition: transform 0.1s ease-out;
-    }
-    .photo {
-        position: absolute;
-        border-radius: 8px;
-        overflow: hidden;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.3);
-        transition: transform 0.2s, box-shadow 0.2s;
-        touch-action: none;
-        cursor: pointer;
-    }
-    .photo:hover {
-        transform: scale(1.05);
-        box-shadow: 0 8px 25px rgba(0,0,0,0.5);
-        z-index: 100;
-    }
-    .photo img {
-        width: 100%;
-        height: 100%;
-        object-fit: cover;
-        pointer-events: none;
-    }
-    .photo-credits {
-    position: absolute;
-    bottom: 5px;
-    left: 5px;
-    background: rgba(0,0,0,0.3); /* Было 0.7, стало 0.5 - прозрачнее */
-    color: white;
-    padding: 3px 8px;
-    border-radius: 10px;
-    font-size: 0.7rem;
-    backdrop-filter: blur(5px);
-    pointer-events: none;
-    opacity: 0.4; /* Добавляем общую прозрачность */
-}
-
-.photo-likes {
-    position: absolute;
-    top: 5px;
-    right: 5px;
-    background: rgba(0,0,0,0.3); /* Было 0.7 */
-    color: white;
-    padding: 2px 6px;
-    border-radius: 10px;
-    font-size: 0.6rem;
-    backdrop-filter: blur(5px);
-    pointer-events: none;
-    opacity: 0.4;
-}
-    }
-    .loading {
-        text-align: center;
-        padding: 50px;
-        font-size: 1.2rem;
-    }
-    
-    /* Мобильные контролы */
-    .mobile-controls {
-        position: fixed;
-        bottom: 20px;
-        right: 20px;
-        z-index: 1000;
-        display: flex;
-        flex-direction: column;
-        gap: 10px;
-    }
-    
-    .zoom-btn {
-        width: 50px;
-        height: 50px;
-        border-radius: 50%;
-        background: rgba(0,0,0,0.8);
-        color: white;
-        border: 1px solid rgba(255,255,255,0.2);
-        font-size: 20px;
-        cursor: pointer;
-        backdrop-filter: blur(10px);
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        user-select: none;
-        transition: all 0.2s ease;
-    }
-    
-    .zoom-btn:active {
-        background: rgba(255,255,255,0.2);
-        transform: scale(0.95);
-    }
-    
-    /* Кнопки действий в модалке */
-    .action-buttons {
-        position: absolute;
-        top: 20px;
-        right: 20px;
-        display: flex;
-        gap: 10px;
-        z-index: 10001;
-    }
-    
-    .action-btn {
-    background: rgba(0,0,0,0.6); /* Было 0.7 */
-    color: white;
-    border: none;
-    padding: 10px 15px;
-    border-radius: 20px;
-    cursor: pointer;
-    backdrop-filter: blur(10px);
-    font-size: 0.9rem;
-    transition: all 0.2s ease;
-    opacity: 0.3;
-}
-    
-    .action-btn:hover {
-        background: rgba(255,255,255,0.2);
-    }
-    
-    .like-btn {
-        background: rgba(255,0,0,0.7);
-    }
-    
-    .like-btn.liked {
-        background: rgba(255,0,0,0.9);
-    }
-    
-    .delete-btn {
-        background: rgba(255,0,0,0.7);
-    }
-    
-    /* Скрыть контролы на десктопе */
-    @media (min-width: 768px) {
-        .mobile-controls {
-            display: flex;
-        }
-    }
-</style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>🎨 Graffiti Wall</h1>
-            <p>Интерактивная галерея фотографий</p>
-            <div class="stats">
-                <div class="stat" id="total-photos">📸 Фото: 0</div>
-                <div class="stat" id="total-users">👥 Участники: 0</div>
-                <div class="stat" id="total-likes">❤️ Лайки: 0</div>
-            </div>
-        </div>
-        
-        <div class="wall-container" id="wall-container">
-            <div class="wall" id="wall"></div>
-        </div>
-        
-        <!-- Мобильные контролы -->
-        <div class="mobile-controls">
-            <button class="zoom-btn" onclick="zoomIn()" title="Приблизить">+</button>
-            <button class="zoom-btn" onclick="zoomOut()" title="Отдалить">-</button>
-            <button class="zoom-btn" onclick="resetZoom()" title="Сбросить зум" style="font-size:16px;">⟲</button>
-            <button class="zoom-btn" onclick="showFullWall()" title="Показать всю стену" style="font-size:14px;">🏞️</button>
-        </div>
-            
-        <div class="loading" id="loading">⏳ Загружаем галерею...</div>
-
-        <script>
-let wallScale = 1;
-let isDragging = false;
-let startX, startY, scrollLeft, scrollTop;
-let initialDistance = null;
-let currentUser = null;
-
-// Получаем данные пользователя из Telegram Web App
-try {
-    if (window.Telegram && Telegram.WebApp) {
-        currentUser = Telegram.WebApp.initDataUnsafe.user;
-    }
-} catch (e) {
-    console.log('Telegram Web App not available');
-}
-
-async function loadGallery() {
-    try {
-        document.getElementById('loading').style.display = 'block';
-        
-        // Загружаем статистику
-        const statsResponse = await fetch('/api/stats');
-        const stats = await statsResponse.json();
-        
-        document.getElementById('total-photos').textContent = `📸 Фото: ${stats.total_photos}`;
-        document.getElementById('total-users').textContent = `👥 Участники: ${stats.total_users}`;
-        document.getElementById('total-likes').textContent = `❤️ Лайки: ${stats.total_likes}`;
-        
-        // Загружаем фото
-        const photosResponse = await fetch('/api/photos');
-        const photos = await photosResponse.json();
-        
-        const wall = document.getElementById('wall');
-        wall.innerHTML = '';
-        
-        if (photos.length === 0) {
-            wall.innerHTML = '<div style="text-align: center; padding: 40px; color: #666;">🎨 Пока нет фото на стене. Будьте первым!</div>';
-        } else {
-            photos.forEach(photo => {
-                const photoElement = document.createElement('div');
-                photoElement.className = 'photo';
-                photoElement.style.left = photo.position_x + 'px';
-                photoElement.style.top = photo.position_y + 'px';
-                photoElement.style.width = '150px';
-                photoElement.style.height = '150px';
-                
-                // Проверяем лайкнул ли пользователь это фото
-                const userLiked = currentUser && photo.liked_by && photo.liked_by.includes(currentUser.id);
-                
-                // РЕАЛЬНЫЕ ФОТО ИЗ MONGODB
-                photoElement.innerHTML = `
-                    <img src="${photo.image_url}" 
-                         alt="Фото от @${photo.username}" 
-                         loading="lazy"
-                         style="width:100%;height:100%;object-fit:cover;border-radius:8px;">
-                    <div class="photo-credits">@${photo.username}</div>
-                    <div class="photo-likes">❤️ ${photo.likes}</div>
-                `;
-                
-                // Добавляем клик для открытия модалки
-                photoElement.onclick = (e) => {
-                    e.stopPropagation();
-                    showPhotoModal(photo, userLiked);
-                };
-                
-                wall.appendChild(photoElement);
-            });
-        }
-        
-        document.getElementById('loading').style.display = 'none';
-        
-    } catch (error) {
-        document.getElementById('loading').innerHTML = '❌ Ошибка загрузки галереи';
-        console.error('Error:', error);
-    }
-}
-
-// Функция показа модалки с фото и кнопками
-async function showPhotoModal(photo, userLiked) {
-    const modal = document.createElement('div');
-    modal.style.cssText = `
-        position: fixed;
-        top: 0;
-        left: 0;
-        width: 100vw;
-        height: 100vh;
-        background: rgba(0,0,0,0.8); // фон сзади 
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        z-index: 10000;
-        cursor: zoom-out;
-    `;
-    
-    // Проверяем является ли пользователь админом
-    let isAdmin = false;
-    if (currentUser) {
-        try {
-            const response = await fetch(`/api/is_admin/${currentUser.id}`);
-            const result = await response.json();
-            isAdmin = result.is_admin;
-        } catch (error) {
-            console.error('Admin check error:', error);
-        }
-    }
-    
-    modal.innerHTML = `
-        <div style="max-width: 90vw; max-height: 90vh; position: relative;">
-            <img src="${photo.image_url}" 
-                 alt="Фото от @${photo.username}"
-                 style="max-width: 90vw; max-height: 90vh; border-radius: 15px;">
-            <div class="action-buttons">
-                <button class="action-btn like-btn ${userLiked ? 'liked' : ''}" onclick="likePhoto('${photo._id}', this)">
-                    ❤️ ${photo.likes}
-                </button>
-                ${isAdmin ? `<button class="action-btn delete-btn" onclick="deletePhoto('${photo._id}')">🗑️ Удалить</button>` : ''}
-            </div>
-           <div style="position: absolute; bottom: 15px; left: 15px; background: rgba(0,0,0,0.0); padding: 10px 15px; border-radius: 10px;">
-    <strong style="color: rgba(0,0,0,1.9);">@${photo.username}</strong><br>
-    <span style="color: rgba(0,0,0,1.0);">❤️ ${photo.likes} лайков</span><br>
-    <span style="color: rgba(0,0,0,1.9);">Позиция: ${photo.position_x}, ${photo.position_y}</span>
-</div>
-        </div>
-    `;
-    
-    modal.onclick = () => document.body.removeChild(modal);
-    document.body.appendChild(modal);
-}
-
-// Функция лайка фото
-async function likePhoto(photoId, button) {
-    if (!currentUser) {
-        alert('⚠️ Необходимо открыть через Telegram бота для лайков');
-        return;
-    }
-    
-    try {
-        const response = await fetch('/api/like', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                photo_id: photoId,
-                user_id: currentUser.id,
-                username: currentUser.username || `user_${currentUser.id}`
-            })
-        });
-        
-        const result = await response.json();
-        
-        if (result.success) {
-            button.classList.toggle('liked');
-            button.innerHTML = `❤️ ${result.new_likes}`;
-            loadGallery();
-        } else {
-            alert('❌ ' + result.error);
-        }
-    } catch (error) {
-        console.error('Like error:', error);
-        alert('❌ Ошибка при лайке');
-    }
-}
-
-// Функция удаления фото (для админа)
-async function deletePhoto(photoId) {
-    if (!currentUser) {
-        alert('⚠️ Необходимо открыть через Telegram бота');
-        return;
-    }
-    
-    if (!confirm('🗑️ Удалить это фото?')) return;
-    
-    try {
-        const response = await fetch('/api/delete_photo', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                photo_id: photoId,
-                user_id: currentUser.id
-            })
-        });
-        
-        const result = await response.json();
-        
-        if (result.success) {
-            alert('✅ Фото удалено');
-            document.body.removeChild(document.body.lastChild);
-            loadGallery();
-        } else {
-            alert('❌ ' + result.error);
-        }
-    } catch (error) {
-        console.error('Delete error:', error);
-        alert('❌ Ошибка при удалении');
-    }
-}
+app.mount("/static", bundle, name="static")
 
-// Функция показа всей стены
-function showFullWall() {
-    const container = document.getElementById('wall-container');
-    const wall = document.getElementById('wall');
-    
-    const containerWidth = container.clientWidth;
-    const containerHeight = container.clientHeight;
-    const wallWidth = 2000;
-    const wallHeight = 2000;
-    
-    const scaleX = containerWidth / wallWidth;
-    const scaleY = containerHeight / wallHeight;
-    const minScale = Math.min(scaleX, scaleY) * 0.9;
-    
-    wallScale = Math.max(minScale, 0.1);
-    updateWallScale();
-    
-    container.scrollLeft = (wallWidth * wallScale - containerWidth) / 2;
-    container.scrollTop = (wallHeight * wallScale - containerHeight) / 2;
-}
-
-// Функции для навигации по стене
-function setupWallNavigation() {
-    const container = document.getElementById('wall-container');
-    const wall = document.getElementById('wall');
-    
-    let isDragging = false;
-    let startX, startY, scrollLeft, scrollTop;
-    let initialDistance = null;
-    let lastScale = wallScale;
-
-    container.addEventListener('mousedown', (e) => {
-        isDragging = true;
-        startX = e.pageX - container.offsetLeft;
-        startY = e.pageY - container.offsetTop;
-        scrollLeft = container.scrollLeft;
-        scrollTop = container.scrollTop;
-        container.style.cursor = 'grabbing';
-    });
-
-    container.addEventListener('mouseup', () => {
-        isDragging = false;
-        container.style.cursor = 'grab';
-    });
-
-    container.addEventListener('mousemove', (e) => {
-        if (!isDragging) return;
-        e.preventDefault();
-        const x = e.pageX - container.offsetLeft;
-        const y = e.pageY - container.offsetTop;
-        const walkX = (x - startX) * 2;
-        const walkY = (y - startY) * 2;
-        container.scrollLeft = scrollLeft - walkX;
-        container.scrollTop = scrollTop - walkY;
-    });
-
-    container.addEventListener('touchstart', (e) => {
-        if (e.touches.length === 1) {
-            isDragging = true;
-            startX = e.touches[0].pageX - container.offsetLeft;
-            startY = e.touches[0].pageY - container.offsetTop;
-            scrollLeft = container.scrollLeft;
-            scrollTop = container.scrollTop;
-        } else if (e.touches.length === 2) {
-            isDragging = false;
-            initialDistance = getDistance(e.touches[0], e.touches[1]);
-            lastScale = wallScale;
-        }
-    });
-
-    container.addEventListener('touchend', () => {
-        isDragging = false;
-        initialDistance = null;
-    });
-
-    container.addEventListener('touchmove', (e) => {
-        if (e.touches.length === 1 && isDragging) {
-            e.preventDefault();
-            const x = e.touches[0].pageX - container.offsetLeft;
-            const y = e.touches[0].pageY - container.offsetTop;
-            const walkX = (x - startX) * 2;
-            const walkY = (y - startY) * 2;
-            container.scrollLeft = scrollLeft - walkX;
-            container.scrollTop = scrollTop - walkY;
-        } else if (e.touches.length === 2 && initialDistance !== null) {
-            e.preventDefault();
-            const currentDistance = getDistance(e.touches[0], e.touches[1]);
-            const scaleChange = (currentDistance - initialDistance) * 0.001;
-            
-            wallScale = Math.min(Math.max(0.3, lastScale + scaleChange), 3);
-            updateWallScale();
-        }
-    });
-
-    container.addEventListener('wheel', (e) => {
-        e.preventDefault();
-        const delta = -e.deltaY * 0.002;
-        wallScale = Math.min(Math.max(0.3, wallScale + delta), 3);
-        updateWallScale();
-    });
-}
-
-function getDistance(touch1, touch2) {
-    return Math.sqrt(
-        Math.pow(touch2.pageX - touch1.pageX, 2) +
-        Math.pow(touch2.pageY - touch1.pageY, 2)
-    );
-}
-
-function zoomIn() {
-    const targetScale = Math.min(wallScale + 0.2, 3);
-    animateZoom(targetScale);
-}
-
-function zoomOut() {
-    const targetScale = Math.max(wallScale - 0.2, 0.3);
-    animateZoom(targetScale);
-}
-
-function resetZoom() {
-    animateZoom(1);
-    setTimeout(() => {
-        const container = document.getElementById('wall-container');
-        container.scrollLeft = 500;
-        container.scrollTop = 500;
-    }, 300);
-}
-
-function animateZoom(targetScale) {
-    const wall = document.getElementById('wall');
-    const startScale = wallScale;
-    const duration = 300;
-    const startTime = performance.now();
-    
-    function animate(currentTime) {
-        const elapsed = currentTime - startTime;
-        const progress = Math.min(elapsed / duration, 1);
-        
-        const easeProgress = 1 - Math.pow(1 - progress, 3);
-        wallScale = startScale + (targetScale - startScale) * easeProgress;
-        updateWallScale();
-        
-        if (progress < 1) {
-            requestAnimationFrame(animate);
-        }
-    }
-    
-    requestAnimationFrame(animate);
-}
-
-function updateWallScale() {
-    const wall = document.getElementById('wall');
-    wall.style.transform = `scale(${wallScale})`;
-    wall.style.transformOrigin = '0 0';
-    
-    const container = document.getElementById('wall-container');
-    if (wallScale > 1) {
-        container.style.cursor = 'grab';
-    } else {
-        container.style.cursor = 'default';
-    }
-}
-
-document.addEventListener('DOMContentLoaded', function() {
-    loadGallery();
-    setupWallNavigation();
-    setTimeout(() => resetZoom(), 100);
-});
+# Бот в режиме webhook обслуживается этим же приложением
+if config.BOT_WEBHOOK:
+    from bot.webhook import setup_webhook
+    setup_webhook(app)
 
-setInterval(loadGallery, 30000);
-</script>
-    </body>
-    </html>
-    '''
-    return HTMLResponse(content=html_content)
+@app.get("/webapp")
+async def webapp_page(request: Request):
+    return bundle.shell_response(request)
 
 @app.get("/")
 async def root():
     return RedirectResponse(url="/webapp")
     
-@app.get("/api/top_users")
-async def get_top_users():
+@app.get("/api/top_users", dependencies=[Depends(limits.require_db), Depends(limits.shed_reads)])
+async def get_top_users(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=leaderboard.MAX_LIMIT),
+):
     try:
         from database import db
         if db is None:
             return []
         
-        # Агрегация для топа пользователей
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$user_id",
-                    "username": {"$first": "$username"},
-                    "total_photos": {"$sum": 1},
-                    "total_likes": {"$sum": "$likes"},
-                    "avg_likes": {"$avg": "$likes"}
-                }
-            },
-            {"$sort": {"total_likes": -1}},
-            {"$limit": 10}
-        ]
-        
-        top_users = list(db.photos.aggregate(pipeline))
+        key = f"top_users:{offset}:{limit}"
+        return await response_cache.respond(
+            request, db, key,
+            lambda: run_db(leaderboard.top, db, offset, limit),
+            shared=shared_cache.entry(key),
+        )
         
-        # Преобразуем результат
-        for user in top_users:
-            user['user_id'] = user['_id']
-            del user['_id']
+    except Exception:
+        logger.exception("Top users error")
+        return []
+
+@app.get("/api/top_users/{user_id}", dependencies=[Depends(limits.require_db), Depends(limits.shed_reads)])
+async def get_user_rank(user_id: int, request: Request):
+    try:
+        from database import db
+        if db is None:
+            return {"user_id": user_id, "rank": None}
+        
+        async def build():
+            entry = await run_db(leaderboard.rank_of, db, user_id)
+            return entry or {"user_id": user_id, "rank": None}
+        
+        return await response_cache.respond(request, db, f"rank:{user_id}", build)
+        
+    except Exception:
+        logger.exception("User rank error")
+        return {"user_id": user_id, "rank": None}
+        
+# Только поля, которые рисует страница (static/js/script.js), плюс _id.
+# Список разрешённых, а не запрещённых: новое служебное поле фото (блоб,
+# слот, phash, статус загрузки) само наружу не попадёт. Эта же проекция -
+# в журнале изменений, событиях и общем кэше
+PHOTO_LIST_PROJECTION = {'username': 1, 'likes': 1, 'position_x': 1, 'position_y': 1}
+
+def prepare_photo(photo):
+    photo['_id'] = str(photo['_id'])
+    photo.setdefault('likes', 0)
+    photo['image_url'] = f"/api/photo/{photo['_id']}"
+    return photo
+
+@app.get("/api/photos", dependencies=[Depends(limits.require_db), Depends(limits.shed_reads)])
+async def get_photos(
+    request: Request,
+    x0: Optional[int] = None,
+    y0: Optional[int] = None,
+    x1: Optional[int] = None,
+    y1: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = "json",
+):
+    viewport = (x0, y0, x1, y1)
+    if any(v is None for v in viewport) and any(v is not None for v in viewport):
+        raise HTTPException(status_code=400, detail="Нужны все четыре координаты x0, y0, x1, y1")
+    if x0 is not None:
+        if x0 > x1 or y0 > y1:
+            raise HTTPException(status_code=400, detail="Нужно x0 <= x1 и y0 <= y1")
+        # За границами стены фото нет - огромная область не стоит ничего
+        viewport = x0, y0, x1, y1 = tuple(spatial.clamp(v) for v in viewport)
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format должен быть json или ndjson")
+
+    after = None
+    if cursor is not None:
+        try:
+            after = pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        from database import db
+        query = status.visible(spatial.viewport_filter(*viewport) if x0 is not None else {})
+        projection = PHOTO_LIST_PROJECTION
+
+        # Потоковый режим: по строке JSON на фото, база читается пачками
+        if format == "ndjson":
+            if db is None:
+                return StreamingResponse(iter(()), media_type="application/x-ndjson")
+            chunks = pagination.iter_ndjson(run_db, db, query, projection, prepare_photo)
+            headers = {"Vary": "Accept-Encoding"}
+            if compression.negotiate(request.headers.get("accept-encoding", ""), (compression.GZIP,)) == compression.GZIP:
+                chunks = compression.gzip_stream(chunks)
+                headers["Content-Encoding"] = compression.GZIP
+            return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+        # Постраничный режим: {"photos": [...], "next_cursor": "..."}
+        if limit is not None or cursor is not None:
+            if db is None:
+                return {"photos": [], "next_cursor": None}
+            page_size = limit or pagination.DEFAULT_PAGE_SIZE
             
-        return top_users
-        
-    except Exception as e:
-        print(f"Top users error: {e}")
+            async def build():
+                photos = await run_db(pagination.fetch_page, db, query, projection, after, page_size)
+                next_cursor = pagination.encode_cursor(photos[-1]['_id']) if len(photos) == page_size else None
+                return {"photos": [prepare_photo(photo) for photo in photos], "next_cursor": next_cursor}
+            shared = None
+        else:
+            if db is None:
+                return []
+            
+            async def build():
+                photos = await run_db(lambda: list(db.photos.find(query, projection)))
+                return [prepare_photo(photo) for photo in photos]
+            shared = shared_cache.viewport(*viewport) if x0 is not None else shared_cache.entry("photos?")
+        
+        return await response_cache.respond(request, db, f"photos?{request.url.query}", build, shared=shared)
+    except Exception:
+        logger.exception("API Photos Error")
         return []
-        
-@app.get("/api/photos")
-async def get_photos():
+
+@app.get("/api/photos/changes", dependencies=[Depends(limits.require_db), Depends(limits.shed_reads)])
+async def get_photo_changes(request: Request, since: int = Query(..., ge=0)):
+    try:
+        from database import db
+        if db is None:
+            return {"snapshot": True, "seq": 0, "photos": []}
+        
+        async def build():
+            # Версию читаем до данных: всё, что изменится дальше, клиент
+            # получит следующим запросом
+            current = await run_db(counters.read_version, db)
+            delta = await run_db(changelog.changes_since, db, since, current, PHOTO_LIST_PROJECTION)
+            if delta is None:
+                photos = await run_db(lambda: list(db.photos.find(status.VISIBLE, PHOTO_LIST_PROJECTION)))
+                return {"snapshot": True, "seq": current, "photos": [prepare_photo(photo) for photo in photos]}
+            
+            seq, changes = delta
+            return {
+                "snapshot": False,
+                "seq": seq,
+                "upserts": [prepare_photo(doc) for op, photo_id, doc in changes if op != changelog.DELETE],
+                "deletes": [str(photo_id) for op, photo_id, doc in changes if op == changelog.DELETE],
+            }
+        
+        return await response_cache.respond(request, db, f"changes:{since}", build)
+    except Exception:
+        # Пустой снимок стёр бы стену у клиента - пусть повторит запрос позже
+        logger.exception("Photo changes error")
+        raise HTTPException(status_code=503, detail="Журнал изменений недоступен")
+
+@app.get("/api/my_likes", dependencies=[Depends(limits.require_db), Depends(limits.shed_reads)])
+async def get_my_likes(session: auth.Session = Depends(auth.require_session)):
+    # Пользователь - из токена сессии, как у /api/like: чужие лайки не отдаём
     try:
         from database import db
         if db is None:
             return []
         
-        photos = list(db.photos.find({}, {'image_data': 0}))
-        
-        for photo in photos:
-            photo['_id'] = str(photo['_id'])
-            photo.setdefault('likes', 0)
-            photo.setdefault('liked_by', [])
-            photo['image_url'] = f"/api/photo/{photo['_id']}"
-            
-        return photos
-    except Exception as e:
-        print(f"API Photos Error: {e}")
+        return await run_db(likes.liked_photo_ids, db, session.user_id)
+    except Exception:
+        logger.exception("My likes error")
         return []
 
-@app.get("/api/stats")
-async def get_stats():
+@app.get("/api/events")
+async def wall_events(request: Request):
+    return broadcaster.response(request)
+
+def read_wall_stats(db):
+    stats = counters.read_stats(db)
+    # Сторона стены, чтобы клиент мог прокрутить до всех слотов
+    stats["wall_size"] = placement.wall_size(placement.used_slots(db))
+    return stats
+
+@app.get("/api/stats", dependencies=[Depends(limits.require_db), Depends(limits.shed_reads)])
+async def get_stats(request: Request):
     try:
         from database import db
         if db is None:
-            return {"total_photos": 0, "total_users": 0, "total_likes": 0}
-        
-        total_photos = db.photos.count_documents({})
-        total_users = len(db.photos.distinct('user_id'))
-        
-        pipeline = [{"$group": {"_id": None, "total_likes": {"$sum": "$likes"}}}]
-        result = list(db.photos.aggregate(pipeline))
-        total_likes = result[0]['total_likes'] if result else 0
+            return {"total_photos": 0, "total_users": 0, "total_likes": 0, "wall_size": placement.wall_size(0)}
         
-        return {
-            "total_photos": total_photos,
-            "total_users": total_users,
-            "total_likes": total_likes
-        }
-    except Exception as e:
-        print(f"API Stats Error: {e}")
-        return {"total_photos": 0, "total_users": 0, "total_likes": 0}
+        return await response_cache.respond(
+            request, db, "stats",
+            lambda: run_db(read_wall_stats, db),
+            shared=shared_cache.entry("stats"),
+        )
+    except Exception:
+        logger.exception("API Stats Error")
+        return {"total_photos": 0, "total_users": 0, "total_likes": 0, "wall_size": placement.wall_size(0)}
 
 from pydantic import BaseModel
 
+class SessionRequest(BaseModel):
+    init_data: str
+
 class LikeRequest(BaseModel):
     photo_id: str
-    user_id: int
-    username: str
 
 class DeleteRequest(BaseModel):
     photo_id: str
-    user_id: int
 
-@app.post("/api/like")
-async def like_photo(request: LikeRequest):
+@app.post("/api/session", dependencies=[Depends(limits.limit_writes)])
+async def create_session(request: SessionRequest):
+    try:
+        user = auth.verify_init_data(request.init_data)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    
+    token, session = auth.issue_token(user)
+    return {
+        "token": token,
+        "user_id": session.user_id,
+        "username": session.username,
+        "is_admin": session.is_admin,
+        "expires_at": session.expires_at,
+    }
+
+@app.post("/api/like", dependencies=[Depends(limits.require_ready)])
+async def like_photo(request: LikeRequest, session: auth.Session = Depends(limits.limit_likes)):
     try:
         from database import db
         if db is None:
             return {"success": False, "error": "Database not connected"}
         
-        photo = db.photos.find_one({"_id": ObjectId(request.photo_id)})
-        if not photo:
+        toggled = await run_db(likes.toggle_like, db, request.photo_id, session.user_id)
+        if toggled is None:
             return {"success": False, "error": "Photo not found"}
         
-        liked_by = photo.get('liked_by', [])
-        user_has_liked = request.user_id in liked_by
-        
-        if user_has_liked:
-            db.photos.update_one(
-                {"_id": ObjectId(request.photo_id)},
-                {
-                    "$inc": {"likes": -1},
-                    "$pull": {"liked_by": request.user_id}
-                }
-            )
-            new_likes = photo.get('likes', 1) - 1
-        else:
-            db.photos.update_one(
-                {"_id": ObjectId(request.photo_id)},
-                {
-                    "$inc": {"likes": 1},
-                    "$push": {"liked_by": request.user_id}
-                }
-            )
-            new_likes = photo.get('likes', 0) + 1
+        liked, new_likes, owner_id = toggled
+        seq = await run_db(counters.like_changed, db, owner_id, 1 if liked else -1)
+        await run_db(changelog.record, db, seq, changelog.LIKES, ObjectId(request.photo_id))
+        response_cache.invalidate()
         
-        return {"success": True, "new_likes": new_likes}
+        return {"success": True, "new_likes": new_likes, "liked": liked}
         
     except Exception as e:
-        print(f"Like error: {e}")
+        logger.exception("Like error")
         return {"success": False, "error": str(e)}
 
 @app.get("/ping")
 async def ping():
     return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
     
-@app.post("/api/delete_photo")
-async def delete_photo(request: DeleteRequest):
+@app.post("/api/delete_photo", dependencies=[Depends(limits.require_ready), Depends(limits.limit_writes)])
+async def delete_photo(request: DeleteRequest, session: auth.Session = Depends(auth.require_session)):
     try:
         from database import db
-        from config import config
         
         if db is None:
             return {"success": False, "error": "Database not connected"}
         
-        # ПРОСТОЙ ХАРДКОД - ЛЮБОЙ С ЭТИМ ID МОЖЕТ УДАЛЯТЬ
-        ADMIN_IDS = [1790615566]
-        
-        if request.user_id not in ADMIN_IDS:
+        # Роль админа подписана в токене сессии (config.ADMIN_IDS)
+        if not session.is_admin:
             return {"success": False, "error": "Access denied"}
         
-        result = db.photos.delete_one({"_id": ObjectId(request.photo_id)})
-        
-        if result.deleted_count > 0:
+        photo = await run_db(
+            db.photos.find_one_and_delete,
+            {"_id": ObjectId(request.photo_id)},
+            projection={"user_id": 1, "likes": 1, "blob_key": 1, "thumbs": 1, "status": 1, "slot": 1},
+        )
+        
+        if photo is not None:
+            # Недообработанное фото ещё не попало ни в счётчики, ни в журнал
+            if photo.get('status') not in (status.PENDING, status.FAILED):
+                seq = await run_db(counters.photo_removed, db, photo)
+                await run_db(changelog.record, db, seq, changelog.DELETE, photo['_id'])
+            await run_db(likes.photo_removed, db, photo['_id'])
+            await run_db(blobs.release, db, photo.get('blob_key'), (photo.get('thumbs') or {}).values())
+            await run_db(placement.release, db, photo.get('slot'))
+            response_cache.invalidate()
             return {"success": True}
         else:
             return {"success": False, "error": "Photo not found"}
             
     except Exception as e:
-        print(f"Delete error: {e}")
+        logger.exception("Delete error")
         return {"success": False, "error": str(e)}
 
+@app.get("/api/duplicates", dependencies=[Depends(limits.require_db), Depends(limits.shed_reads)])
+async def get_duplicates(
+    limit: int = Query(50, ge=1, le=pagination.MAX_PAGE_SIZE),
+    session: auth.Session = Depends(auth.require_session),
+):
+    # Почти одинаковые фото (database.phash) - модератор решает, что удалить
+    if not session.is_admin:
+        raise HTTPException(status_code=403, detail="Access denied")
+    from database import db
+    if db is None:
+        return []
+    found = await run_db(phash.list_duplicates, db, PHOTO_LIST_PROJECTION, limit)
+    return [{"photo": prepare_photo(photo), "duplicate_of": str(original)} for photo, original in found]
+
 @app.get("/api/is_admin/{user_id}")
 async def check_admin(user_id: int):
-    try:
-        user_id_int = int(user_id)
-        ADMIN_IDS = [1790615566]
-        is_admin = user_id_int in ADMIN_IDS
-        
-        return {
-            "is_admin": is_admin,
-            "user_id_received": user_id,
-            "user_id_processed": user_id_int,
-            "admin_ids": ADMIN_IDS
-        }
-    except Exception as e:
-        return {"is_admin": False, "error": str(e)}
+    # Оставлен для старых клиентов; страница берёт роль из /api/session
+    return {"is_admin": user_id in config.ADMIN_IDS}
+
+async def connect_db():
+    # Первое соединение в пуле потоков: медленный кластер не держит импорт,
+    # а недоступный - не оставляет приложение без базы до перезапуска
+    await run_db(database.connect)
+
+async def build_static_bundle():
+    # Хэши и сжатие считаем один раз, до первого запроса
+    await asyncio.get_running_loop().run_in_executor(None, bundle.build)
+
+def start_with_db(name: str, task):
+    """Фоновая задача app.state.<name>: ``await task(db)``, как только
+    создан клиент базы. Если он не создался при старте, задача ждёт
+    следующей попытки, а не выключается до перезапуска."""
+    async def run():
+        db = await wait_for_db()
+        if db is not None:
+            await task(db)
+    setattr(app.state, name, asyncio.create_task(run()))
+
+def start_database_setup():
+    # В фоне: старт не ждёт сборку индексов на большой базе или медленный
+    # кластер. Чтение работает сразу, запись - после (limits.require_ready)
+    start_with_db('database_setup', bootstrap.prepare_until_ready)
+
+def start_events_watcher():
+    start_with_db('events_watcher', lambda db: events.watch_changes(db, PHOTO_LIST_PROJECTION, prepare_photo))
+
+def start_blob_collector():
+    # Блобы удалённых фото удаляются с задержкой (database.blobs)
+    start_with_db('blob_collector', blobs.collect_periodically)
+
+# Ответы общего кэша в порядке важности: если снимок не помещается,
+# пропускаются последние
+SHARED_KEYS = ("stats", "top_users:0:10", CELLS, "photos?")
+
+def shared_snapshot(db, keys):
+    """Ответы ``keys`` для общего кэша: статистика, первая страница топа,
+    JSON каждого фото по ячейкам для запросов видимой области и вся стена.
+    Стена читается, только если нужна."""
+    result = {}
+    if "stats" in keys:
+        result["stats"] = serialization.dumps(read_wall_stats(db))
+    if "top_users:0:10" in keys:
+        result["top_users:0:10"] = serialization.dumps(leaderboard.top(db))
+    if CELLS in keys or "photos?" in keys:
+        photos = [prepare_photo(photo) for photo in db.photos.find(status.VISIBLE, PHOTO_LIST_PROJECTION)]
+        fragments = [serialization.dumps(photo) for photo in photos]
+        if CELLS in keys:
+            cells = {}
+            for photo, fragment in zip(photos, fragments):
+                if 'position_x' in photo and 'position_y' in photo:
+                    x, y = photo['position_x'], photo['position_y']
+                    cells.setdefault(spatial.cell_key(x, y), []).append((x, y, fragment))
+            result[CELLS] = cells
+        if "photos?" in keys:
+            result["photos?"] = b"[" + b",".join(fragments) + b"]"
+    return result
+
+def start_shared_cache():
+    # Несколько воркеров: горячие ответы в общей памяти, собирает их один
+    if config.SHARED_CACHE and shared_cache.open():
+        start_with_db('shared_cache', lambda db: shared_cache.run(db, SHARED_KEYS, shared_snapshot))
+
+def stop_background_tasks():
+    for name in ('events_watcher', 'database_setup', 'blob_collector', 'shared_cache'):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+
+def shutdown_db_pool():
+    from database import aio
+    aio.shutdown()
+    database.close()
 
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
 
-@app.get("/api/photo/{photo_id}")
-async def get_photo(photo_id: str):
+@app.get("/health/live")
+async def health_live():
+    # Процесс жив и отвечает; база не проверяется - её недоступность не
+    # повод перезапускать приложение
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    # Готов принимать трафик: база отвечает на ping за DB_PING_TIMEOUT
+    from database import db
+    try:
+        latency = await run_db(database.ping, db)
+    except Exception as e:
+        # Полный текст ошибки pymongo - описание топологии кластера, наружу только тип
+        return JSONResponse(status_code=503, content={"status": "unavailable", "error": type(e).__name__})
+    return {"status": "ready", "db_latency_ms": round(latency * 1000, 1)}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    if config.METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {config.METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Нужен токен метрик")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def _open_photo(db, photo_id, size=None):
+    """(файл, размер, ETag, окончательная ли картинка для этого size) или None."""
+    photo = db.photos.find_one({"_id": ObjectId(photo_id)}, {"blob_key": 1, "thumbs": 1})
+    if not photo:
+        return None
+    
+    key, final = thumbnails.pick_blob(photo, size)
+    if key:
+        store = blobs.get_store()
+        fh = store.open(key)
+        if fh is None:
+            return None
+        return fh, store.size(fh), f'"{key}"', final
+    
+    # Старые документы с картинкой внутри (до python -m database.blobs)
+    photo = db.photos.find_one({"_id": ObjectId(photo_id)}, {"image_data": 1})
+    if not photo or 'image_data' not in photo:
+        return None
+    image_data = bytes(photo['image_data'])
+    return io.BytesIO(image_data), len(image_data), f'"{blobs.blob_key(image_data)}"', not size
+
+@app.get("/api/photo/{photo_id}", dependencies=[Depends(limits.require_db), Depends(limits.limit_images)])
+async def get_photo(photo_id: str, request: Request, size: Optional[int] = Query(None, ge=1)):
     try:
         from database import db
         if db is None:
             return Response(content=b"", media_type="image/jpeg")
         
-        photo = db.photos.find_one({"_id": ObjectId(photo_id)})
-        if not photo or 'image_data' not in photo:
+        opened = await run_db(_open_photo, db, photo_id, size)
+        if opened is None:
             return Response(content=b"", media_type="image/jpeg")
         
-        image_data = photo['image_data']
-        if isinstance(image_data, Binary):
-            image_data = image_data
+        fh, size, etag, final = opened
+        cache_control = media.IMMUTABLE_CACHE if final else media.FALLBACK_CACHE
+        return await media.blob_response(request, run_db, fh, size, etag, "image/jpeg", cache_control)
         
-        return Response(content=image_data, media_type="image/jpeg")
-        
-    except Exception as e:
-        print(f"Photo endpoint error: {e}")
+    except Exception:
+        logger.exception("Photo endpoint error")
         return Response(content=b"", media_type="image/jpeg")
         
-print("✅ webapp/main.py загружен! App создан.")
+logger.info("✅ webapp/main.py загружен! App создан.")
 
 
 
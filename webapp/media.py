@@ -0,0 +1,85 @@
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+from config import config
+
+# Картинка по ключу блоба никогда не меняется, поэтому кэшируется навсегда.
+# Замена вместо недостающего превью - ненадолго: по тому же URL потом
+# придёт превью, а ETag (ключ блоба) скажет браузеру, что картинка другая
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+FALLBACK_CACHE = "public, max-age=300"
+
+
+def parse_range(header: str, size: int):
+    """Разбирает ``Range: bytes=...`` в (start, end) включительно.
+
+    None - заголовок не про один диапазон байт, отдаём файл целиком;
+    ValueError - диапазон за пределами файла (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        elif end:
+            # bytes=-N: последние N байт
+            start = max(size - int(end), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+async def _iter_file(run_db, fh, start: int, length: int):
+    try:
+        await run_db(fh.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await run_db(fh.read, min(config.BLOB_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_db(fh.close)
+
+
+async def blob_response(request: Request, run_db, fh, size: int, etag: str, media_type: str,
+                        cache_control: str = IMMUTABLE_CACHE):
+    """Ответ с картинкой: ETag/304, Range/206 и чтение блоба кусками."""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if etag in request.headers.get("if-none-match", ""):
+        await run_db(fh.close)
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, size - 1, 200
+    try:
+        requested = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        await run_db(fh.close)
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    # If-Range: диапазон отдаём только для той же версии файла
+    if requested and request.headers.get("if-range", etag) == etag:
+        start, end = requested
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1 if size else 0
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        _iter_file(run_db, fh, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
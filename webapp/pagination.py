@@ -0,0 +1,47 @@
+import base64
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from webapp import serialization
+
+# Keyset-пагинация по _id: ObjectId растёт вместе со временем создания,
+# поэтому порядок совпадает с created_at, а индекс по _id есть всегда
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def encode_cursor(last_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(last_id.binary).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> ObjectId:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return ObjectId(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError(f"Некорректный курсор: {cursor!r}") from e
+
+
+def fetch_page(db, query: dict, projection: dict, after, limit: int) -> list:
+    """Одна страница фото после _id ``after`` в порядке возрастания _id."""
+    if after is not None:
+        query = {"$and": [query, {"_id": {"$gt": after}}]}
+    return list(db.photos.find(query, projection).sort("_id", 1).limit(limit))
+
+
+async def iter_ndjson(run_db, db, query: dict, projection: dict, prepare):
+    """Отдаёт фото строками NDJSON, читая базу пачками по STREAM_BATCH_SIZE.
+
+    В памяти держится только текущая пачка, сколько бы фото ни было на стене.
+    """
+    after = None
+    while True:
+        page = await run_db(fetch_page, db, query, projection, after, STREAM_BATCH_SIZE)
+        if not page:
+            return
+        after = page[-1]["_id"]
+        yield b"".join(serialization.dumps(prepare(photo)) + b"\n" for photo in page)
+        if len(page) < STREAM_BATCH_SIZE:
+            return
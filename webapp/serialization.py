@@ -0,0 +1,34 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import Binary, ObjectId
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    # Binary - подкласс bytes: старые фото с image_data внутри документа
+    if isinstance(value, (Binary, bytes)):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+
+if orjson is not None:
+    # orjson сам пишет datetime, dict и list в байты на C; в _default
+    # попадают только типы BSON
+    def dumps(obj) -> bytes:
+        """JSON в байтах; datetime и ObjectId превращаются в строки."""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+else:
+    def dumps(obj) -> bytes:
+        """JSON в байтах; datetime и ObjectId превращаются в строки."""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
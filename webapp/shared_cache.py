@@ -0,0 +1,454 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+import metrics
+from config import config
+from database import counters, spatial
+from database.aio import run_db
+from webapp import compression, serialization
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Общий кэш горячих ответов для нескольких воркеров uvicorn. Данные лежат
+# в файле на /dev/shm, который каждый воркер отображает в память (mmap):
+# снимок стены собирается и сериализуется один раз, а воркеры только
+# копируют готовые байты. Снимок пересобирает один процесс - тот, кто
+# держит flock на файле-замке; если он умрёт, замок возьмёт другой воркер.
+#
+# В файле заголовок и два слота под снимки. Новый снимок пишется в
+# свободный слот, затем заголовок переключается на него. Счётчик seq
+# нечётный, пока заголовок меняется: читатель сверяет seq до и после
+# чтения и при расхождении читает заново. Отметку времени (heartbeat)
+# ведущий обновляет на каждом опросе, если снимок совпадает с версией в
+# базе; без неё дольше STALE_POLLS опросов общий кэш не используется.
+#
+# Ведущий собирает не всё подряд, а только то, что воркеры спрашивали за
+# последние WANTED_TTL секунд: воркер отмечает ответ и кодировку в байте
+# заголовка (WANTED), ведущий собирает и сжимает только отмеченное. Ответ,
+# который не изменился с прошлой версии, заново не сжимается, а тот, что не
+# помещается в слот, пропускается - его воркеры соберут сами.
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GWCACHE1"
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+# Версия стены, слот, смещение и длина каталога снимка
+SNAPSHOT = struct.Struct("<qIQQ")
+SNAPSHOT_OFFSET = 16
+HEARTBEAT = struct.Struct("<d")
+HEARTBEAT_OFFSET = 48
+# Отметки «этот ответ спрашивали»: байт на ключ (crc32 по модулю),
+# биты - кодировки. Совпадение ключей по модулю даёт лишнюю сборку, не ошибку
+WANTED_OFFSET = 64
+WANTED_SLOTS = 1024
+WANTED_TTL = 60
+DATA_OFFSET = 4096
+# Фото в таблице ячейки: x, y, смещение и длина его JSON в слоте
+RECORD = struct.Struct("<ddII")
+READ_RETRIES = 3
+STALE_POLLS = 5
+# Ключ таблицы фото по ячейкам (видимая область) среди ответов снимка
+CELLS = "cells"
+_ENCODING_BITS = {compression.IDENTITY: 1, **{encoding: 2 << i for i, encoding in enumerate(compression.ENCODINGS)}}
+
+shared_cache_up = metrics.Gauge(
+    "shared_cache_up", "Общий кэш: 1 - воркер читает свежий снимок, 0 - выключен или его некому обновлять"
+)
+shared_cache_entries = metrics.Gauge(
+    "shared_cache_entries", "Ответы в последнем снимке ведущего: published и too_large (не поместились)", ("state",)
+)
+
+
+class SnapshotTooLarge(Exception):
+    pass
+
+
+def default_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "graffiti-wall-cache")
+
+
+class Snapshot:
+    """Каталог одного снимка; байты читаются из mmap по запросу."""
+
+    def __init__(self, buffer, base: int, version: int, directory: dict):
+        self._buffer = buffer
+        self._base = base
+        self.version = version
+        self.entries = directory["entries"]
+        self.cells = directory["cells"]  # None - таблица не поместилась или не нужна
+
+    def _bytes(self, offset: int, length: int) -> bytes:
+        start = self._base + offset
+        return self._buffer[start:start + length]
+
+    def body(self, key: str, accept_encoding: str):
+        """(байты, кодировка) готового ответа ``key`` или None."""
+        bodies = self.entries.get(key)
+        if bodies is None:
+            return None
+        encoding = compression.negotiate(accept_encoding, [e for e in compression.ENCODINGS if e in bodies])
+        return self._bytes(*bodies[encoding]), encoding
+
+    def viewport(self, x0: int, y0: int, x1: int, y1: int):
+        """JSON-массив фото в прямоугольнике - как spatial.viewport_filter."""
+        if self.cells is None:
+            return None
+        # Ячеек области больше, чем непустых в снимке, - перебираем снимок
+        cells = spatial.cells_for_rect(x0, y0, x1, y1, limit=len(self.cells))
+        if cells is None:
+            cells = self.cells
+        left, top = x0 - spatial.TILE_SIZE, y0 - spatial.TILE_SIZE
+        fragments = []
+        for cell in cells:
+            table = self.cells.get(cell)
+            if table is None:
+                continue
+            offset, count = table
+            for x, y, start, length in RECORD.iter_unpack(self._bytes(offset, count * RECORD.size)):
+                if left < x < x1 and top < y < y1:
+                    fragments.append(self._bytes(start, length))
+        return b"[" + b",".join(fragments) + b"]", compression.IDENTITY
+
+
+class Lookup:
+    """Выборка из снимка для SharedCache.read(); ``key`` - какой ответ
+    спрашивают, его ведущий и положит в следующий снимок."""
+
+    def __init__(self, key: str, function):
+        self.key = key
+        self._function = function
+
+    def __call__(self, snapshot, accept_encoding: str):
+        return self._function(snapshot, accept_encoding)
+
+
+class _SlotWriter:
+    def __init__(self, buffer, base: int, size: int):
+        self._buffer = buffer
+        self._base = base
+        self._size = size
+        self.position = 0
+
+    def free(self) -> int:
+        return self._size - self.position
+
+    def write(self, data: bytes) -> int:
+        if len(data) > self.free():
+            raise SnapshotTooLarge(f"слот {self._size} байт")
+        offset = self.position
+        self._buffer[self._base + offset:self._base + offset + len(data)] = data
+        self.position += len(data)
+        return offset
+
+
+class SharedCache:
+    def __init__(self, path: str, size: int, poll: float):
+        self.path = path
+        self.slot_size = (size - DATA_OFFSET) // 2
+        self.poll = poll
+        self._buffer = None
+        self._lock_fd = None
+        self._snapshot = None  # (seq, Snapshot) последнего прочитанного каталога
+        # Состояние ведущего: версия последнего снимка, собранные для неё
+        # ответы, их сжатые варианты и не поместившиеся ключи
+        self._published = None
+        self._values = {}
+        self._encoded = {}
+        self._skipped = set()
+        self._wanted = {}  # {ключ: {кодировка: когда спрашивали}}
+        shared_cache_up.bind(lambda: int(self.version() is not None))
+        shared_cache_entries.bind(lambda: {
+            ("published",): len(self._values) - len(self._skipped),
+            ("too_large",): len(self._skipped),
+        })
+
+    @property
+    def enabled(self) -> bool:
+        return self._buffer is not None
+
+    def open(self) -> bool:
+        """Отображает файл кэша в память; False, если не вышло (кэш выключен)."""
+        if self._buffer is not None:
+            return True
+        if fcntl is None:
+            logger.warning("Общий кэш недоступен без fcntl (нужен Linux)")
+            return False
+        size = DATA_OFFSET + 2 * self.slot_size
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                # Воркеры стартуют одновременно: размер ставит тот, кто первый.
+                # Файл другого размера (сменили SHARED_CACHE_MB) обнуляется
+                if os.fstat(fd).st_size != size:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                self._buffer = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        except OSError:
+            logger.exception("Общий кэш %s не открыт", self.path)
+            return False
+        return True
+
+    def close(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        self._snapshot = None
+
+    # --- Чтение (любой воркер) ---
+
+    def _fresh(self) -> bool:
+        heartbeat = HEARTBEAT.unpack_from(self._buffer, HEARTBEAT_OFFSET)[0]
+        return time.time() - heartbeat <= STALE_POLLS * self.poll
+
+    def _load(self, seq: int):
+        cached = self._snapshot
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+        buffer = self._buffer
+        if buffer[:len(MAGIC)] != MAGIC:
+            return None
+        version, slot, offset, length = SNAPSHOT.unpack_from(buffer, SNAPSHOT_OFFSET)
+        base = DATA_OFFSET + slot * self.slot_size
+        raw = buffer[base + offset:base + offset + length]
+        if SEQ.unpack_from(buffer, SEQ_OFFSET)[0] != seq:
+            return None
+        # Каталог разбирается раз на снимок, а не на каждый запрос
+        snapshot = Snapshot(buffer, base, version, json.loads(raw))
+        self._snapshot = (seq, snapshot)
+        return snapshot
+
+    def version(self):
+        """Версия стены в общем кэше или None, если его некому обновлять.
+
+        Читает только заголовок - дешевле запроса к базе на каждый ответ.
+        """
+        buffer = self._buffer
+        if buffer is None or not self._fresh():
+            return None
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(buffer, SEQ_OFFSET)[0]
+            if seq % 2 or buffer[:len(MAGIC)] != MAGIC:
+                continue
+            version = SNAPSHOT.unpack_from(buffer, SNAPSHOT_OFFSET)[0]
+            if SEQ.unpack_from(buffer, SEQ_OFFSET)[0] == seq:
+                return version
+        return None
+
+    def _want(self, key: str, accept_encoding: str):
+        encoding = compression.IDENTITY if key == CELLS else compression.negotiate(accept_encoding)
+        index = WANTED_OFFSET + zlib.crc32(key.encode()) % WANTED_SLOTS
+        self._buffer[index] |= _ENCODING_BITS[encoding]
+
+    def read(self, version: int, lookup: Lookup, accept_encoding: str):
+        """``lookup(snapshot, accept_encoding)`` над снимком версии ``version``.
+
+        None, если снимка этой версии нет или в нём нет этого ответа. Если
+        ведущий переключил снимок во время чтения, чтение повторяется.
+        """
+        if self._buffer is None:
+            return None
+        # Отмечаем и промах: по отметке ответ появится в следующем снимке
+        self._want(lookup.key, accept_encoding)
+        if not self._fresh():
+            return None
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(self._buffer, SEQ_OFFSET)[0]
+            if seq % 2:
+                continue
+            snapshot = self._load(seq)
+            if snapshot is None:
+                continue
+            if snapshot.version != version:
+                return None
+            result = lookup(snapshot, accept_encoding)
+            if SEQ.unpack_from(self._buffer, SEQ_OFFSET)[0] == seq:
+                return result
+        return None
+
+    # --- Запись (ведущий процесс) ---
+
+    def _try_lead(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        logger.info("Общий кэш обновляет процесс %s", os.getpid())
+        return True
+
+    def heartbeat(self):
+        HEARTBEAT.pack_into(self._buffer, HEARTBEAT_OFFSET, time.time())
+
+    def publish(self, version: int, entries: dict) -> list:
+        """Записывает снимок в свободный слот и переключает на него заголовок.
+
+        ``entries`` - {ключ: {кодировка: байты}} в порядке важности, под
+        ключом CELLS - {ячейка: [(x, y, JSON фото)]}. Возвращает ключи,
+        которые не поместились в слот: их воркеры соберут сами.
+        """
+        buffer = self._buffer
+        initialized = buffer[:len(MAGIC)] == MAGIC
+        seq = SEQ.unpack_from(buffer, SEQ_OFFSET)[0] if initialized else 0
+        active = SNAPSHOT.unpack_from(buffer, SNAPSHOT_OFFSET)[1] if initialized else 1
+        slot = 1 - active
+        writer = _SlotWriter(buffer, DATA_OFFSET + slot * self.slot_size, self.slot_size)
+
+        directory = {"entries": {}, "cells": None}
+        # Место под каталог: запас на ответы и по строке на ячейку
+        reserve = 64 * 1024 + 48 * len(entries.get(CELLS) or ())
+        skipped = []
+        for key, value in entries.items():
+            if key == CELLS:
+                size = sum(len(fragment) + RECORD.size for photos in value.values() for _, _, fragment in photos)
+            else:
+                size = sum(len(data) for data in value.values())
+            if size > writer.free() - reserve:
+                skipped.append(key)
+                continue
+            if key == CELLS:
+                directory["cells"] = {}
+                for cell, photos in value.items():
+                    records = [RECORD.pack(x, y, writer.write(fragment), len(fragment)) for x, y, fragment in photos]
+                    directory["cells"][cell] = [writer.write(b"".join(records)), len(records)]
+            else:
+                directory["entries"][key] = {encoding: [writer.write(data), len(data)] for encoding, data in value.items()}
+        raw = serialization.dumps(directory)
+        offset = writer.write(raw)
+
+        SEQ.pack_into(buffer, SEQ_OFFSET, seq + 1)
+        SNAPSHOT.pack_into(buffer, SNAPSHOT_OFFSET, version, slot, offset, len(raw))
+        buffer[:len(MAGIC)] = MAGIC
+        SEQ.pack_into(buffer, SEQ_OFFSET, seq + 2)
+        return skipped
+
+    def _collect_wanted(self, keys) -> dict:
+        """{ключ: {кодировки}}, которые воркеры спрашивали за WANTED_TTL."""
+        now = time.monotonic()
+        for key in keys:
+            index = WANTED_OFFSET + zlib.crc32(key.encode()) % WANTED_SLOTS
+            bits = self._buffer[index]
+            if bits:
+                self._buffer[index] = 0
+                seen = self._wanted.setdefault(key, {})
+                for encoding, bit in _ENCODING_BITS.items():
+                    if bits & bit:
+                        seen[encoding] = now
+        wanted = {}
+        for key, seen in self._wanted.items():
+            recent = {encoding for encoding, at in seen.items() if now - at <= WANTED_TTL}
+            if recent:
+                wanted[key] = recent
+        return wanted
+
+    def _missing(self, key: str, encodings) -> bool:
+        """Спрошенного ответа или его кодировки нет в текущем снимке."""
+        if key in self._skipped:
+            return False
+        value = self._values.get(key)
+        if value is None:
+            return True
+        if key == CELLS or len(value) < config.COMPRESS_MIN_SIZE:
+            return False
+        return any(encoding not in self._encoded[key] for encoding in encodings)
+
+    def _encode(self, key: str, value: bytes, encodings) -> dict:
+        """{кодировка: байты} ответа. Сжатые варианты прошлого снимка
+        переиспользуются, если ответ не изменился."""
+        previous = self._encoded.get(key)
+        bodies = dict(previous) if previous and previous[compression.IDENTITY] == value else {compression.IDENTITY: value}
+        if len(value) >= config.COMPRESS_MIN_SIZE:
+            for encoding in encodings:
+                if encoding not in bodies:
+                    bodies[encoding] = compression.compress(value, encoding)
+        return bodies
+
+    def _publish_values(self, version: int, keys, values: dict, wanted: dict):
+        entries = {}
+        for key in keys:
+            if key in values:
+                value = values[key]
+                entries[key] = value if key == CELLS else self._encode(key, value, wanted.get(key, ()))
+        skipped = self.publish(version, entries)
+        for key in set(skipped) - self._skipped:
+            logger.warning("Ответ %s не помещается в общий кэш (SHARED_CACHE_MB)", key)
+        self._published = version
+        self._values = values
+        self._encoded = {key: bodies for key, bodies in entries.items() if key != CELLS}
+        self._skipped = set(skipped)
+
+    async def run(self, db, keys, build):
+        """Цикл обновления снимка.
+
+        ``keys`` - ответы, которые умеет собирать ``build(db, keys)`` (в пуле
+        потоков базы), в порядке важности; build возвращает {ключ: JSON-байты},
+        под ключом CELLS - {ячейка: [(x, y, JSON фото)]}. Ведущим становится
+        первый воркер, взявший замок; остальные пробуют снова на каждом опросе.
+        """
+        loop = asyncio.get_running_loop()
+        rejected = None
+        while True:
+            try:
+                if self._try_lead():
+                    wanted = self._collect_wanted(keys)
+                    # Версию читаем до данных, как и ResponseCache
+                    version = await run_db(counters.read_version, db)
+                    values = None
+                    if version != self._published and version != rejected:
+                        needed = [key for key in keys if key in wanted]
+                        values = await run_db(build, db, needed) if needed else {}
+                    elif version == self._published and any(self._missing(key, wanted[key]) for key in wanted):
+                        # Спросили новое при той же версии - собранное остаётся
+                        needed = [key for key in keys if key in wanted and key not in self._values and key not in self._skipped]
+                        values = {**self._values, **(await run_db(build, db, needed) if needed else {})}
+                    if values is not None:
+                        try:
+                            await loop.run_in_executor(None, self._publish_values, version, keys, values, wanted)
+                        except SnapshotTooLarge as e:
+                            rejected = version
+                            logger.error("Каталог снимка не помещается в общий кэш (%s), увеличьте SHARED_CACHE_MB", e)
+                    # Без свежего снимка отметку не обновляем: воркеры
+                    # вернутся к версии из базы
+                    if version == self._published:
+                        self.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Shared cache refresh error")
+            await asyncio.sleep(self.poll)
+
+    @staticmethod
+    def entry(key: str) -> Lookup:
+        """Выборка для ResponseCache.respond: готовый ответ ``key``."""
+        return Lookup(key, lambda snapshot, accept_encoding: snapshot.body(key, accept_encoding))
+
+    @staticmethod
+    def viewport(x0: int, y0: int, x1: int, y1: int) -> Lookup:
+        """Выборка для ResponseCache.respond: фото видимой области."""
+        return Lookup(CELLS, lambda snapshot, accept_encoding: snapshot.viewport(x0, y0, x1, y1))
+
+
+shared_cache = SharedCache(
+    config.SHARED_CACHE_PATH or default_path(),
+    config.SHARED_CACHE_MB * 1024 * 1024,
+    config.SHARED_CACHE_POLL,
+)
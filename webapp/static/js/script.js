@@ -1,11 +1,10 @@
-// Глобальные переменные для управления стеной
 let wallScale = 1;
 let isDragging = false;
 let startX, startY, scrollLeft, scrollTop;
 let initialDistance = null;
 let currentUser = null;
 
-// Инициализация пользователя Telegram
+// Получаем данные пользователя из Telegram Web App
 try {
     if (window.Telegram && Telegram.WebApp) {
         currentUser = Telegram.WebApp.initDataUnsafe.user;
@@ -14,40 +13,130 @@ try {
     console.log('Telegram Web App not available');
 }
 
-// Основная функция загрузки галереи
-async function loadGallery() {
+// Сессия: initData проверяется на сервере один раз, дальше лайки и
+// удаление идут с подписанным токеном, в котором уже есть роль админа
+let session = null;
+let sessionReady = Promise.resolve(null);
+
+async function startSession() {
+    const initData = window.Telegram && Telegram.WebApp ? Telegram.WebApp.initData : '';
+    if (!initData) return null;
     try {
-        document.getElementById('loading').style.display = 'block';
-        
-        // Загружаем статистику
-        const statsResponse = await fetch('/api/stats');
-        const stats = await statsResponse.json();
-        
-        document.getElementById('total-photos').textContent = `📸 Фото: ${stats.total_photos}`;
-        document.getElementById('total-users').textContent = `👥 Участники: ${stats.total_users}`;
-        document.getElementById('total-likes').textContent = `❤️ Лайки: ${stats.total_likes}`;
-        
-        // Загружаем фото
-        const photosResponse = await fetch('/api/photos');
-        const photos = await photosResponse.json();
-        
-        const wall = document.getElementById('wall');
-        wall.innerHTML = '';
-        
-        if (photos.length === 0) {
-            wall.innerHTML = '<div style="text-align: center; padding: 40px; color: #666;">🎨 Пока нет фото на стене. Будьте первым!</div>';
-        } else {
-            photos.forEach(photo => {
-                createPhotoElement(photo, wall);
-            });
-        }
-        
-        document.getElementById('loading').style.display = 'none';
-        
+        const response = await fetch('/api/session', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({init_data: initData})
+        });
+        session = response.ok ? await response.json() : null;
     } catch (error) {
-        document.getElementById('loading').innerHTML = '❌ Ошибка загрузки галереи';
-        console.error('Error:', error);
+        console.error('Session error:', error);
+        session = null;
     }
+    return session;
+}
+
+async function apiPost(url, body) {
+    await sessionReady;
+    for (let attempt = 0; attempt < 2; attempt++) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${session ? session.token : ''}`
+            },
+            body: JSON.stringify(body)
+        });
+        // Токен истёк - берём новый и повторяем один раз
+        if (response.status === 401 && attempt === 0) {
+            sessionReady = startSession();
+            await sessionReady;
+            continue;
+        }
+        return response.json();
+    }
+}
+
+async function loadStats() {
+    const statsResponse = await fetch('/api/stats');
+    const stats = await statsResponse.json();
+
+    document.getElementById('total-photos').textContent = `📸 Фото: ${stats.total_photos}`;
+    document.getElementById('total-users').textContent = `👥 Участники: ${stats.total_users}`;
+    document.getElementById('total-likes').textContent = `❤️ Лайки: ${stats.total_likes}`;
+    setWallSize(stats.wall_size);
+}
+
+// Стена растёт вместе с числом фото, но не меньше 2000px
+let wallSize = 2000;
+
+function setWallSize(size) {
+    wallSize = Math.max(2000, size || 0);
+    const wall = document.getElementById('wall');
+    wall.style.width = wallSize + 'px';
+    wall.style.height = wallSize + 'px';
+}
+
+// Размер превью для плитки 150px с учётом плотности пикселей экрана
+const TILE_IMAGE_SIZE = Math.round(150 * (window.devicePixelRatio || 1));
+const MODAL_IMAGE_SIZE = 1024;
+
+// id фото, которые лайкнул текущий пользователь
+let myLikes = new Set();
+
+async function loadMyLikes() {
+    await sessionReady;
+    if (!session) return;
+    const response = await fetch('/api/my_likes', {
+        headers: {'Authorization': `Bearer ${session.token}`}
+    });
+    if (!response.ok) return;
+    myLikes = new Set(await response.json());
+}
+
+// Плитки, которые сейчас на стене: id фото -> элемент
+const renderedPhotos = new Map();
+let viewportTimer = null;
+
+// Видимая область стены в координатах стены, с запасом в пол-экрана
+function getViewport() {
+    const container = document.getElementById('wall-container');
+    const padX = container.clientWidth / 2;
+    const padY = container.clientHeight / 2;
+    return {
+        x0: Math.floor((container.scrollLeft - padX) / wallScale),
+        y0: Math.floor((container.scrollTop - padY) / wallScale),
+        x1: Math.ceil((container.scrollLeft + container.clientWidth + padX) / wallScale),
+        y1: Math.ceil((container.scrollTop + container.clientHeight + padY) / wallScale)
+    };
+}
+
+// Перезагрузка видимой области не чаще, чем раз в 150 мс при прокрутке и зуме
+function scheduleViewportLoad() {
+    clearTimeout(viewportTimer);
+    viewportTimer = setTimeout(loadViewport, 150);
+}
+
+async function loadViewport() {
+    const v = getViewport();
+    const photosResponse = await fetch(`/api/photos?x0=${v.x0}&y0=${v.y0}&x1=${v.x1}&y1=${v.y1}`);
+    const photos = await photosResponse.json();
+
+    const visible = new Set();
+
+    photos.forEach(photo => {
+        visible.add(photo._id);
+        upsertPhotoTile(photo);
+    });
+
+    // Плитки, ушедшие из видимой области, убираем из DOM
+    renderedPhotos.forEach((element, id) => {
+        if (!visible.has(id)) {
+            element.remove();
+            renderedPhotos.delete(id);
+        }
+    });
+
+    document.getElementById('empty-wall').style.display = renderedPhotos.size === 0 ? 'block' : 'none';
 }
 
 // Создание элемента фото на стене
@@ -58,29 +147,148 @@ function createPhotoElement(photo, wall) {
     photoElement.style.top = photo.position_y + 'px';
     photoElement.style.width = '150px';
     photoElement.style.height = '150px';
-    
-    // Проверяем лайкнул ли пользователь это фото
-    const userLiked = currentUser && photo.liked_by && photo.liked_by.includes(currentUser.id);
-    
+
+    // РЕАЛЬНЫЕ ФОТО ИЗ MONGODB (превью под размер плитки и плотность экрана)
     photoElement.innerHTML = `
-        <img src="${photo.image_url}" 
+        <img src="${photo.image_url}?size=${TILE_IMAGE_SIZE}" 
              alt="Фото от @${photo.username}" 
              loading="lazy"
              style="width:100%;height:100%;object-fit:cover;border-radius:8px;">
         <div class="photo-credits">@${photo.username}</div>
         <div class="photo-likes">❤️ ${photo.likes}</div>
     `;
-    
+
     // Добавляем клик для открытия модалки
     photoElement.onclick = (e) => {
         e.stopPropagation();
-        showPhotoModal(photo, userLiked);
+        showPhotoModal(photo, myLikes.has(photo._id));
     };
-    
+
+    photoElement.photo = photo;
     wall.appendChild(photoElement);
+    return photoElement;
+}
+
+// Точечные изменения стены: по ответам API и событиям сервера
+function upsertPhotoTile(photo) {
+    const existing = renderedPhotos.get(photo._id);
+    if (existing) {
+        existing.remove();
+    }
+    renderedPhotos.set(photo._id, createPhotoElement(photo, document.getElementById('wall')));
+    document.getElementById('empty-wall').style.display = 'none';
+}
+
+function removePhotoTile(photoId) {
+    const element = renderedPhotos.get(photoId);
+    if (element) {
+        element.remove();
+        renderedPhotos.delete(photoId);
+    }
+}
+
+function updatePhotoLikes(photoId, likes) {
+    const element = renderedPhotos.get(photoId);
+    if (element) {
+        element.photo.likes = likes;
+        element.querySelector('.photo-likes').textContent = `❤️ ${likes}`;
+    }
+}
+
+function isInViewport(photo) {
+    const v = getViewport();
+    return photo.position_x > v.x0 - 150 && photo.position_x < v.x1 &&
+           photo.position_y > v.y0 - 150 && photo.position_y < v.y1;
 }
 
-// Функция показа модалки с фото
+let statsTimer = null;
+
+// Статистика после событий обновляется пачкой, а не на каждое событие
+function scheduleStatsLoad() {
+    clearTimeout(statsTimer);
+    statsTimer = setTimeout(() => loadStats().catch(error => console.error('Stats error:', error)), 500);
+}
+
+// Последнее изменение стены, которое уже применено на странице
+let wallSeq = null;
+
+function applyWallEvent(event) {
+    if (event.type === 'photo_added') {
+        if (isInViewport(event.photo)) {
+            upsertPhotoTile(event.photo);
+        }
+    } else if (event.type === 'photo_removed') {
+        removePhotoTile(event.photo_id);
+    } else if (event.type === 'likes_changed') {
+        updatePhotoLikes(event.photo_id, event.likes);
+    } else if (event.type === 'resync') {
+        loadGallery();
+    }
+    if (event.seq !== undefined) {
+        wallSeq = event.seq;
+    }
+    scheduleStatsLoad();
+}
+
+// Догоняем стену после переподключения: только изменения с wallSeq,
+// полный снимок - если сервер уже забыл этот номер
+async function syncChanges() {
+    if (wallSeq === null) {
+        await loadGallery();
+        return;
+    }
+    const response = await fetch(`/api/photos/changes?since=${wallSeq}`);
+    const delta = await response.json();
+    if (delta.snapshot) {
+        await loadGallery();
+    } else {
+        delta.upserts.forEach(photo => {
+            if (renderedPhotos.has(photo._id) || isInViewport(photo)) {
+                upsertPhotoTile(photo);
+            }
+        });
+        delta.deletes.forEach(removePhotoTile);
+        scheduleStatsLoad();
+    }
+    wallSeq = delta.seq;
+}
+
+// Живые обновления стены вместо полной перезагрузки раз в 30 секунд
+function connectEvents() {
+    if (!window.EventSource) {
+        setInterval(loadGallery, 30000);
+        return;
+    }
+
+    const source = new EventSource('/api/events');
+    let connected = false;
+
+    // После переподключения часть событий могла потеряться
+    source.onopen = () => {
+        if (connected) {
+            syncChanges().catch(error => console.error('Sync error:', error));
+        }
+        connected = true;
+    };
+
+    source.onmessage = (e) => applyWallEvent(JSON.parse(e.data));
+}
+
+async function loadGallery() {
+    try {
+        document.getElementById('loading').style.display = 'block';
+
+        await Promise.all([loadStats(), loadViewport()]);
+
+        document.getElementById('loading').style.display = 'none';
+
+    } catch (error) {
+        document.getElementById('loading').innerHTML = '❌ Ошибка загрузки галереи';
+        console.error('Error:', error);
+    }
+}
+
+// Функция показа модалки с фото и кнопками
 async function showPhotoModal(photo, userLiked) {
     const modal = document.createElement('div');
     modal.style.cssText = `
@@ -89,29 +297,21 @@ async function showPhotoModal(photo, userLiked) {
         left: 0;
         width: 100vw;
         height: 100vh;
-        background: rgba(0,0,0,0.8);
+        background: rgba(0,0,0,0.8); // фон сзади 
         display: flex;
         align-items: center;
         justify-content: center;
         z-index: 10000;
         cursor: zoom-out;
     `;
-    
-    // Проверяем является ли пользователь админом
-    let isAdmin = false;
-    if (currentUser) {
-        try {
-            const response = await fetch(`/api/is_admin/${currentUser.id}`);
-            const result = await response.json();
-            isAdmin = result.is_admin;
-        } catch (error) {
-            console.error('Admin check error:', error);
-        }
-    }
-    
+
+    // Роль админа пришла вместе с сессией - без запроса на каждое открытие
+    await sessionReady;
+    const isAdmin = Boolean(session && session.is_admin);
+
     modal.innerHTML = `
         <div style="max-width: 90vw; max-height: 90vh; position: relative;">
-            <img src="${photo.image_url}" 
+            <img src="${photo.image_url}?size=${MODAL_IMAGE_SIZE}" 
                  alt="Фото от @${photo.username}"
                  style="max-width: 90vw; max-height: 90vh; border-radius: 15px;">
             <div class="action-buttons">
@@ -127,7 +327,7 @@ async function showPhotoModal(photo, userLiked) {
 </div>
         </div>
     `;
-    
+
     modal.onclick = () => document.body.removeChild(modal);
     document.body.appendChild(modal);
 }
@@ -138,28 +338,22 @@ async function likePhoto(photoId, button) {
         alert('⚠️ Необходимо открыть через Telegram бота для лайков');
         return;
     }
-    
+
     try {
-        const response = await fetch('/api/like', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                photo_id: photoId,
-                user_id: currentUser.id,
-                username: currentUser.username || `user_${currentUser.id}`
-            })
-        });
-        
-        const result = await response.json();
-        
+        const result = await apiPost('/api/like', {photo_id: photoId});
+
         if (result.success) {
-            button.classList.toggle('liked');
+            button.classList.toggle('liked', result.liked);
+            if (result.liked) {
+                myLikes.add(photoId);
+            } else {
+                myLikes.delete(photoId);
+            }
             button.innerHTML = `❤️ ${result.new_likes}`;
-            loadGallery();
+            updatePhotoLikes(photoId, result.new_likes);
+            scheduleStatsLoad();
         } else {
-            alert('❌ ' + result.error);
+            alert('❌ ' + (result.error || result.detail));
         }
     } catch (error) {
         console.error('Like error:', error);
@@ -173,29 +367,19 @@ async function deletePhoto(photoId) {
         alert('⚠️ Необходимо открыть через Telegram бота');
         return;
     }
-    
+
     if (!confirm('🗑️ Удалить это фото?')) return;
-    
+
     try {
-        const response = await fetch('/api/delete_photo', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                photo_id: photoId,
-                user_id: currentUser.id
-            })
-        });
-        
-        const result = await response.json();
-        
+        const result = await apiPost('/api/delete_photo', {photo_id: photoId});
+
         if (result.success) {
             alert('✅ Фото удалено');
             document.body.removeChild(document.body.lastChild);
-            loadGallery();
+            removePhotoTile(photoId);
+            scheduleStatsLoad();
         } else {
-            alert('❌ ' + result.error);
+            alert('❌ ' + (result.error || result.detail));
         }
     } catch (error) {
         console.error('Delete error:', error);
@@ -203,17 +387,37 @@ async function deletePhoto(photoId) {
     }
 }
 
-// Навигация по стене (зум и перетаскивание)
+// Функция показа всей стены
+function showFullWall() {
+    const container = document.getElementById('wall-container');
+    const wall = document.getElementById('wall');
+
+    const containerWidth = container.clientWidth;
+    const containerHeight = container.clientHeight;
+    const wallWidth = wallSize;
+    const wallHeight = wallSize;
+
+    const scaleX = containerWidth / wallWidth;
+    const scaleY = containerHeight / wallHeight;
+    const minScale = Math.min(scaleX, scaleY) * 0.9;
+
+    wallScale = Math.max(minScale, 0.1);
+    updateWallScale();
+
+    container.scrollLeft = (wallWidth * wallScale - containerWidth) / 2;
+    container.scrollTop = (wallHeight * wallScale - containerHeight) / 2;
+}
+
+// Функции для навигации по стене
 function setupWallNavigation() {
     const container = document.getElementById('wall-container');
     const wall = document.getElementById('wall');
-    
+
     let isDragging = false;
     let startX, startY, scrollLeft, scrollTop;
     let initialDistance = null;
     let lastScale = wallScale;
 
-    // Обработчики мыши
     container.addEventListener('mousedown', (e) => {
         isDragging = true;
         startX = e.pageX - container.offsetLeft;
@@ -239,7 +443,6 @@ function setupWallNavigation() {
         container.scrollTop = scrollTop - walkY;
     });
 
-    // Обработчики тач-событий
     container.addEventListener('touchstart', (e) => {
         if (e.touches.length === 1) {
             isDragging = true;
@@ -272,13 +475,14 @@ function setupWallNavigation() {
             e.preventDefault();
             const currentDistance = getDistance(e.touches[0], e.touches[1]);
             const scaleChange = (currentDistance - initialDistance) * 0.001;
-            
+
             wallScale = Math.min(Math.max(0.3, lastScale + scaleChange), 3);
             updateWallScale();
         }
     });
 
-    // Обработчик колеса мыши для зума
+    container.addEventListener('scroll', scheduleViewportLoad);
+
     container.addEventListener('wheel', (e) => {
         e.preventDefault();
         const delta = -e.deltaY * 0.002;
@@ -287,7 +491,6 @@ function setupWallNavigation() {
     });
 }
 
-// Вспомогательные функции для навигации
 function getDistance(touch1, touch2) {
     return Math.sqrt(
         Math.pow(touch2.pageX - touch1.pageX, 2) +
@@ -295,7 +498,6 @@ function getDistance(touch1, touch2) {
     );
 }
 
-// Функции зума
 function zoomIn() {
     const targetScale = Math.min(wallScale + 0.2, 3);
     animateZoom(targetScale);
@@ -315,69 +517,48 @@ function resetZoom() {
     }, 300);
 }
 
-function showFullWall() {
-    const container = document.getElementById('wall-container');
-    const wall = document.getElementById('wall');
-    
-    const containerWidth = container.clientWidth;
-    const containerHeight = container.clientHeight;
-    const wallWidth = 2000;
-    const wallHeight = 2000;
-    
-    const scaleX = containerWidth / wallWidth;
-    const scaleY = containerHeight / wallHeight;
-    const minScale = Math.min(scaleX, scaleY) * 0.9;
-    
-    wallScale = Math.max(minScale, 0.1);
-    updateWallScale();
-    
-    container.scrollLeft = (wallWidth * wallScale - containerWidth) / 2;
-    container.scrollTop = (wallHeight * wallScale - containerHeight) / 2;
-}
-
-// Анимация зума
 function animateZoom(targetScale) {
     const wall = document.getElementById('wall');
     const startScale = wallScale;
     const duration = 300;
     const startTime = performance.now();
-    
+
     function animate(currentTime) {
         const elapsed = currentTime - startTime;
         const progress = Math.min(elapsed / duration, 1);
-        
+
         const easeProgress = 1 - Math.pow(1 - progress, 3);
         wallScale = startScale + (targetScale - startScale) * easeProgress;
         updateWallScale();
-        
+
         if (progress < 1) {
             requestAnimationFrame(animate);
         }
     }
-    
+
     requestAnimationFrame(animate);
 }
 
-// Обновление масштаба стены
 function updateWallScale() {
     const wall = document.getElementById('wall');
     wall.style.transform = `scale(${wallScale})`;
     wall.style.transformOrigin = '0 0';
-    
+
     const container = document.getElementById('wall-container');
     if (wallScale > 1) {
         container.style.cursor = 'grab';
     } else {
         container.style.cursor = 'default';
     }
+
+    scheduleViewportLoad();
 }
 
-// Инициализация при загрузке страницы
 document.addEventListener('DOMContentLoaded', function() {
+    sessionReady = startSession();
+    loadMyLikes().catch(error => console.error('My likes error:', error));
     loadGallery();
     setupWallNavigation();
+    connectEvents();
     setTimeout(() => resetZoom(), 100);
 });
-
-// Автообновление галереи каждые 30 секунд
-setInterval(loadGallery, 3000000);